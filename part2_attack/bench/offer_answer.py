@@ -0,0 +1,190 @@
+"""
+offer_answer.py
+
+Offer-to-answer latency benchmark for interceptor_webrtc.handle_offer_and_media().
+
+Each iteration:
+  1. A "caller" connection (client-a) and the interceptor connection
+     (registered as the victim, client-b) connect to an in-process
+     SignalingServer on an ephemeral port.
+  2. The caller sends a recorded offer (taken from ws-proxy/proxy.log by
+     default) to the victim.
+  3. The interceptor connection receives it through a SignalingClient
+     and hands it to handle_offer_and_media(), which fills in OfferTimings
+     per phase.
+  4. The caller waits for the answer (end-to-end time), then the
+     interceptor connection is closed so the handler cleans up.
+
+With --mode warm the RTCPeerConnection + MediaRecorder are built with
+create_peer() before the offer is sent (as --warm does while waiting for
+the offer) and handed to the handler; metrics are prefixed with "warm.".
+--mode both runs cold and warm back to back and reports the reduction.
+
+No STUN/TURN servers are configured, so the run is fully offline and ICE
+gathering only collects host candidates.
+
+Usage (from part2_attack/):
+
+    python -m bench.offer_answer
+    python -m bench.offer_answer --update-baseline
+    python -m bench.offer_answer --offers-from attacker/attacker.log
+    python -m bench.offer_answer --mode both
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import websockets
+
+PART2_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PART2_DIR))
+sys.path.insert(0, str(PART2_DIR / "webrtc_media"))
+
+from bench import baseline  # noqa: E402
+from common.logindex import LogIndex  # noqa: E402
+from common.signaling_client import SignalingClient  # noqa: E402
+from common.signaling_server import SignalingServer  # noqa: E402
+import interceptor_webrtc  # noqa: E402
+from interceptor_webrtc import AttackConfig, OfferTimings, create_peer  # noqa: E402
+
+DEFAULT_OFFERS = PART2_DIR.parent / "ws-proxy" / "proxy.log"
+
+CALLER_ID = "client-a"
+VICTIM_ID = "client-b"
+
+
+def load_offers(path: Path) -> List[str]:
+    """
+    Return the distinct offer SDPs found in a capture file.
+    """
+    index = LogIndex.open(str(path), save=False)
+    sdps: List[str] = []
+    for raw in index.iter_raw(index.query(msg_type="offer")):
+        try:
+            sdp = json.loads(raw).get("sdp")
+        except ValueError:
+            continue
+        if sdp and sdp not in sdps:
+            sdps.append(sdp)
+    return sdps
+
+
+async def register(url: str, client_id: str):
+    ws = await websockets.connect(url)
+    await ws.send(json.dumps({"type": "register", "clientId": client_id}))
+    await ws.recv()
+    return ws
+
+
+async def run_once(url: str, sdp: str, cfg: AttackConfig, warm: bool) -> Dict[str, float]:
+    caller = await register(url, CALLER_ID)
+    victim = await register(url, VICTIM_ID)
+    peer = create_peer(cfg) if warm else None
+    try:
+        await caller.send(json.dumps({"to": VICTIM_ID, "type": "offer", "sdp": sdp}))
+        t0 = time.perf_counter()
+
+        signaling = SignalingClient(victim)
+        signaling.start()
+        offer = await signaling.recv("offer")
+        timings = OfferTimings()
+        handler = asyncio.create_task(
+            interceptor_webrtc.handle_offer_and_media(signaling, cfg, offer, timings, peer=peer)
+        )
+
+        while True:
+            msg = json.loads(await caller.recv())
+            if msg.get("type") == "answer":
+                break
+        end_to_end = time.perf_counter() - t0
+
+        await victim.close()
+        await handler
+        await signaling.close()
+    finally:
+        await victim.close()
+        await caller.close()
+
+    sample = {name: getattr(timings, name) for name in OfferTimings.PHASES}
+    sample["end_to_end"] = end_to_end
+    if warm:
+        sample["prepare"] = timings.warm_prepare
+    return sample
+
+
+async def run_benchmark(sdps: List[str], iterations: int, warmup: int,
+                        warm: bool) -> Dict[str, List[float]]:
+    samples: Dict[str, List[float]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = AttackConfig(
+            server_url="",
+            victim_id=VICTIM_ID,
+            display_name=None,
+            output_file=Path(tmp) / "bench.webm",
+            ice_servers=[],
+        )
+        async with SignalingServer() as server:
+            cfg.server_url = server.url
+            for i in range(warmup + iterations):
+                sample = await run_once(server.url, sdps[i % len(sdps)], cfg, warm)
+                if i < warmup:
+                    continue
+                for name, value in sample.items():
+                    key = f"warm.{name}" if warm else name
+                    samples.setdefault(key, []).append(value)
+    return samples
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench.offer_answer",
+        description="Measure offer-to-answer latency of handle_offer_and_media() offline.",
+    )
+    parser.add_argument("--offers-from", type=Path, default=DEFAULT_OFFERS,
+                        help="Capture file to take offer SDPs from (default: ws-proxy/proxy.log)")
+    parser.add_argument("--iterations", type=int, default=100, help="Measured iterations (default: 100)")
+    parser.add_argument("--warmup", type=int, default=3, help="Unmeasured warm-up iterations (default: 3)")
+    parser.add_argument("--mode", choices=("cold", "warm", "both"), default="cold",
+                        help="Build the peer after the offer (cold), before it (warm), "
+                             "or compare both (default: cold)")
+    baseline.add_arguments(parser, "offer_answer")
+    args = parser.parse_args(argv)
+
+    sdps = load_offers(args.offers_from)
+    if not sdps:
+        print(f"[!] No offers found in {args.offers_from}")
+        return 2
+    print(f"[*] {len(sdps)} distinct offer(s) from {args.offers_from}; "
+          f"{args.warmup} warm-up + {args.iterations} measured iteration(s).")
+
+    # handle_offer_and_media() logs every step to stdout; keep the report readable.
+    samples: Dict[str, List[float]] = {}
+    modes = [False, True] if args.mode == "both" else [args.mode == "warm"]
+    for warm in modes:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            samples.update(asyncio.run(
+                run_benchmark(sdps, args.iterations, args.warmup, warm)
+            ))
+
+    results = {name: baseline.percentiles_ms(values) for name, values in samples.items()}
+    status = baseline.check(args, results)
+
+    if args.mode == "both":
+        for name in ("total", "end_to_end"):
+            cold_p50 = results[name]["p50"]
+            warm_p50 = results[f"warm.{name}"]["p50"]
+            print(f"[*] Warm mode {name} p50: {warm_p50:.2f}ms vs {cold_p50:.2f}ms cold "
+                  f"({cold_p50 - warm_p50:+.2f}ms saved)")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,468 @@
+"""
+replay.py
+
+Time-accelerated replay of captured signaling sessions, for regression and
+load testing of the signaling server and interceptor_webrtc.py.
+
+A capture (attacker.log, proxy.log, a JSONL capture or a binary trace from
+common/trace.py) is turned into a session: the client ids that took part
+and the routed messages ("offer", "answer", "ice", ... -- anything with a
+"to") each of them sent, with their time offsets. A replay then:
+
+  1. Opens one connection per client id and registers it (not timed).
+  2. Sends every message from its sender's connection, in capture order,
+     at its original offset divided by --speed (--speed 0: back to back).
+  3. Waits until every message has been delivered to its recipient (or
+     answered with "target-unavailable"), at most --drain-timeout seconds.
+
+Routing latency is the time from handing a message to the sender's socket
+until the recipient reads it. Deliveries are matched to sends in FIFO
+order per (sender, recipient) pair, which the server preserves, so
+payloads are replayed unchanged apart from client ids.
+
+Which frames are replayed:
+
+  - If the capture has routed client-to-server frames (proxy.log, a trace
+    or capture of all clients), those. The sender is the id registered on
+    the frame's connection (traces), the frame's "from", or -- for text
+    logs, which carry no connection ids -- the other client when exactly
+    two registered.
+  - Otherwise (attacker.log and other single-client captures), the routed
+    frames the client received, sent again from their "from".
+
+With --replays N > 1, each replay suffixes its client ids ("client-a.3")
+so that concurrent replays do not take over each other's registrations.
+--skip-client leaves an id to an outside process, e.g. interceptor_webrtc.py
+registered as the victim: it is not registered or renamed, messages it sent
+in the capture are not replayed, and messages to it are sent but their
+delivery cannot be observed.
+
+The in-process server (the default) shares the event loop with the
+replaying clients; pass --server-url to measure a separately running
+server (or server.js) on its own.
+
+Usage (from part2_attack/):
+
+    python -m bench.replay
+    python -m bench.replay attacker/attacker.log --speed 10
+    python -m bench.replay capture.trace --replays 200 --concurrency 20
+    python -m bench.replay --server-url ws://localhost:8080 --skip-client client-b --speed 1
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import websockets
+
+PART2_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PART2_DIR))
+
+from bench import baseline  # noqa: E402
+from common import codec, trace  # noqa: E402
+from common.logindex import LogIndex  # noqa: E402
+from common.signaling_server import SignalingServer  # noqa: E402
+
+DEFAULT_CAPTURE = PART2_DIR.parent / "ws-proxy" / "proxy.log"
+
+# Replies of the server itself, never replayed.
+SERVER_TYPES = ("registered", "error")
+
+_SEPARATORS = (",", ":")
+
+
+# ---------------------------------------------------------------------------
+# Loading a session
+# ---------------------------------------------------------------------------
+
+@dataclass
+class ReplayMessage:
+    """
+    Attributes:
+        offset : Seconds since the first replayed message
+        sender : Client id that sends it
+        to     : Client id it is routed to
+        body   : The message without "from" (the server fills it in)
+    """
+    offset: float
+    sender: str
+    to: str
+    body: dict
+
+
+@dataclass
+class Session:
+    """
+    Attributes:
+        source   : Capture file the session was loaded from
+        clients  : Client ids taking part, in order of appearance
+        messages : Routed messages in capture order
+        timed    : False if the capture has no timestamps (all offsets 0)
+        dropped  : Routed frames left out because their sender is unknown
+    """
+    source: str
+    clients: List[str] = field(default_factory=list)
+    messages: List[ReplayMessage] = field(default_factory=list)
+    timed: bool = False
+    dropped: int = 0
+
+    @property
+    def duration(self) -> float:
+        return self.messages[-1].offset if self.messages else 0.0
+
+
+def _is_trace(path: Path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(trace.MAGIC)) == trace.MAGIC
+
+
+def _records(path: Path) -> Iterator[Tuple[Optional[float], str, Optional[int], bytes]]:
+    """
+    Yield (time in seconds or None, direction, connection or None, payload).
+    """
+    if _is_trace(path):
+        with trace.TraceReader(str(path)) as reader:
+            for frame in reader.frames():
+                yield frame.t_ns / 1e9, frame.direction, frame.connection, bytes(frame.payload)
+                frame.payload.release()
+        return
+    index = LogIndex.open(str(path), save=False)
+    entries = range(len(index))
+    for n, raw in zip(entries, index.iter_raw(entries)):
+        yield index.ts[n], index.direction[n], None, raw
+
+
+def load_session(path: Path) -> Session:
+    session = Session(source=str(path))
+    registered: Dict[Optional[int], str] = {}
+    sent: List[Tuple[Optional[float], Optional[int], dict]] = []
+    received: List[Tuple[Optional[float], dict]] = []
+
+    def add_client(client_id: str) -> None:
+        if client_id not in session.clients:
+            session.clients.append(client_id)
+
+    for t, direction, conn, raw in _records(path):
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            continue
+        if not isinstance(msg, dict) or msg.get("type") in SERVER_TYPES:
+            continue
+        if direction == "C → S" and msg.get("type") == "register":
+            if isinstance(msg.get("clientId"), str):
+                add_client(msg["clientId"])
+                if conn is not None:
+                    registered[conn] = msg["clientId"]
+            continue
+        if not isinstance(msg.get("to"), str):
+            continue
+        if direction == "C → S":
+            sent.append((t, conn, msg))
+        elif isinstance(msg.get("from"), str):
+            received.append((t, msg))
+
+    routed = []
+    if sent:
+        for t, conn, msg in sent:
+            sender = registered.get(conn) or msg.get("from")
+            if not sender:
+                others = [c for c in session.clients if c != msg["to"]]
+                sender = others[0] if len(session.clients) == 2 and len(others) == 1 else None
+            if not isinstance(sender, str):
+                session.dropped += 1
+                continue
+            routed.append((t, sender, msg))
+    else:
+        routed = [(t, msg["from"], msg) for t, msg in received]
+
+    times = [t for t, _, _ in routed if t is not None]
+    session.timed = bool(times) and times[-1] > times[0]
+    first = times[0] if times else 0.0
+    last = first
+    for t, sender, msg in routed:
+        if t is not None:
+            last = max(last, t)
+        body = {k: v for k, v in msg.items() if k != "from"}
+        add_client(sender)
+        add_client(msg["to"])
+        session.messages.append(ReplayMessage(last - first, sender, msg["to"], body))
+    return session
+
+
+# ---------------------------------------------------------------------------
+# Replaying
+# ---------------------------------------------------------------------------
+
+@dataclass
+class ReplayResult:
+    """
+    Attributes:
+        sent       : Messages sent
+        delivered  : Messages read by their recipient
+        errors     : "error" replies (e.g. target-unavailable)
+        lost       : Messages neither delivered nor answered with an error
+                     when the drain timeout expired
+        unobserved : Messages sent to --skip-client ids
+        duration   : First send until the last delivery (seconds)
+        latencies  : Routing latency of each delivery (seconds)
+    """
+    sent: int = 0
+    delivered: int = 0
+    errors: int = 0
+    lost: int = 0
+    unobserved: int = 0
+    duration: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+
+
+class Replay:
+    """
+    One replay of a session.
+
+    Parameters
+    ----------
+    session : Session
+        What to replay.
+
+    url : str
+        Signaling server URL.
+
+    speed : float
+        Offsets are divided by this; 0 sends as fast as possible.
+
+    suffix : str
+        Appended to every client id except the skipped ones.
+
+    skip : Sequence[str]
+        Client ids played by an outside process.
+
+    token : Optional[str]
+        Token added to register messages (secure servers).
+
+    drain_timeout : float
+        Seconds to wait for outstanding deliveries after the last send.
+    """
+
+    def __init__(self, session: Session, url: str, speed: float = 0.0, suffix: str = "",
+                 skip: Sequence[str] = (), token: Optional[str] = None,
+                 drain_timeout: float = 5.0) -> None:
+        self.url = url
+        self.speed = speed
+        self.token = token
+        self.drain_timeout = drain_timeout
+        self.result = ReplayResult()
+
+        self.ids = {c: c if c in skip else c + suffix for c in session.clients}
+        self.local = [self.ids[c] for c in session.clients if c not in skip]
+        # (due, sender, recipient, text): serialized up front, outside the timed part.
+        self.schedule: List[Tuple[float, str, str, str]] = []
+        for m in session.messages:
+            if m.sender in skip:
+                continue
+            body = dict(m.body, to=self.ids[m.to])
+            due = m.offset / speed if speed > 0 else 0.0
+            self.schedule.append((due, self.ids[m.sender], self.ids[m.to],
+                                  json.dumps(body, separators=_SEPARATORS, ensure_ascii=False)))
+
+        self.__pending: Dict[Tuple[str, str], Deque[float]] = collections.defaultdict(collections.deque)
+        self.__outstanding = 0
+        self.__sending = True
+        self.__drained = asyncio.Event()
+        self.__t0 = 0.0
+        self.__last = 0.0
+
+    async def run(self) -> ReplayResult:
+        conns: Dict[str, object] = {}
+        readers = []
+        try:
+            for client_id in self.local:
+                conns[client_id] = await self.__register(client_id)
+            readers = [asyncio.create_task(self.__read(cid, ws)) for cid, ws in conns.items()]
+
+            self.__t0 = self.__last = time.perf_counter()
+            for due, sender, to, text in self.schedule:
+                delay = self.__t0 + due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if to in conns:
+                    self.__pending[(sender, to)].append(time.perf_counter())
+                    self.__outstanding += 1
+                else:
+                    self.result.unobserved += 1
+                await conns[sender].send(text)
+                self.result.sent += 1
+
+            self.__sending = False
+            self.__check_drained()
+            try:
+                await asyncio.wait_for(self.__drained.wait(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.result.lost = self.__outstanding
+            self.result.duration = self.__last - self.__t0
+        finally:
+            for task in readers:
+                task.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+            await asyncio.gather(*(ws.close() for ws in conns.values()), return_exceptions=True)
+        return self.result
+
+    async def __register(self, client_id: str):
+        ws = await websockets.connect(self.url, max_size=None)
+        msg = {"type": "register", "clientId": client_id}
+        if self.token is not None:
+            msg["token"] = self.token
+        await ws.send(json.dumps(msg))
+        reply = json.loads(await ws.recv())
+        if reply.get("type") != "registered":
+            await ws.close()
+            raise RuntimeError(f"Registering {client_id!r} failed: {reply}")
+        return ws
+
+    async def __read(self, client_id: str, ws) -> None:
+        try:
+            async for raw in ws:
+                now = time.perf_counter()
+                frame = codec.decode(raw)
+                if frame is None:
+                    continue
+                if frame.type == "error":
+                    # Replies go to the sender; "to" names the missing target.
+                    self.result.errors += 1
+                    self.__settle((client_id, frame.to))
+                elif frame.to == client_id:
+                    sent_at = self.__settle((frame.from_, client_id))
+                    if sent_at is not None:
+                        self.result.delivered += 1
+                        self.result.latencies.append(now - sent_at)
+                        self.__last = max(self.__last, now)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def __settle(self, key: Tuple[Optional[str], Optional[str]]) -> Optional[float]:
+        queue = self.__pending.get(key)
+        if not queue:
+            return None
+        self.__outstanding -= 1
+        self.__check_drained()
+        return queue.popleft()
+
+    def __check_drained(self) -> None:
+        if not self.__sending and self.__outstanding == 0:
+            self.__drained.set()
+
+
+async def run_replays(session: Session, url: str, count: int, concurrency: int,
+                      **options) -> Tuple[List[ReplayResult], float]:
+    """
+    Run `count` replays, at most `concurrency` at a time. Returns the
+    results and the wall-clock time of the whole run.
+    """
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(k: int) -> ReplayResult:
+        async with limit:
+            return await Replay(session, url, suffix=f".{k}" if count > 1 else "",
+                                **options).run()
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(one(k) for k in range(count)))
+    return list(results), time.perf_counter() - t0
+
+
+# ---------------------------------------------------------------------------
+# Command-line interface
+# ---------------------------------------------------------------------------
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench.replay",
+        description="Replay a captured signaling session against a signaling server.",
+    )
+    parser.add_argument("capture", nargs="?", type=Path, default=DEFAULT_CAPTURE,
+                        help="attacker.log, proxy.log, a JSONL capture or a trace "
+                             "(default: ws-proxy/proxy.log)")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="Timing: 1 = original, 10 = ten times faster, "
+                             "0 = as fast as possible (default: 0)")
+    parser.add_argument("--replays", type=int, default=10, help="Number of replays (default: 10)")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Replays running at the same time (default: 1)")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="Unmeasured replays run first (default: 1)")
+    parser.add_argument("--server-url",
+                        help="Replay against this server instead of an in-process one")
+    parser.add_argument("--token", help="Token for register messages (secure servers)")
+    parser.add_argument("--skip-client", action="append", default=[], metavar="ID",
+                        help="Client id played by another process (repeatable)")
+    parser.add_argument("--drain-timeout", type=float, default=5.0,
+                        help="Seconds to wait for deliveries after the last send (default: 5)")
+    parser.add_argument("--server-stats", action="store_true",
+                        help="Print the in-process server's per-route stats")
+    baseline.add_arguments(parser, "replay")
+    args = parser.parse_args(argv)
+
+    session = load_session(args.capture)
+    if not session.messages:
+        print(f"[!] No routed messages found in {args.capture}")
+        return 2
+    print(f"[*] {len(session.messages)} message(s) between {', '.join(session.clients)} "
+          f"from {args.capture}, spanning {session.duration:.3f}s"
+          + (f"; {session.dropped} with unknown sender dropped" if session.dropped else "") + ".")
+    if not session.timed and args.speed > 0:
+        print("[*] The capture has no timestamps; messages are sent back to back.")
+
+    options = dict(speed=args.speed, skip=args.skip_client, token=args.token,
+                   drain_timeout=args.drain_timeout)
+
+    async def run() -> Tuple[List[ReplayResult], float]:
+        server = None
+        url = args.server_url
+        if url is None:
+            server = await SignalingServer().start()
+            url = server.url
+        try:
+            if args.warmup:
+                await run_replays(session, url, args.warmup, args.concurrency, **options)
+            return await run_replays(session, url, args.replays, args.concurrency, **options)
+        finally:
+            if server is not None:
+                if args.server_stats:
+                    print(server.format_stats())
+                await server.stop()
+
+    results, wall = asyncio.run(run())
+
+    latencies = [x for r in results for x in r.latencies]
+    durations = [r.duration for r in results]
+    sent = sum(r.sent for r in results)
+    delivered = sum(r.delivered for r in results)
+    lost = sum(r.lost for r in results)
+    errors = sum(r.errors for r in results)
+    unobserved = sum(r.unobserved for r in results)
+
+    print(f"[*] {len(results)} replay(s), {args.concurrency} at a time, in {wall:.3f}s: "
+          f"sent={sent} delivered={delivered} errors={errors} lost={lost}"
+          + (f" unobserved={unobserved}" if unobserved else ""))
+    print(f"[*] Throughput: {sent / wall:.0f} msg/s sent, {delivered / wall:.0f} msg/s delivered")
+
+    status = 0
+    if latencies:
+        results_ms = {"route_latency": baseline.percentiles_ms(latencies),
+                      "replay_duration": baseline.percentiles_ms(durations)}
+        status = baseline.check(args, results_ms)
+    if lost or errors:
+        print(f"[!] {lost} message(s) lost and {errors} error reply(ies).")
+        status = status or 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+startup.py
+
+Startup-time benchmark and budget for the command-line tools.
+
+Each iteration starts a fresh interpreter (so nothing is cached in
+sys.modules) and measures the wall time until it exits:
+
+  interpreter      python -c pass (the floor every tool pays)
+  interceptor      webrtc_media/interceptor_webrtc.py --help
+  attacker         attacker/attacker.py --help
+  media_stack      import interceptor_webrtc and load_media_stack(), i.e.
+                   what the first offer costs if the background preload
+                   has not finished yet
+
+--help parses the arguments and exits, so it covers everything a tool does
+before it can start connecting. Results go through bench/baseline.py like
+the other benchmarks (bench/baselines/startup.json); in addition,
+--budget-ms (default 200) fails the run when the p50 of a --help command
+exceeds an absolute budget, which also holds on machines without a
+recorded baseline, and a structural check
+fails it when importing interceptor_webrtc pulls in the media stack again
+(aiortc, av, numpy) instead of leaving it to load_media_stack().
+
+Usage (from part2_attack/):
+
+    python -m bench.startup
+    python -m bench.startup --iterations 50 --budget-ms 250
+    python -m bench.startup --budget-ms 0          # baseline check only
+    python -m bench.startup --update-baseline
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+PART2_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PART2_DIR))
+
+from bench import baseline  # noqa: E402
+
+MEDIA_DIR = PART2_DIR / "webrtc_media"
+
+# name -> (argv after the interpreter, working directory)
+COMMANDS: Dict[str, tuple] = {
+    "interpreter": (["-c", "pass"], PART2_DIR),
+    "interceptor": ([str(MEDIA_DIR / "interceptor_webrtc.py"), "--help"], PART2_DIR),
+    "attacker": ([str(PART2_DIR / "attacker" / "attacker.py"), "--help"], PART2_DIR),
+    "media_stack": (["-c", "import interceptor_webrtc as m; m.load_media_stack()"], MEDIA_DIR),
+}
+
+# Commands held to --budget-ms.
+BUDGETED = ("interceptor", "attacker")
+
+# Startup budget in ms for the --help commands. Measured on the build
+# sandbox that recorded bench/baselines/startup.json (30 runs): p50 of
+# interceptor --help 122 ms, attacker --help 75 ms, and ~277 ms for
+# interceptor --help with the media stack imported at module level. 200 ms
+# leaves ~60% headroom over the slower tool and still fails that
+# regression. Lower it if the lab box is faster.
+DEFAULT_BUDGET_MS = 200.0
+
+# Modules interceptor_webrtc must not import at module level.
+HEAVY_MODULES = ("aiortc", "av", "numpy")
+
+HEAVY_CHECK = (
+    "import sys, interceptor_webrtc; "
+    f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+)
+
+
+def time_command(args: Sequence[str], cwd: Path) -> float:
+    """
+    Run the interpreter with `args` once; return the wall time in seconds.
+    """
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=cwd, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+
+def heavy_imports() -> List[str]:
+    """
+    Return the HEAVY_MODULES that importing interceptor_webrtc loads.
+    """
+    out = subprocess.run([sys.executable, "-c", HEAVY_CHECK], cwd=MEDIA_DIR,
+                         check=True, capture_output=True, text=True)
+    return out.stdout.split()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench.startup",
+        description="Measure command-line startup time and enforce a startup budget.",
+    )
+    parser.add_argument("--iterations", type=int, default=30,
+                        help="Measured runs per command (default: 30)")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="Unmeasured runs per command, to warm the OS file cache (default: 1)")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Fail if the p50 of a --help command exceeds this many ms "
+                             f"({', '.join(BUDGETED)}; default: {DEFAULT_BUDGET_MS:g}, 0 = no budget)")
+    baseline.add_arguments(parser, "startup")
+    args = parser.parse_args(argv)
+
+    print(f"[*] {args.warmup} warm-up + {args.iterations} measured run(s) per command.")
+    samples: Dict[str, List[float]] = {}
+    for name, (command, cwd) in COMMANDS.items():
+        for _ in range(args.warmup):
+            time_command(command, cwd)
+        samples[name] = [time_command(command, cwd) for _ in range(args.iterations)]
+
+    results = {name: baseline.percentiles_ms(values) for name, values in samples.items()}
+    status = baseline.check(args, results)
+
+    floor = results["interpreter"]["p50"]
+    for name in BUDGETED:
+        print(f"[*] {name} --help p50: {results[name]['p50']:.1f}ms "
+              f"({results[name]['p50'] - floor:.1f}ms above the bare interpreter)")
+
+    if args.budget_ms:
+        over = [name for name in BUDGETED if results[name]["p50"] > args.budget_ms]
+        if over:
+            for name in over:
+                print(f"[!] {name} --help p50 {results[name]['p50']:.1f}ms is over "
+                      f"the {args.budget_ms:.1f}ms budget")
+            status = 1
+        else:
+            print(f"[+] Within the {args.budget_ms:.1f}ms startup budget.")
+
+    heavy = heavy_imports()
+    if heavy:
+        print(f"[!] Importing interceptor_webrtc loads {', '.join(heavy)} at startup; "
+              "the media stack must only be imported by load_media_stack().")
+        status = 1
+    else:
+        print("[+] interceptor_webrtc imports no media modules at startup.")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+"""
+common
+
+Helpers shared by the Part 2 attack tools (attacker/attacker.py and
+webrtc_media/interceptor_webrtc.py).
+
+The scripts are executed directly from their own directories, so each of
+them prepends the part2_attack/ directory to sys.path before importing
+from this package. Offline helpers with a command-line interface can be
+run from part2_attack/ with "python -m common.<module>".
+"""
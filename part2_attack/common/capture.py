@@ -0,0 +1,216 @@
+"""
+capture.py
+
+Compact JSONL capture format for signaling traffic, plus an offline
+renderer that produces the familiar human-readable view on demand.
+
+The text log written by attacker.py stores every frame three times (the raw
+line, then a json.loads + json.dumps(indent=2) pretty copy), so multi-KB SDP
+bodies are parsed and serialized twice on the hot path. In JSONL mode each
+frame becomes exactly one compact record and no JSON decoding happens while
+capturing:
+
+    {"kind":"session","t":12.5,"wall":"2025-11-20T23:11:14.000000Z","tool":"attacker"}
+    {"kind":"frame","t":12.7,"dir":"S → C","len":43,"raw":"{\"type\":\"registered\",...}"}
+    {"kind":"note","t":12.7,"msg":"[+] Connected to signaling server."}
+
+  - "t" is time.monotonic() in seconds. The "session" record pairs one
+    monotonic reading with the wall clock so the renderer can convert.
+  - "len" is the payload size in bytes.
+  - Binary frames are stored base64-encoded in "raw_b64" instead of "raw".
+
+Rendering (run from part2_attack/):
+
+    python -m common.capture render attacker/attacker.jsonl
+    python -m common.capture render attacker/attacker.jsonl -o attacker_pretty.log
+"""
+
+import argparse
+import base64
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, Optional, TextIO, Union
+
+# Accepted values for the --capture-format command-line options ("trace" is
+# the binary format of common/trace.py).
+CAPTURE_FORMATS = ("text", "jsonl", "trace")
+
+# Record kinds.
+KIND_SESSION = "session"
+KIND_FRAME = "frame"
+KIND_NOTE = "note"
+
+# Compact separators: the capture file should be as small as possible.
+_SEPARATORS = (",", ":")
+
+
+def session_record(tool: str) -> str:
+    """
+    Return the header record that anchors monotonic timestamps to UTC.
+    """
+    wall = datetime.now(timezone.utc).isoformat(timespec="microseconds").replace("+00:00", "Z")
+    return json.dumps(
+        {"kind": KIND_SESSION, "t": time.monotonic(), "wall": wall, "tool": tool},
+        ensure_ascii=False, separators=_SEPARATORS,
+    )
+
+
+def frame_record(direction: str, payload: Union[str, bytes], t: Optional[float] = None) -> str:
+    """
+    Return one compact record for a websocket frame.
+
+    Parameters
+    ----------
+    direction : str
+        "S → C" for received frames, "C → S" for sent frames.
+
+    payload : str or bytes
+        The frame exactly as received from / passed to the websocket.
+        It is stored once and never decoded as JSON here.
+
+    t : Optional[float]
+        Monotonic timestamp; defaults to now.
+    """
+    record: Dict[str, object] = {
+        "kind": KIND_FRAME,
+        "t": time.monotonic() if t is None else t,
+        "dir": direction,
+    }
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        data = bytes(payload)
+        record["len"] = len(data)
+        record["raw_b64"] = base64.b64encode(data).decode("ascii")
+    else:
+        record["len"] = len(payload.encode("utf-8"))
+        record["raw"] = payload
+    return json.dumps(record, ensure_ascii=False, separators=_SEPARATORS)
+
+
+def note_record(message: str, t: Optional[float] = None) -> str:
+    """
+    Return a record for a status line (connection events, errors, ...).
+    """
+    return json.dumps(
+        {"kind": KIND_NOTE, "t": time.monotonic() if t is None else t, "msg": message},
+        ensure_ascii=False, separators=_SEPARATORS,
+    )
+
+
+def frame_payload(record: dict) -> Union[str, bytes]:
+    """
+    Return the original payload of a decoded "frame" record.
+    """
+    if "raw_b64" in record:
+        return base64.b64decode(record["raw_b64"])
+    return record.get("raw", "")
+
+
+def iter_records(lines: Iterable[str]) -> Iterator[dict]:
+    """
+    Decode capture records, skipping blank or corrupt lines (for example a
+    truncated last line after a crash).
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(record, dict):
+            yield record
+
+
+# ---------------------------------------------------------------------------
+# Offline rendering
+# ---------------------------------------------------------------------------
+
+def render(lines: Iterable[str], out: TextIO) -> int:
+    """
+    Write the human-readable view of a JSONL capture to `out`.
+
+    The output mirrors the text format of attacker.log: a timestamped raw
+    line per frame followed by the pretty-printed JSON body. Returns the
+    number of frames rendered.
+    """
+    anchor_t: Optional[float] = None
+    anchor_wall: Optional[datetime] = None
+    frames = 0
+
+    def stamp(t: float) -> str:
+        if anchor_t is None or anchor_wall is None:
+            return f"+{t:.3f}s"
+        wall = anchor_wall + timedelta(seconds=t - anchor_t)
+        return wall.isoformat(timespec="seconds").replace("+00:00", "Z")
+
+    for record in iter_records(lines):
+        kind = record.get("kind")
+        t = float(record.get("t", 0.0))
+
+        if kind == KIND_SESSION:
+            anchor_t = t
+            anchor_wall = datetime.fromisoformat(record["wall"].replace("Z", "+00:00"))
+            out.write(f"[{stamp(t)}] [*] Capture session started "
+                      f"(tool={record.get('tool', '?')})\n")
+
+        elif kind == KIND_NOTE:
+            out.write(f"[{stamp(t)}] {record.get('msg', '')}\n")
+
+        elif kind == KIND_FRAME:
+            frames += 1
+            direction = record.get("dir", "?")
+            payload = frame_payload(record)
+            if isinstance(payload, bytes):
+                out.write(f"[{stamp(t)}] [{direction}] Binary message "
+                          f"({record.get('len', len(payload))} bytes): {payload!r}\n")
+                continue
+
+            out.write(f"[{stamp(t)}] [{direction}] Raw message: {payload}\n")
+            try:
+                data = json.loads(payload)
+            except json.JSONDecodeError:
+                out.write(f"[{stamp(t)}] [{direction}] Failed to parse message "
+                          f"as JSON (non-JSON payload).\n")
+                continue
+            pretty = json.dumps(data, indent=2, sort_keys=True, ensure_ascii=False)
+            out.write(f"[{stamp(t)}] [{direction}] JSON message (pretty-printed):\n"
+                      f"{pretty}\n")
+
+    return frames
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m common.capture",
+        description="Offline tools for JSONL signaling captures.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_render = sub.add_parser(
+        "render", help="Produce the human-readable (pretty-printed) view of a capture."
+    )
+    p_render.add_argument("capture", help="Path of a .jsonl capture file.")
+    p_render.add_argument(
+        "-o", "--output", default="-",
+        help="Output file for the rendered text. Default: '-' (stdout).",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "render":
+        with open(args.capture, "r", encoding="utf-8") as f:
+            if args.output == "-":
+                frames = render(f, sys.stdout)
+            else:
+                with open(args.output, "w", encoding="utf-8") as out:
+                    frames = render(f, out)
+        print(f"[*] Rendered {frames} frame(s) from {args.capture!r}.", file=sys.stderr)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+codec.py
+
+Header-first decoding of signaling frames.
+
+Every frame is a JSON object whose routing fields ("type", "to") are short
+strings, while the rest can be a multi-kilobyte SDP or an ICE candidate.
+Frames addressed to somebody else, or of a type nobody handles, need only
+those two fields.
+
+What this saves depends on the traffic. Reading the routing fields costs
+about half of a full json.loads(), and a frame that is kept is decoded
+fully as well. bench.codec on the sample capture (ws-proxy/proxy.log):
+
+  - Routing fields only, body never decoded (common/regwatch.py watching
+    a server's log): about 2.1x faster than json.loads().
+  - Most frames addressed to other clients (--victim-id nobody): about
+    1.85x faster.
+  - Nearly every frame kept (--victim-id client-b): about 0.9x, i.e.
+    slower. This is the interceptor's case, since the signaling server
+    forwards a frame only to its addressee. SignalingClient and
+    bench/replay.py therefore use decode(), which decodes every frame
+    once.
+
+peek(raw) extracts "type" and "to" with a regex and leaves the body alone:
+
+  - Clients build frames as {"to": ..., "type": ..., <body>} (and the
+    server's replies start with "type"), so one anchored match on the start
+    of the frame usually finds both fields without looking at the body.
+  - Otherwise the keys are searched for and accepted only if nothing that
+    opens or closes a nested value comes before them, i.e. they are
+    top-level keys. Anything unusual (a backslash before the fields, keys
+    inside nested objects) falls back to a full json.loads(), so the fields agree
+    with the decoded message. The one exception is a key that appears twice
+    at the top level: peek() may report the first value where json.loads()
+    keeps the last.
+
+The body is decoded when Frame.body is first accessed, and so is "from":
+the server appends it at the end of a forwarded frame, behind the body, so
+reading it costs as much as decoding the frame.
+
+Frames can be str or bytes (binary websocket frames); bytes are matched as
+they are and json.loads() accepts them directly, so they are never copied
+into a str.
+
+    frame = peek(raw)
+    if frame is None:                      # not a JSON object
+        ...
+    elif frame.to == victim_id:
+        handle(frame.body)                 # decoded here, once
+
+Benchmark (from part2_attack/): python -m bench.codec
+"""
+
+import json
+import re
+from typing import Optional, Union
+
+Raw = Union[str, bytes]
+
+_WS = r"[ \t\r\n]*"
+_KEY = r'"(type|to)"' + _WS + ":" + _WS
+_PLAIN = r'"([^"\\]*)"'
+
+
+class _Syntax:
+    """
+    Patterns for one frame type (str or bytes).
+    """
+
+    def __init__(self, conv) -> None:
+        # {"to": "...", "type": "..."  -- both fields at the very start.
+        self.lead = re.compile(conv(
+            _WS + r"\{" + _WS + _KEY + _PLAIN + _WS + "," + _WS + _KEY + _PLAIN
+        ))
+        self.open = re.compile(conv(_WS + r"\{"))
+        # A key and, if it is a string without escapes, its value. The
+        # value must start right after the whitespace (_WS would otherwise
+        # give some back and leave the group empty before a plain string).
+        self.key = re.compile(conv(_KEY + r"(?![ \t\r\n])(?:" + _PLAIN + ")?"))
+        self.nesting = re.compile(conv(r"[\[\]{}]"))
+        self.backslash = conv("\\")
+        self.quote = conv('"')
+
+
+_STR = _Syntax(lambda s: s)
+_BYTES = _Syntax(lambda s: s.encode("ascii"))
+
+
+class Frame:
+    """
+    A signaling frame with its routing fields read and its body decoded on
+    first use.
+
+    Attributes:
+        raw  : The frame as received (str or bytes)
+        type : Top-level "type", or None if absent / not a string
+        to   : Top-level "to", likewise
+    """
+
+    __slots__ = ("raw", "type", "to", "_body")
+
+    def __init__(self, raw: Raw) -> None:
+        self.raw = raw
+        self.type: Optional[str] = None
+        self.to: Optional[str] = None
+        self._body: Optional[dict] = None
+
+    @property
+    def decoded(self) -> bool:
+        return self._body is not None
+
+    @property
+    def body(self) -> dict:
+        """
+        The whole message, decoded on first access. Raises ValueError if
+        the frame is malformed after its routing fields.
+        """
+        if self._body is None:
+            self._body = json.loads(self.raw)
+        return self._body
+
+    @property
+    def from_(self) -> Optional[str]:
+        """
+        Top-level "from" (decodes the body).
+        """
+        try:
+            value = self.body.get("from")
+        except ValueError:
+            return None
+        return value if isinstance(value, str) else None
+
+    def __repr__(self) -> str:
+        return f"Frame(type={self.type!r}, to={self.to!r}, {len(self.raw)} bytes)"
+
+
+def peek(raw: Raw) -> Optional[Frame]:
+    """
+    Return a Frame with "type" and "to" filled in, or None if `raw` is not
+    a JSON object.
+
+    Only the part of the frame up to the routing fields is validated; a
+    frame that is broken further on is still returned and Frame.body raises
+    ValueError for it.
+    """
+    frame = Frame(raw)
+    if isinstance(raw, str):
+        syn = _STR
+    elif isinstance(raw, (bytes, bytearray)):
+        syn = _BYTES
+    else:
+        return None
+
+    m = syn.lead.match(raw)
+    if m is not None and m.group(1) != m.group(3):
+        _set(frame, m.group(1), m.group(2), syn)
+        _set(frame, m.group(3), m.group(4), syn)
+        return frame
+    if _search_header(raw, frame, syn):
+        return frame
+
+    return decode(raw)
+
+
+def decode(raw: Raw) -> Optional[Frame]:
+    """
+    Decode all of `raw` and return it as a Frame (body included), or None
+    if it is not a JSON object.
+    """
+    if not isinstance(raw, (str, bytes, bytearray)):
+        return None
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(body, dict):
+        return None
+    frame = Frame(raw)
+    frame._body = body
+    for key in ("type", "to"):
+        value = body.get(key)
+        if isinstance(value, str):
+            setattr(frame, key, value)
+    return frame
+
+
+def _set(frame: Frame, key, value, syn: _Syntax) -> None:
+    if syn is _BYTES:
+        key = key.decode("ascii")
+        value = value.decode("utf-8")
+    setattr(frame, key, value)
+
+
+def _search_header(raw: Raw, frame: Frame, syn: _Syntax) -> bool:
+    """
+    Find the routing fields anywhere in the frame. Returns False if the
+    caller has to fall back to a full decode.
+    """
+    m = syn.open.match(raw)
+    if m is None:
+        return False
+    start = m.end()
+    found = {}
+    last = start
+    end = start
+    for m in syn.key.finditer(raw, start):
+        if m.group(2) is None and raw[m.end():m.end() + 1] == syn.quote:
+            return False                    # escaped string value
+        found[m.group(1)] = m.group(2)
+        last, end = m.start(), m.end()
+        if len(found) == 2:
+            break
+    # A bracket before the last key means it may belong to a nested value.
+    if syn.nesting.search(raw, start, last) is not None:
+        return False
+    # So may an escape: a key like "\"to" or "a\\" makes a match start
+    # inside a string.
+    if raw.find(syn.backslash, start, end) >= 0:
+        return False
+    # A missing field may be hiding behind an escaped key ("t\u006f").
+    if len(found) < 2 and raw.find(syn.backslash) >= 0:
+        return False
+    for key, value in found.items():
+        if value is not None:
+            _set(frame, key, value, syn)
+    return True
@@ -0,0 +1,505 @@
+"""
+logindex.py
+
+Indexed, memory-mapped query tool for signaling captures.
+
+Supported input formats (detected per line, so mixed files are fine):
+
+  - attacker.py / interceptor_webrtc.py text logs:
+        [2025-11-20T23:13:25Z] [S → C] Raw message: {...}
+        [2025-11-20T23:11:14Z] [C → S] Registration message (impersonating 'client-a'): {...}
+        [2025-11-20T23:13:25Z] [S → C] Raw signaling message (post-offer): {...}
+  - ws-proxy/proxy.js logs (no timestamps):
+        [C → S] Raw: {...}
+  - attacker.py JSONL captures (--capture-format jsonl, see capture.py).
+    Their monotonic times are converted to wall-clock time with the
+    preceding "session" record.
+
+Only the single-line raw payloads are indexed. The pretty-printed JSON
+blocks that follow them are redundant copies and are skipped, so nobody has
+to stitch multi-line JSON back together.
+
+The file is scanned once through an mmap and a sidecar index is written
+next to it ("<log>.idx"). The index stores, for every message, its byte
+offset and length, timestamp, direction, type and routing fields, plus
+posting lists by clientId, type and direction. Re-opening the same log
+reuses the sidecar and only parses the tail appended since the last run.
+
+Usage (from part2_attack/):
+
+    python -m common.logindex query ../ws-proxy/proxy.log --type offer --to client-b
+    python -m common.logindex query attacker/attacker.log --type ice \\
+        --since 2025-11-20T23:13:00Z --until 2025-11-20T23:14:00Z --pretty
+    python -m common.logindex stats attacker/attacker.log
+"""
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import re
+import sys
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+from common import capture
+
+# Bump whenever the sidecar layout changes; older sidecars are rebuilt.
+INDEX_VERSION = 3
+
+# Number of leading bytes hashed to recognise a file that was replaced or
+# rotated (in which case the whole index is rebuilt).
+_HEAD_BYTES = 4096
+
+# "[<timestamp>] " prefix (optional) + "[S → C] " + label + ": " + payload.
+# The label is everything up to the first ": " (e.g. "Raw", "Raw message",
+# "Registration message (impersonating 'client-a')").
+_TEXT_LINE = re.compile(
+    rb"(?:\[(?P<ts>\d{4}-\d\d-\d\dT[^\]]+)\] )?"
+    rb"\[(?P<dir>[CS] \xe2\x86\x92 [CS])\] "
+    rb"(?P<label>[^:{\n]*): (?P<raw>.*)$"
+)
+
+# Labels whose payload is a raw signaling frame.
+_RAW_LABELS = (b"Raw", b"Registration message")
+
+# Label of the pretty-printed copies we deliberately skip.
+_PRETTY_LABELS = (b"JSON",)
+
+
+def parse_time(text: str) -> float:
+    """
+    Convert an ISO 8601 timestamp (with or without 'Z') to a POSIX time.
+    Naive timestamps are interpreted as UTC, matching the tools' logs.
+    """
+    dt = datetime.fromisoformat(text.strip().replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class LogIndex:
+    """
+    Sidecar index over one capture file.
+
+    Entry columns (parallel lists, one item per indexed message):
+        offset, length : byte range of the raw payload in the log file
+        jsonl          : True if the range is a whole JSONL capture record
+        binary         : True for a binary frame (JSONL "raw_b64")
+        ts             : POSIX timestamp, or None if the line has none
+        direction      : "C → S" or "S → C"
+        type, to, from_, client_id : routing fields from the payload
+
+    Posting lists map a key to the (ascending) entry numbers it occurs in:
+        by_client : every id seen in "to", "from" or "clientId"
+        by_type   : message type
+        by_dir    : direction
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.index_path = path + ".idx"
+
+        self.offset: List[int] = []
+        self.length: List[int] = []
+        self.jsonl: List[bool] = []
+        self.binary: List[bool] = []
+        self.ts: List[Optional[float]] = []
+        self.direction: List[str] = []
+        self.type: List[Optional[str]] = []
+        self.to: List[Optional[str]] = []
+        self.from_: List[Optional[str]] = []
+        self.client_id: List[Optional[str]] = []
+
+        self.by_client: Dict[str, List[int]] = {}
+        self.by_type: Dict[str, List[int]] = {}
+        self.by_dir: Dict[str, List[int]] = {}
+
+        # Parser state carried across incremental updates.
+        self.parsed_upto = 0
+        self.head_crc = 0
+        # True while timestamps are non-decreasing, which lets time-only
+        # queries use binary search instead of a scan.
+        self.ts_sorted = True
+        self.last_ts: Optional[float] = None
+        # (monotonic t, POSIX time) of the last JSONL session record.
+        self.session: Optional[List[float]] = None
+
+        self.tail_bytes_parsed = 0
+
+    # ------------------------------------------------------------------
+    # Opening / persistence
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def open(cls, path: str, save: bool = True) -> "LogIndex":
+        """
+        Load the sidecar index for `path` (if present and still valid),
+        parse whatever was appended since, and write the sidecar back.
+        """
+        index = cls(path)
+        index._load_sidecar()
+        index.update()
+        if save:
+            index.save()
+        return index
+
+    def _load_sidecar(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if data.get("version") != INDEX_VERSION:
+            return
+
+        cols = data["columns"]
+        self.offset = cols["offset"]
+        self.length = cols["length"]
+        self.jsonl = cols["jsonl"]
+        self.binary = cols["binary"]
+        self.ts = cols["ts"]
+        self.direction = cols["direction"]
+        self.type = cols["type"]
+        self.to = cols["to"]
+        self.from_ = cols["from"]
+        self.client_id = cols["client_id"]
+        self.by_client = data["by_client"]
+        self.by_type = data["by_type"]
+        self.by_dir = data["by_dir"]
+        self.parsed_upto = data["parsed_upto"]
+        self.head_crc = data["head_crc"]
+        self.ts_sorted = data["ts_sorted"]
+        self.last_ts = data["last_ts"]
+        self.session = data["session"]
+
+    def save(self) -> None:
+        data = {
+            "version": INDEX_VERSION,
+            "parsed_upto": self.parsed_upto,
+            "head_crc": self.head_crc,
+            "ts_sorted": self.ts_sorted,
+            "last_ts": self.last_ts,
+            "session": self.session,
+            "columns": {
+                "offset": self.offset,
+                "length": self.length,
+                "jsonl": self.jsonl,
+                "binary": self.binary,
+                "ts": self.ts,
+                "direction": self.direction,
+                "type": self.type,
+                "to": self.to,
+                "from": self.from_,
+                "client_id": self.client_id,
+            },
+            "by_client": self.by_client,
+            "by_type": self.by_type,
+            "by_dir": self.by_dir,
+        }
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.index_path)
+
+    def _reset(self) -> None:
+        fresh = type(self)(self.path)
+        self.__dict__.update(fresh.__dict__)
+
+    # ------------------------------------------------------------------
+    # Parsing
+    # ------------------------------------------------------------------
+
+    def update(self) -> int:
+        """
+        Parse the part of the file that is not indexed yet.
+        Returns the number of new entries.
+        """
+        size = os.path.getsize(self.path)
+        if size == 0:
+            self._reset()
+            return 0
+
+        with open(self.path, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Truncated, replaced or rotated file: start over. Only the
+            # part indexed so far is compared, so appending to a file
+            # shorter than _HEAD_BYTES does not look like a rewrite.
+            if size < self.parsed_upto or (
+                    self.parsed_upto and self._head_crc(mm) != self.head_crc):
+                self._reset()
+
+            before = len(self.offset)
+            start = self.parsed_upto
+            self.parsed_upto = self._scan(mm, start, size)
+            self.head_crc = self._head_crc(mm)
+            self.tail_bytes_parsed = self.parsed_upto - start
+            return len(self.offset) - before
+
+    def _head_crc(self, mm: mmap.mmap) -> int:
+        return zlib.crc32(mm[:min(self.parsed_upto, _HEAD_BYTES)])
+
+    def _scan(self, mm: mmap.mmap, pos: int, size: int) -> int:
+        """
+        Index complete lines in mm[pos:size]. A trailing partial line (a
+        writer in the middle of appending) is left for the next update.
+        Returns the offset just past the last complete line.
+        """
+        while pos < size:
+            end = mm.find(b"\n", pos, size)
+            if end < 0:
+                break
+            next_pos = end + 1
+            if end > pos and mm[end - 1:end] == b"\r":
+                end -= 1
+
+            first = mm[pos:pos + 1]
+            if first == b"[":
+                self._index_text_line(mm, pos, end)
+            elif first == b"{" and mm[pos:pos + 17] == b'{"kind":"frame","':
+                self._index_jsonl_line(mm, pos, end)
+            elif first == b"{" and mm[pos:pos + 19] == b'{"kind":"session","':
+                self._read_session_line(mm, pos, end)
+
+            pos = next_pos
+        return pos
+
+    def _index_text_line(self, mm: mmap.mmap, start: int, end: int) -> None:
+        # Match directly against the mmap so only the payload is copied.
+        m = _TEXT_LINE.match(mm, start, end)
+        if m is None:
+            return
+        label = m.group("label")
+        if label.startswith(_PRETTY_LABELS) or not label.startswith(_RAW_LABELS):
+            return
+
+        raw = m.group("raw")
+        ts_text = m.group("ts")
+        ts = parse_time(ts_text.decode("ascii")) if ts_text else None
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            msg = None
+        self._add(m.start("raw"), len(raw), ts,
+                  m.group("dir").decode("utf-8"), msg)
+
+    def _read_session_line(self, mm: mmap.mmap, start: int, end: int) -> None:
+        try:
+            record = json.loads(mm[start:end])
+            self.session = [float(record["t"]), parse_time(record["wall"])]
+        except (ValueError, KeyError, TypeError):
+            pass
+
+    def _index_jsonl_line(self, mm: mmap.mmap, start: int, end: int) -> None:
+        # JSONL captures hold monotonic timestamps; the last session record
+        # anchors them to the wall clock.
+        try:
+            record = json.loads(mm[start:end])
+            msg = json.loads(record["raw"]) if "raw" in record else None
+        except (ValueError, KeyError):
+            return
+        ts = None
+        t = record.get("t")
+        if self.session is not None and isinstance(t, (int, float)):
+            ts = self.session[1] + (t - self.session[0])
+        self._add(start, end - start, ts, record.get("dir", "?"),
+                  msg if isinstance(msg, dict) else None, jsonl=True,
+                  binary="raw_b64" in record)
+
+    def _add(self, offset: int, length: int, ts: Optional[float],
+             direction: str, msg: Optional[dict], jsonl: bool = False,
+             binary: bool = False) -> None:
+        if not isinstance(msg, dict):
+            msg = {}
+        n = len(self.offset)
+
+        if ts is not None:
+            if self.last_ts is not None and ts < self.last_ts:
+                self.ts_sorted = False
+            self.last_ts = ts
+
+        msg_type = _str_or_none(msg.get("type"))
+        to = _str_or_none(msg.get("to"))
+        from_ = _str_or_none(msg.get("from"))
+        client_id = _str_or_none(msg.get("clientId"))
+
+        self.offset.append(offset)
+        self.length.append(length)
+        self.jsonl.append(jsonl)
+        self.binary.append(binary)
+        self.ts.append(ts)
+        self.direction.append(direction)
+        self.type.append(msg_type)
+        self.to.append(to)
+        self.from_.append(from_)
+        self.client_id.append(client_id)
+
+        self.by_dir.setdefault(direction, []).append(n)
+        if msg_type is not None:
+            self.by_type.setdefault(msg_type, []).append(n)
+        for cid in {to, from_, client_id}:
+            if cid is not None:
+                self.by_client.setdefault(cid, []).append(n)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.offset)
+
+    def query(
+        self,
+        msg_type: Optional[str] = None,
+        to: Optional[str] = None,
+        from_: Optional[str] = None,
+        client: Optional[str] = None,
+        direction: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> List[int]:
+        """
+        Return the entry numbers matching every given filter, in file order.
+
+        `client` matches any of to / from / clientId. `since` and `until`
+        are inclusive POSIX times; entries without a timestamp never match
+        a time filter.
+        """
+        postings = []
+        if msg_type is not None:
+            postings.append(self.by_type.get(msg_type, []))
+        if direction is not None:
+            postings.append(self.by_dir.get(direction, []))
+        for cid in (client, to, from_):
+            if cid is not None:
+                postings.append(self.by_client.get(cid, []))
+
+        if postings:
+            postings.sort(key=len)
+            result = postings[0]
+            for other in postings[1:]:
+                keep = set(other)
+                result = [n for n in result if n in keep]
+        elif (since is not None or until is not None) and self.ts_sorted:
+            result = self._time_slice(since, until)
+        else:
+            result = list(range(len(self)))
+
+        if to is not None:
+            result = [n for n in result if self.to[n] == to]
+        if from_ is not None:
+            result = [n for n in result if self.from_[n] == from_]
+        if since is not None or until is not None:
+            lo = float("-inf") if since is None else since
+            hi = float("inf") if until is None else until
+            result = [n for n in result
+                      if self.ts[n] is not None and lo <= self.ts[n] <= hi]
+        return result
+
+    def _time_slice(self, since: Optional[float], until: Optional[float]) -> List[int]:
+        stamped = [n for n, t in enumerate(self.ts) if t is not None]
+        keys = [self.ts[n] for n in stamped]
+        lo = 0 if since is None else bisect.bisect_left(keys, since)
+        hi = len(keys) if until is None else bisect.bisect_right(keys, until)
+        return stamped[lo:hi]
+
+    def iter_raw(self, entries: List[int]) -> Iterator[bytes]:
+        """
+        Yield the raw payload bytes of the given entries, read through an
+        mmap without touching the rest of the file. Text frames are yielded
+        as UTF-8; whether an entry was a binary frame is in .binary.
+        """
+        if not entries:
+            return
+        with open(self.path, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for n in entries:
+                data = mm[self.offset[n]:self.offset[n] + self.length[n]]
+                if self.jsonl[n]:
+                    payload = capture.frame_payload(json.loads(data))
+                    yield payload if isinstance(payload, bytes) else payload.encode("utf-8")
+                else:
+                    yield data
+
+
+def _str_or_none(value) -> Optional[str]:
+    return value if isinstance(value, str) else None
+
+
+# ---------------------------------------------------------------------------
+# Command-line interface
+# ---------------------------------------------------------------------------
+
+def _format_ts(ts: Optional[float]) -> str:
+    if ts is None:
+        return "-"
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m common.logindex",
+        description="Build and query sidecar indexes over signaling captures.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_index = sub.add_parser("index", help="Build or refresh the sidecar index.")
+    p_index.add_argument("log", help="Path of the log file.")
+
+    p_stats = sub.add_parser("stats", help="Show message counts by type, client and direction.")
+    p_stats.add_argument("log", help="Path of the log file.")
+
+    p_query = sub.add_parser("query", help="Print messages matching the given filters.")
+    p_query.add_argument("log", help="Path of the log file.")
+    p_query.add_argument("--type", dest="msg_type", help="Message type (offer, answer, ice, ...).")
+    p_query.add_argument("--to", help="Value of the 'to' field.")
+    p_query.add_argument("--from", dest="from_", help="Value of the 'from' field.")
+    p_query.add_argument("--client", help="clientId appearing in to, from or clientId.")
+    p_query.add_argument("--direction", choices=("C → S", "S → C"), help="Message direction.")
+    p_query.add_argument("--since", help="ISO 8601 start time (inclusive).")
+    p_query.add_argument("--until", help="ISO 8601 end time (inclusive).")
+    p_query.add_argument("--count", action="store_true", help="Only print the number of matches.")
+    p_query.add_argument("--pretty", action="store_true", help="Pretty-print matching JSON payloads.")
+
+    args = parser.parse_args(argv)
+    index = LogIndex.open(args.log)
+    print(f"[*] {args.log}: {len(index)} message(s) indexed, "
+          f"{index.tail_bytes_parsed} new byte(s) parsed.", file=sys.stderr)
+
+    if args.command == "stats":
+        for title, postings in (("type", index.by_type), ("client", index.by_client),
+                                ("direction", index.by_dir)):
+            print(f"by {title}:")
+            for key, entries in sorted(postings.items(), key=lambda kv: -len(kv[1])):
+                print(f"  {key:<24} {len(entries)}")
+
+    elif args.command == "query":
+        entries = index.query(
+            msg_type=args.msg_type,
+            to=args.to,
+            from_=args.from_,
+            client=args.client,
+            direction=args.direction,
+            since=parse_time(args.since) if args.since else None,
+            until=parse_time(args.until) if args.until else None,
+        )
+        if args.count:
+            print(len(entries))
+            return 0
+        for n, raw in zip(entries, index.iter_raw(entries)):
+            text = raw.decode("utf-8", errors="replace")
+            print(f"[{_format_ts(index.ts[n])}] [{index.direction[n]}] {text}")
+            if args.pretty:
+                try:
+                    print(json.dumps(json.loads(text), indent=2, sort_keys=True))
+                except ValueError:
+                    pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
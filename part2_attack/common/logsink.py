@@ -0,0 +1,297 @@
+"""
+logsink.py
+
+Non-blocking, batched log file writer shared by the attack scripts.
+
+The original log() helpers opened, appended to and closed the log file for
+every single line, directly inside the asyncio event loop. During a burst of
+SDP / ICE messages this file I/O stalls the loop long enough to delay
+websocket ping/pong handling.
+
+LogSink keeps one open file handle that is owned by a background writer
+thread. Callers only hand finished lines to a bounded queue:
+
+  - The writer flushes in batches, either when `batch_size` lines are
+    pending or when `flush_interval` seconds have passed since the first
+    pending line.
+  - The file is rotated by size ("attacker.log" -> "attacker.log.1" -> ...)
+    once it would grow beyond `max_bytes`.
+  - If the queue is full, the line is either dropped (default, never blocks
+    the caller) or the caller blocks until there is room. Both cases are
+    counted so the operator can see whether the log is complete.
+"""
+
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+# Sentinel object pushed into the queue to stop the writer thread.
+_STOP = object()
+
+# Accepted values for LogSink(on_full=...).
+ON_FULL_POLICIES = ("drop", "block")
+
+
+@dataclass
+class LogSinkStats:
+    """
+    Counters describing what a LogSink did with the lines it was given.
+
+    Attributes:
+        written   : Lines written to the file
+        dropped   : Lines discarded because the queue was full (on_full="drop")
+        blocked   : write() calls that had to wait for queue space (on_full="block")
+        batches   : Number of batched write + flush operations
+        rotations : Number of size-based file rotations
+        errors    : File errors encountered by the writer thread
+    """
+    written: int = 0
+    dropped: int = 0
+    blocked: int = 0
+    batches: int = 0
+    rotations: int = 0
+    errors: int = 0
+
+    def summary(self) -> str:
+        return (f"written={self.written} dropped={self.dropped} "
+                f"blocked={self.blocked} batches={self.batches} "
+                f"rotations={self.rotations} errors={self.errors}")
+
+
+class LogSink:
+    """
+    Append-only log file fed through a bounded queue by a writer thread.
+
+    Parameters
+    ----------
+    path : str
+        Path of the log file. The file is opened in append mode.
+
+    max_queue : int
+        Maximum number of lines waiting for the writer thread.
+
+    batch_size : int
+        Number of pending lines that triggers an immediate flush.
+
+    flush_interval : float
+        Maximum number of seconds a line may wait before it is flushed.
+
+    max_bytes : int
+        Rotate the file once it would grow beyond this size. 0 disables
+        rotation.
+
+    backup_count : int
+        Number of rotated files to keep ("<path>.1" ... "<path>.N").
+
+    on_full : str
+        "drop" to discard lines when the queue is full, "block" to make the
+        caller wait for the writer thread.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_queue: int = 10000,
+        batch_size: int = 256,
+        flush_interval: float = 0.25,
+        max_bytes: int = 0,
+        backup_count: int = 5,
+        on_full: str = "drop",
+    ) -> None:
+        if on_full not in ON_FULL_POLICIES:
+            raise ValueError(f"on_full must be one of {ON_FULL_POLICIES}, got {on_full!r}")
+
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.on_full = on_full
+        self.stats = LogSinkStats()
+
+        self._queue: "queue.Queue[object]" = queue.Queue(maxsize=max_queue)
+        self._closed = False
+
+        # Open eagerly so that a bad path is reported to the caller once,
+        # instead of failing silently inside the writer thread.
+        self._file = open(path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+        self._thread = threading.Thread(
+            target=self._run, name=f"logsink:{os.path.basename(path)}", daemon=True
+        )
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Producer side (called from the event loop)
+    # ------------------------------------------------------------------
+
+    def write(self, line: str) -> None:
+        """
+        Queue a single line (without trailing newline) for the writer thread.
+        Never performs file I/O itself.
+        """
+        if self._closed:
+            self.stats.dropped += 1
+            return
+
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            if self.on_full == "drop":
+                self.stats.dropped += 1
+                return
+            self.stats.blocked += 1
+            # Wait for room, but not on a writer thread that is gone.
+            while True:
+                try:
+                    self._queue.put(line, timeout=0.5)
+                    return
+                except queue.Full:
+                    if not self._thread.is_alive():
+                        self.stats.dropped += 1
+                        return
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """
+        Flush every queued line, stop the writer thread and close the file.
+        Safe to call more than once.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        # The stop sentinel must not be dropped, so this put may block, but
+        # no longer than `timeout` (the writer may be stuck or gone).
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            self.stats.errors += 1
+            return
+        self._thread.join(timeout)
+
+    # ------------------------------------------------------------------
+    # Writer thread
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        batch: List[str] = []
+        deadline: Optional[float] = None
+        stopping = False
+
+        while not stopping:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                batch.append(item)  # type: ignore[arg-type]
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            # Drain whatever else is already waiting without blocking, so a
+            # burst is written as one batch instead of line by line.
+            while not stopping and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)  # type: ignore[arg-type]
+
+            due = deadline is not None and time.monotonic() >= deadline
+            if batch and (stopping or due or len(batch) >= self.batch_size):
+                self._write_batch(batch)
+                batch = []
+                deadline = None
+
+        try:
+            self._file.close()
+        except OSError:
+            self.stats.errors += 1
+
+    def _write_batch(self, lines: List[str]) -> None:
+        data = "".join(line + "\n" for line in lines)
+        size = len(data.encode("utf-8"))
+
+        try:
+            if self.max_bytes and self._size > 0 and self._size + size > self.max_bytes:
+                try:
+                    self._rotate()
+                except OSError:
+                    # Keep the batch: it goes to the current file.
+                    self.stats.errors += 1
+            self._file.write(data)
+            self._file.flush()
+        except (OSError, ValueError):
+            # The writer thread must keep running; the primary output
+            # (stdout) still works, so we only count the failure.
+            # (ValueError: the file could not be reopened after a rotation.)
+            self.stats.errors += 1
+            return
+
+        self._size += size
+        self.stats.written += len(lines)
+        self.stats.batches += 1
+
+    def _rotate(self) -> None:
+        self._file.close()
+
+        try:
+            if self.backup_count > 0:
+                for i in range(self.backup_count - 1, 0, -1):
+                    src = f"{self.path}.{i}"
+                    if os.path.exists(src):
+                        os.replace(src, f"{self.path}.{i + 1}")
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+            self._size = 0
+            self.stats.rotations += 1
+        finally:
+            # Reopen even when a rename failed: writing continues in the
+            # current file and the next batch tries to rotate again.
+            self._file = open(self.path, "a", encoding="utf-8")
+
+
+# ---------------------------------------------------------------------------
+# Process-wide registry
+# ---------------------------------------------------------------------------
+#
+# The scripts pass log file *paths* around, so sinks are shared by path:
+# every log() call for the same file reuses the same open handle.
+
+_sinks: Dict[str, LogSink] = {}
+
+
+def get_sink(path: str, **options) -> LogSink:
+    """
+    Return the LogSink for `path`, creating it with `options` on first use.
+    Options passed on later calls for an existing sink are ignored.
+    """
+    sink = _sinks.get(path)
+    if sink is None:
+        sink = LogSink(path, **options)
+        _sinks[path] = sink
+    return sink
+
+
+def close_all() -> Dict[str, LogSinkStats]:
+    """
+    Close every registered sink and return their final counters by path.
+    """
+    stats = {}
+    for path, sink in list(_sinks.items()):
+        sink.close()
+        stats[path] = sink.stats
+    _sinks.clear()
+    return stats
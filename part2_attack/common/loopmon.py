@@ -0,0 +1,270 @@
+"""
+loopmon.py
+
+Event-loop lag monitor and handler timing for the command-line tools
+(--loop-profile).
+
+Blocking work inside an asyncio callback (file I/O, JSON formatting, a
+recorder call) stalls every other task, including the signaling reader and
+ICE. A LoopMonitor makes those stalls visible:
+
+  - a watchdog thread posts a no-op callback to the loop every `interval`
+    and records how long the loop took to run it (the loop lag);
+  - when the loop has not run it within `threshold`, the loop is stalled:
+    the watchdog takes the stack of the loop thread at that moment, and
+    once the loop runs again the stall is logged with its duration, that
+    stack and the hooked handler it happened in;
+  - wrap(name, fn) times every call of a signaling handler or pc.on(...)
+    callback under `name` (sync callbacks: run time; coroutines: time to
+    completion, awaits included).
+
+    MONITOR = LoopMonitor(threshold=0.1, log=log)
+    MONITOR.start()                          # inside the running loop
+    pc.on("track", MONITOR.wrap("pc.track", on_track))
+    ...
+    MONITOR.stop()
+    log(MONITOR.report())
+
+report() is a table of the loop lag, the stalls and every hooked handler;
+it is also logged whenever the process receives SIGUSR1, without stopping.
+A stall is always caught if it lasts longer than threshold + interval.
+
+When the tools run without --loop-profile no monitor exists: there is no
+thread and handlers are registered unwrapped, so nothing is measured and
+nothing costs time.
+"""
+
+import asyncio
+import functools
+import inspect
+import signal
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional, Tuple
+
+from common.metrics import LatencyHistogram, format_summary
+
+DEFAULT_THRESHOLD = 0.1
+DEFAULT_INTERVAL = 0.05
+
+# Innermost frames of the loop thread's stack included in a stall report.
+STACK_LIMIT = 12
+
+# Stalls that happen outside every hooked handler are counted under this name.
+OUTSIDE = "(outside handlers)"
+
+
+class _Handler:
+    __slots__ = ("name", "latency", "stalls", "blocked")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.latency = LatencyHistogram()
+        self.stalls = 0
+        self.blocked = 0.0
+
+
+class LoopMonitor:
+    """
+    Loop-lag watchdog, stall reports with stacks and per-handler timing.
+
+    Parameters
+    ----------
+    threshold : float
+        Seconds the loop may go without running the watchdog's callback
+        before it counts as stalled.
+
+    interval : float
+        Seconds between the watchdog's callbacks.
+
+    log : Callable[[str], None]
+        Receives the stall reports and the SIGUSR1 report; called on the
+        loop thread.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD,
+                 interval: float = DEFAULT_INTERVAL,
+                 log: Callable[[str], None] = print) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.log = log
+        self.lag = LatencyHistogram()
+        self.handlers: Dict[str, _Handler] = {}
+        self.stalls = 0
+        self.blocked = 0.0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__loop_thread: Optional[int] = None
+        self.__watchdog: Optional[threading.Thread] = None
+        self.__stopping = threading.Event()
+        self.__signal = False
+        # Code objects of the wrappers made by wrap(), to find the handler
+        # that is running in a captured stack.
+        self.__wrapper_codes = set()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """
+        Start watching the running loop. Must be called on the loop thread.
+        """
+        if self.__watchdog is not None:
+            return
+        self.__loop = asyncio.get_running_loop()
+        self.__loop_thread = threading.get_ident()
+        self.started_at = time.perf_counter()
+        self.__watchdog = threading.Thread(target=self.__watch, name="loop-monitor", daemon=True)
+        self.__watchdog.start()
+        try:
+            self.__loop.add_signal_handler(signal.SIGUSR1, self.__on_signal)
+            self.__signal = True
+        except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+            pass  # no SIGUSR1 (Windows) or not the main thread
+
+    def stop(self) -> None:
+        """
+        Stop the watchdog (the collected data stays available for report()).
+        """
+        if self.__watchdog is None or self.stopped_at is not None:
+            return
+        self.stopped_at = time.perf_counter()
+        self.__stopping.set()
+        self.__watchdog.join(timeout=self.threshold + self.interval + 1.0)
+        if self.__signal:
+            self.__loop.remove_signal_handler(signal.SIGUSR1)
+            self.__signal = False
+
+    # ------------------------------------------------------------------
+    # Handler timing
+    # ------------------------------------------------------------------
+
+    def wrap(self, name: str, fn: Callable) -> Callable:
+        """
+        Return `fn` timed under `name`. Coroutine functions stay coroutine
+        functions (pyee and SignalingClient.on() tell them apart).
+        """
+        handler = self.__handler(name)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def timed_async(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    handler.latency.record(time.perf_counter() - t0)
+
+            self.__wrapper_codes.add(timed_async.__code__)
+            return timed_async
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                handler.latency.record(time.perf_counter() - t0)
+
+        self.__wrapper_codes.add(timed.__code__)
+        return timed
+
+    def __handler(self, name: str) -> _Handler:
+        handler = self.handlers.get(name)
+        if handler is None:
+            handler = self.handlers[name] = _Handler(name)
+        return handler
+
+    # ------------------------------------------------------------------
+    # Watchdog
+    # ------------------------------------------------------------------
+
+    def __watch(self) -> None:
+        acked_at = [0.0]
+        ack = threading.Event()
+
+        def pong() -> None:
+            acked_at[0] = time.perf_counter()
+            ack.set()
+
+        while not self.__stopping.wait(self.interval):
+            ack.clear()
+            sent = time.perf_counter()
+            try:
+                self.__loop.call_soon_threadsafe(pong)
+            except RuntimeError:
+                return  # the loop is closed
+            if ack.wait(self.threshold):
+                self.lag.record(acked_at[0] - sent)
+                continue
+
+            # Stalled: capture what the loop thread is doing right now.
+            frame = sys._current_frames().get(self.__loop_thread)
+            name = self.__running_handler(frame)
+            stack = "".join(traceback.format_stack(frame)[-STACK_LIMIT:]) if frame else ""
+            del frame
+            while not ack.wait(self.interval):
+                if self.__stopping.is_set():
+                    return
+            blocked = acked_at[0] - sent
+            self.lag.record(blocked)
+            self.__record_stall(name, blocked, stack)
+
+    def __running_handler(self, frame) -> str:
+        while frame is not None:
+            if frame.f_code in self.__wrapper_codes:
+                handler = frame.f_locals.get("handler")
+                if isinstance(handler, _Handler):
+                    return handler.name
+            frame = frame.f_back
+        return OUTSIDE
+
+    def __record_stall(self, name: str, blocked: float, stack: str) -> None:
+        self.stalls += 1
+        self.blocked += blocked
+        handler = self.__handler(name)
+        handler.stalls += 1
+        handler.blocked = max(handler.blocked, blocked)
+        message = (f"[!] Event loop blocked for {blocked * 1e3:.1f} ms in {name} "
+                   f"(threshold {self.threshold * 1e3:g} ms); loop thread stack "
+                   f"when detected:\n{stack.rstrip()}")
+        try:
+            self.__loop.call_soon_threadsafe(self.log, message)
+        except RuntimeError:
+            pass
+
+    def __on_signal(self) -> None:
+        self.log(self.report())
+
+    # ------------------------------------------------------------------
+    # Report
+    # ------------------------------------------------------------------
+
+    def report(self) -> str:
+        if self.started_at is None:
+            return "[*] Event-loop profile: monitor not started."
+        elapsed = (self.stopped_at or time.perf_counter()) - self.started_at
+        lines = [
+            f"[*] Event-loop profile ({elapsed:.1f} s, threshold {self.threshold * 1e3:g} ms, "
+            f"sampled every {self.interval * 1e3:g} ms):",
+            "    " + format_summary("loop lag", self.lag),
+            f"    stalls: {self.stalls}, {self.blocked * 1e3:.1f} ms blocked in total",
+        ]
+        # Handlers that never ran (e.g. "signaling.error") are left out.
+        rows: List[Tuple[str, _Handler]] = sorted(
+            ((name, h) for name, h in self.handlers.items() if h.latency.count or h.stalls),
+            key=lambda item: item[1].latency.total, reverse=True)
+        if rows:
+            lines.append(f"    {'handler':<28}{'calls':>7}{'total ms':>11}{'mean ms':>10}"
+                         f"{'p95 ms':>10}{'max ms':>10}{'stalls':>8}{'worst ms':>10}")
+            for name, h in rows:
+                s = h.latency.summary()
+                lines.append(f"    {name:<28}{s['count']:>7}{h.latency.total * 1e3:>11.1f}"
+                             f"{s['mean_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['max_ms']:>10.2f}"
+                             f"{h.stalls:>8}{h.blocked * 1e3:>10.1f}")
+        return "\n".join(lines)
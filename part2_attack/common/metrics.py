@@ -0,0 +1,182 @@
+"""
+metrics.py
+
+Small, dependency-free measurement helpers shared by the Part 2 tools.
+
+LatencyHistogram records durations into fixed log-scale buckets, so memory
+use is constant no matter how many samples are recorded, and percentiles
+can be estimated cheaply at any time.
+
+prometheus_metric() and serve_metrics() expose values in the Prometheus
+text format on a local HTTP port, without a client library.
+"""
+
+import asyncio
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Bucket upper bounds in seconds: 1 µs * 2^(i/2), i.e. two buckets per
+# doubling, from 1 µs up to roughly 3 minutes. Anything slower lands in the
+# final overflow bucket.
+_BUCKET_BOUNDS: List[float] = [1e-6 * 2 ** (i / 2) for i in range(56)]
+
+
+class LatencyHistogram:
+    """
+    Constant-memory latency histogram (values in seconds).
+
+    Percentiles are estimated as the upper bound of the bucket that holds
+    the requested rank, i.e. they are accurate to within a factor of
+    sqrt(2). min / max / mean are exact.
+    """
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(_BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        if seconds <= _BUCKET_BOUNDS[0]:
+            i = 0
+        else:
+            # Inverse of the bucket formula, clamped to the overflow bucket.
+            i = min(len(_BUCKET_BOUNDS), math.ceil(2 * math.log2(seconds / 1e-6)))
+            # Guard against floating point landing one bucket too low.
+            if i < len(_BUCKET_BOUNDS) and seconds > _BUCKET_BOUNDS[i]:
+                i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """
+        Estimated q-th percentile (0 < q <= 100), in seconds.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * q / 100.0))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                bound = _BUCKET_BOUNDS[i] if i < len(_BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def buckets(self) -> List[tuple]:
+        """
+        Cumulative (upper_bound_seconds, count) pairs for non-empty ranges,
+        in the shape Prometheus histograms use ("le" buckets). The last pair
+        has an infinite bound and equals the total count.
+        """
+        out = []
+        seen = 0
+        for i, c in enumerate(self.counts[:-1]):
+            seen += c
+            if c:
+                out.append((_BUCKET_BOUNDS[i], seen))
+        out.append((math.inf, self.count))
+        return out
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Dictionary with count and millisecond statistics, for printing.
+        """
+        return {
+            "count": self.count,
+            "mean_ms": self.mean * 1e3,
+            "p50_ms": self.percentile(50) * 1e3,
+            "p95_ms": self.percentile(95) * 1e3,
+            "p99_ms": self.percentile(99) * 1e3,
+            "max_ms": self.max * 1e3,
+        }
+
+
+def exact_percentile(samples: Sequence[float], q: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of an explicit list of samples (None if empty).
+    Used where the number of samples is small and exact values matter,
+    e.g. benchmark runs.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(len(ordered) * q / 100.0))
+    return ordered[rank - 1]
+
+
+def format_summary(name: str, hist: LatencyHistogram) -> str:
+    s = hist.summary()
+    return (f"{name}: n={s['count']} mean={s['mean_ms']:.3f}ms "
+            f"p50={s['p50_ms']:.3f}ms p95={s['p95_ms']:.3f}ms "
+            f"p99={s['p99_ms']:.3f}ms max={s['max_ms']:.3f}ms")
+
+
+# ---------------------------------------------------------------------------
+# Prometheus text exposition
+# ---------------------------------------------------------------------------
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def prometheus_metric(name: str, metric_type: str, help_text: str,
+                      samples: Sequence[Tuple[Dict[str, str], float]]) -> List[str]:
+    """
+    Lines for one metric family: # HELP, # TYPE and one line per
+    (labels, value) sample.
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        label_str = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+        lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+    return lines
+
+
+async def serve_metrics(render: Callable[[], str], host: str = "127.0.0.1",
+                        port: int = 9108) -> asyncio.AbstractServer:
+    """
+    Start a minimal HTTP server answering every GET with render() as
+    Prometheus text. render() runs in the event loop, so it should only
+    format values that were already collected.
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            if request.startswith(b"GET "):
+                body = render().encode("utf-8")
+                status = b"200 OK"
+            else:
+                body, status = b"", b"405 Method Not Allowed"
+            writer.write(b"HTTP/1.1 " + status + b"\r\n"
+                         b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                         b"Connection: close\r\n\r\n" + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,470 @@
+"""
+regwatch.py
+
+Streaming detector for registration conflicts in signaling logs.
+
+server.js binds a clientId with clients.set(ws.clientId, ws) and silently
+replaces an existing binding: that is the hijack attacker.py performs,
+and nothing in the server's output points it out. This tool reads logs
+line by line (complete files, files that are still being written with
+--follow, or a live stream on stdin) and raises alerts:
+
+  rebind       An id that is still bound is registered again from another
+               (or an unidentified) connection.
+  diverted     The first message routed to an id after it was rebound:
+               it now goes to the new connection.
+  peer-change  Messages to an id start coming from a sender it has not
+               exchanged messages with inside the window, while it had
+               an established peer.
+
+Understood line formats, auto-detected per line:
+
+  - server.js console output (docker logs): "New WebSocket connection",
+    "Client registered: X", "Routing message from X to Y",
+    "Client disconnected: X". Multi-line "Received message" dumps are
+    ignored.
+  - ws-proxy logs (proxy.log / proxy_2_2.log): "New client connected",
+    "[C → S] Raw: {...}", "[S → C] Raw: {...}".
+  - attacker.log / interceptor logs ("[<UTC>] [C → S] ...: {...}").
+  - JSONL captures (common/capture.py records).
+
+Neither server.js nor the proxy writes connection ids, so a register is
+attributed to the oldest connection that opened and has not registered
+yet. A register with no such connection (same connection registering
+again, or a connection opened before the log starts) is reported as
+coming from an unidentified connection.
+
+State is bounded: bindings and peers live in a sliding window (--window
+seconds since last activity) and are capped at --max-clients ids (least
+recently active evicted first), with at most MAX_PEERS peers per id.
+Lines with a timestamp are timed by it; other lines by when they are
+read, so for an old server.js log the window covers the whole file.
+
+Usage (from part2_attack/):
+
+    python -m common.regwatch ../ws-proxy/proxy.log attacker/attacker.log
+    docker logs -f signaling 2>&1 | python -m common.regwatch -
+    python -m common.regwatch --follow server.log --stats-interval 10
+"""
+
+import argparse
+import collections
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Deque, Dict, List, Optional, TextIO
+
+from common import codec
+from common.capture import KIND_FRAME, KIND_NOTE, KIND_SESSION, frame_payload
+
+DEFAULT_WINDOW = 600.0
+DEFAULT_MAX_CLIENTS = 10_000
+
+# Distinct senders remembered per recipient.
+MAX_PEERS = 8
+
+# Connections opened but not registered yet (see module docstring).
+MAX_PENDING = 1024
+
+ALERT_KINDS = ("rebind", "diverted", "peer-change")
+
+_STAMP = re.compile(r"\[(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?)Z\] ")
+_REGISTERED = re.compile(r"\[\+\] Client registered: (\S+)")
+_ROUTING = re.compile(r"\[\*\] Routing message from (\S+) to (\S+) ")
+_DISCONNECTED = re.compile(r"\[-\] Client disconnected: (\S+)")
+# The server appends "from" at the end of a forwarded frame.
+_TRAILING_FROM = re.compile(r'"from"\s*:\s*"([^"\\]*)"\s*\}\s*$')
+
+_CONNECT_PREFIXES = ("[+] New WebSocket connection", "[+] New client connected",
+                     "[+] Connected to signaling server", "[+] Reconnected after")
+# A tool's own connection ended (attacker.py / supervisor status lines).
+_CLOSE_PREFIXES = ("[*] Connection closed by server", "[!] Connection error",
+                   "[!] No pong within")
+_FRAME_PREFIXES = ("[C → S] ", "[S → C] ")
+
+
+@dataclass
+class Alert:
+    """
+    Attributes:
+        kind      : One of ALERT_KINDS
+        client_id : The id concerned
+        source    : Log the line came from
+        line      : Line number in that log
+        t         : Time of the event (POSIX seconds or monotonic)
+        detail    : Human-readable explanation
+    """
+    kind: str
+    client_id: str
+    source: str
+    line: int
+    t: float
+    detail: str
+
+    def __str__(self) -> str:
+        return f"[!] [{self.source}:{self.line}] {self.kind}: {self.detail}"
+
+
+@dataclass
+class _Binding:
+    conn: Optional[int]
+    since: float
+    seen: float
+    line: int
+    rebound: bool = False
+
+
+class RegWatch:
+    """
+    Registration-conflict detector for one log stream.
+
+    Parameters
+    ----------
+    source : str
+        Name used in alerts (usually the log path).
+
+    window : float
+        Seconds of inactivity after which a binding or peer is forgotten.
+
+    max_clients : int
+        Upper bound on ids tracked (bindings and peer sets each).
+
+    on_alert : Optional[Callable[[Alert], None]]
+        Called for every alert; defaults to printing it.
+
+    clock : Callable[[], float]
+        Time source for lines without a timestamp.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        window: float = DEFAULT_WINDOW,
+        max_clients: int = DEFAULT_MAX_CLIENTS,
+        on_alert: Optional[Callable[[Alert], None]] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.source = source
+        self.window = window
+        self.max_clients = max_clients
+        self.on_alert = on_alert or print
+        self.clock = clock
+
+        self.bindings: "collections.OrderedDict[str, _Binding]" = collections.OrderedDict()
+        self.peers: "collections.OrderedDict[str, collections.OrderedDict[str, float]]" = \
+            collections.OrderedDict()
+        self.pending: Deque[int] = collections.deque(maxlen=MAX_PENDING)
+        self.conn_ids: "collections.OrderedDict[int, str]" = collections.OrderedDict()
+        self.jsonl_base: Optional[float] = None
+
+        self.lines = 0
+        self.bytes = 0
+        self.events = 0
+        self.evicted = 0
+        self.alerts: Dict[str, int] = dict.fromkeys(ALERT_KINDS, 0)
+        self.__connections = 0
+        self.__t = 0.0
+
+    # ------------------------------------------------------------------
+    # Input
+    # ------------------------------------------------------------------
+
+    def feed(self, line: str) -> None:
+        self.lines += 1
+        self.bytes += len(line)
+        if not line or line[0] in " \t\r\n}":
+            return                          # pretty-printed JSON, blank lines
+        if line[0] == "{":
+            self.__feed_record(line)
+            return
+
+        m = _STAMP.match(line)
+        if m is not None:
+            self.__t = datetime.fromisoformat(m.group(1)).replace(tzinfo=timezone.utc).timestamp()
+            line = line[m.end():]
+        else:
+            self.__t = self.clock()
+        self.__feed_message(line.rstrip("\r\n"))
+
+    def __feed_record(self, line: str) -> None:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return
+        if not isinstance(record, dict):
+            return
+        # Records carry monotonic times; anchor them to the wall clock once.
+        t = record.get("t")
+        if isinstance(t, (int, float)):
+            if self.jsonl_base is None or record.get("kind") == KIND_SESSION:
+                self.jsonl_base = self.clock() - t
+            self.__t = self.jsonl_base + t
+        else:
+            self.__t = self.clock()
+
+        kind = record.get("kind")
+        if kind == KIND_NOTE and isinstance(record.get("msg"), str):
+            self.__feed_message(record["msg"])
+        elif kind == KIND_FRAME and record.get("dir") in ("C → S", "S → C"):
+            payload = frame_payload(record)
+            self.__frame(record["dir"], payload)
+
+    def __feed_message(self, text: str) -> None:
+        if text.startswith(_CONNECT_PREFIXES):
+            self.__connections += 1
+            self.pending.append(self.__connections)
+            return
+        if text.startswith(_CLOSE_PREFIXES):
+            # Tools hold one connection at a time: the latest one closed.
+            client_id = self.conn_ids.pop(self.__connections, None)
+            binding = self.bindings.get(client_id) if client_id is not None else None
+            if binding is not None and binding.conn == self.__connections:
+                del self.bindings[client_id]
+            return
+        if text.startswith(_FRAME_PREFIXES):
+            brace = text.find("{")
+            if brace >= 0:
+                self.__frame(text[1:6], text[brace:])
+            return
+        m = _REGISTERED.match(text)
+        if m is not None:
+            self.__register(m.group(1))
+            return
+        m = _ROUTING.match(text)
+        if m is not None:
+            if m.group(1) != "undefined":
+                self.__route(m.group(1), m.group(2))
+            return
+        m = _DISCONNECTED.match(text)
+        if m is not None:
+            self.bindings.pop(m.group(1), None)
+
+    def __frame(self, direction: str, raw) -> None:
+        frame = codec.peek(raw)
+        if frame is None or frame.type is None:
+            return
+        if direction == "C → S":
+            if frame.type == "register":
+                try:
+                    client_id = frame.body.get("clientId")
+                except ValueError:
+                    return
+                if isinstance(client_id, str):
+                    self.__register(client_id)
+            return
+        if frame.to is None or frame.type in ("registered", "error"):
+            return
+        m = _TRAILING_FROM.search(raw) if isinstance(raw, str) else None
+        sender = m.group(1) if m is not None else frame.from_
+        if sender is not None:
+            self.__route(sender, frame.to)
+
+    # ------------------------------------------------------------------
+    # Detection
+    # ------------------------------------------------------------------
+
+    def __register(self, client_id: str) -> None:
+        self.events += 1
+        t = self.__t
+        self.__expire(t)
+        conn = self.pending.popleft() if self.pending else None
+
+        old = self.bindings.get(client_id)
+        if old is not None and (conn is None or old.conn != conn):
+            new_conn = f"connection #{conn}" if conn is not None else "an unidentified connection"
+            old_conn = f"connection #{old.conn}" if old.conn is not None else "an unidentified connection"
+            self.__alert("rebind", client_id,
+                         f"{client_id!r} registered again from {new_conn} while bound to "
+                         f"{old_conn} (registered at line {old.line}, {t - old.since:.1f}s earlier); "
+                         f"the server replaces the binding")
+        binding = _Binding(conn, t, t, self.lines, rebound=old is not None)
+        self.bindings[client_id] = binding
+        self.bindings.move_to_end(client_id)
+        while len(self.bindings) > self.max_clients:
+            self.bindings.popitem(last=False)
+            self.evicted += 1
+        if conn is not None:
+            self.conn_ids[conn] = client_id
+            while len(self.conn_ids) > self.max_clients:
+                self.conn_ids.popitem(last=False)
+
+    def __route(self, sender: str, to: str) -> None:
+        self.events += 1
+        t = self.__t
+        self.__expire(t)
+
+        binding = self.bindings.get(to)
+        if binding is not None:
+            binding.seen = t
+            self.bindings.move_to_end(to)
+            if binding.rebound:
+                binding.rebound = False
+                where = f"connection #{binding.conn}" if binding.conn is not None else "the new binding"
+                self.__alert("diverted", to,
+                             f"message from {sender!r} to {to!r} is delivered to {where}, "
+                             f"registered at line {binding.line}")
+
+        peers = self.peers.get(to)
+        if peers is None:
+            peers = self.peers[to] = collections.OrderedDict()
+            while len(self.peers) > self.max_clients:
+                self.peers.popitem(last=False)
+                self.evicted += 1
+        else:
+            self.peers.move_to_end(to)
+            if sender not in peers and peers:
+                self.__alert("peer-change", to,
+                             f"{to!r} receives messages from {sender!r}; "
+                             f"its peers so far: {', '.join(map(repr, peers))}")
+        peers[sender] = t
+        peers.move_to_end(sender)
+        while len(peers) > MAX_PEERS:
+            peers.popitem(last=False)
+
+    def __expire(self, now: float) -> None:
+        horizon = now - self.window
+        while self.bindings:
+            client_id, binding = next(iter(self.bindings.items()))
+            if binding.seen >= horizon:
+                break
+            del self.bindings[client_id]
+        while self.peers:
+            to, peers = next(iter(self.peers.items()))
+            while peers and next(iter(peers.values())) < horizon:
+                peers.popitem(last=False)
+            if peers:
+                break
+            del self.peers[to]
+
+    def __alert(self, kind: str, client_id: str, detail: str) -> None:
+        self.alerts[kind] += 1
+        self.on_alert(Alert(kind, client_id, self.source, self.lines, self.__t, detail))
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def summary(self, elapsed: float) -> str:
+        rate = self.lines / elapsed if elapsed > 0 else 0.0
+        mb_s = self.bytes / elapsed / 1e6 if elapsed > 0 else 0.0
+        alerts = " ".join(f"{kind}={n}" for kind, n in self.alerts.items())
+        return (f"[*] {self.source}: {self.lines} line(s), {self.events} event(s), "
+                f"{alerts}; tracking {len(self.bindings)} binding(s), "
+                f"{len(self.peers)} peer set(s), evicted={self.evicted}; "
+                f"{rate:,.0f} lines/s, {mb_s:.1f} MB/s")
+
+
+# ---------------------------------------------------------------------------
+# Command-line interface
+# ---------------------------------------------------------------------------
+
+class _Tail:
+    """
+    Incremental reader of a growing file that is reopened when it is
+    rotated or truncated.
+    """
+
+    def __init__(self, path: str, from_end: bool) -> None:
+        self.path = path
+        self.file: Optional[TextIO] = None
+        self.partial = ""
+        self.__open(from_end)
+
+    def __open(self, from_end: bool) -> None:
+        try:
+            self.file = open(self.path, "r", encoding="utf-8", errors="replace")
+        except OSError:
+            self.file = None
+            return
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        if from_end:
+            self.file.seek(0, os.SEEK_END)
+
+    def read_lines(self) -> List[str]:
+        if self.file is None:
+            self.__open(False)
+            if self.file is None:
+                return []
+        chunk = self.file.read()
+        if not chunk:
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                return []
+            if st.st_ino != self.inode or st.st_size < self.file.tell():
+                self.file.close()
+                self.__open(False)
+            return []
+        lines = (self.partial + chunk).split("\n")
+        self.partial = lines.pop()
+        return [line + "\n" for line in lines]
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m common.regwatch",
+        description="Detect clientId re-registrations (hijacks) in signaling logs.",
+    )
+    parser.add_argument("logs", nargs="+",
+                        help="server.js output, proxy / attacker logs or JSONL captures; '-' for stdin")
+    parser.add_argument("--follow", action="store_true",
+                        help="Keep reading the files as they grow (like tail -f)")
+    parser.add_argument("--from-end", action="store_true",
+                        help="With --follow, skip what the files already contain")
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW,
+                        help=f"Seconds a binding / peer is remembered without activity "
+                             f"(default: {DEFAULT_WINDOW:.0f})")
+    parser.add_argument("--max-clients", type=int, default=DEFAULT_MAX_CLIENTS,
+                        help=f"Ids tracked at most (default: {DEFAULT_MAX_CLIENTS})")
+    parser.add_argument("--stats-interval", type=float, default=0.0,
+                        help="Print throughput every N seconds while reading (default: off)")
+    args = parser.parse_args(argv)
+
+    watchers = [RegWatch("stdin" if path == "-" else path, args.window, args.max_clients)
+                for path in args.logs]
+    t0 = last_stats = time.perf_counter()
+
+    def report(force: bool = False) -> None:
+        nonlocal last_stats
+        now = time.perf_counter()
+        if force or (args.stats_interval and now - last_stats >= args.stats_interval):
+            last_stats = now
+            for watcher in watchers:
+                print(watcher.summary(now - t0), file=sys.stderr)
+
+    try:
+        if not args.follow or args.logs == ["-"]:
+            for path, watcher in zip(args.logs, watchers):
+                stream = sys.stdin if path == "-" else open(path, "r", encoding="utf-8", errors="replace")
+                with stream:
+                    for line in stream:
+                        watcher.feed(line)
+                        if args.stats_interval and watcher.lines % 4096 == 0:
+                            report()
+        else:
+            tails = [_Tail(path, args.from_end) for path in args.logs]
+            while True:
+                idle = True
+                for tail, watcher in zip(tails, watchers):
+                    for line in tail.read_lines():
+                        watcher.feed(line)
+                        idle = False
+                report()
+                if idle:
+                    time.sleep(0.2)
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"[!] {e}", file=sys.stderr)
+        return 2
+
+    report(force=True)
+    return 1 if any(sum(w.alerts.values()) for w in watchers) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,637 @@
+"""
+sdp.py
+
+SDP parser and offer/answer analyzer for captured signaling traffic.
+
+parse(sdp) turns an offer or answer into a SessionDescription:
+
+  - session level: origin, BUNDLE groups, msid-semantic;
+  - one MediaSection per m= line: kind, port, protocol, mid, direction,
+    codecs (payload type, rtpmap, fmtp, rtcp-fb) in m= line order, header
+    extensions, SSRCs, rtcp-mux;
+  - transport per media section: ICE ufrag / pwd, a=fingerprint, a=setup
+    (session-level values are inherited where a section has none) and
+    the a=candidate lines, parsed by parse_candidate(), which also takes
+    the "candidate:..." strings of trickled "ice" messages.
+
+The parsed objects are immutable and parse() caches them by SDP text: the
+same offer shows up several times in a capture (the client's copy, the
+server's forwarded copy, attacker.log and proxy.log), and is parsed once.
+
+diff(offer, answer) pairs the m= lines of an answer with the offer's (they
+are in the same order, RFC 3264) and reports which codecs were accepted or
+dropped, rejected sections, direction and DTLS role negotiation, and
+BUNDLE changes.
+
+Usage (from part2_attack/):
+
+    python -m common.sdp summary ../ws-proxy/proxy.log
+    python -m common.sdp diff ../ws-proxy/proxy.log
+    python -m common.sdp candidates attacker/attacker.log --client client-a
+"""
+
+import argparse
+import functools
+import json
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from common.logindex import LogIndex
+
+# Distinct SDPs kept by parse().
+CACHE_SIZE = 512
+
+DIRECTIONS = ("sendrecv", "sendonly", "recvonly", "inactive")
+
+
+@dataclass(frozen=True)
+class Candidate:
+    """
+    One ICE candidate (RFC 8445 / 8839 grammar).
+
+    Attributes:
+        foundation, component, transport, priority : As on the wire
+        address, port : Connection address of the candidate
+        type          : host, srflx, prflx or relay
+        related_address, related_port : raddr / rport, if present
+        extensions    : Remaining name/value pairs (generation, ufrag, tcptype, ...)
+    """
+    foundation: str
+    component: int
+    transport: str
+    priority: int
+    address: str
+    port: int
+    type: str
+    related_address: Optional[str] = None
+    related_port: Optional[int] = None
+    extensions: Tuple[Tuple[str, str], ...] = ()
+
+    def __str__(self) -> str:
+        text = f"{self.type} {self.transport.lower()} {self.address}:{self.port}"
+        if self.related_address is not None:
+            text += f" (from {self.related_address}:{self.related_port})"
+        return text
+
+
+@dataclass(frozen=True)
+class Codec:
+    """
+    One payload type of a media section.
+
+    Attributes:
+        payload_type : RTP payload type
+        name         : Encoding name from a=rtpmap ("" if there is none)
+        clock_rate   : Clock rate from a=rtpmap (0 if there is none)
+        channels     : Channel count for audio codecs, if given
+        fmtp         : a=fmtp parameters ("" if none)
+        feedback     : a=rtcp-fb values
+    """
+    payload_type: int
+    name: str = ""
+    clock_rate: int = 0
+    channels: Optional[int] = None
+    fmtp: str = ""
+    feedback: Tuple[str, ...] = ()
+
+    @property
+    def key(self) -> Tuple[str, int, Optional[int]]:
+        return (self.name.lower(), self.clock_rate, self.channels)
+
+    def __str__(self) -> str:
+        text = f"{self.payload_type} {self.name or '?'}/{self.clock_rate}"
+        if self.channels:
+            text += f"/{self.channels}"
+        return text
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    algorithm: str
+    value: str
+
+    def __str__(self) -> str:
+        return f"{self.algorithm} {self.value}"
+
+
+@dataclass(frozen=True)
+class MediaSection:
+    """
+    One m= section.
+
+    Attributes:
+        kind       : audio, video or application
+        port       : Port of the m= line (0 = rejected / disabled)
+        protocol   : e.g. UDP/TLS/RTP/SAVPF
+        formats    : Payload types / formats in m= line order
+        mid        : a=mid
+        direction  : sendrecv, sendonly, recvonly or inactive
+        codecs     : One Codec per RTP payload type, in m= line order
+        extmap     : (id, URI) header extensions
+        ssrcs      : Distinct SSRCs announced with a=ssrc
+        msid       : a=msid
+        rtcp_mux   : True if a=rtcp-mux is present
+        ice_ufrag, ice_pwd, fingerprint, setup : Transport parameters,
+                     inherited from the session level if not set here
+        candidates : a=candidate lines
+        end_of_candidates : True if a=end-of-candidates is present
+    """
+    kind: str
+    port: int
+    protocol: str
+    formats: Tuple[str, ...]
+    mid: Optional[str] = None
+    direction: str = "sendrecv"
+    codecs: Tuple[Codec, ...] = ()
+    extmap: Tuple[Tuple[int, str], ...] = ()
+    ssrcs: Tuple[int, ...] = ()
+    msid: Optional[str] = None
+    rtcp_mux: bool = False
+    ice_ufrag: Optional[str] = None
+    ice_pwd: Optional[str] = None
+    fingerprint: Optional[Fingerprint] = None
+    setup: Optional[str] = None
+    candidates: Tuple[Candidate, ...] = ()
+    end_of_candidates: bool = False
+
+    @property
+    def rejected(self) -> bool:
+        return self.port == 0
+
+
+@dataclass(frozen=True)
+class SessionDescription:
+    """
+    A parsed offer or answer.
+
+    Attributes:
+        origin        : o= line fields (username, session id, version, ...)
+        bundle        : a=group:BUNDLE groups, as tuples of mids
+        msid_semantic : a=msid-semantic value
+        media         : The media sections, in order
+    """
+    origin: Tuple[str, ...]
+    bundle: Tuple[Tuple[str, ...], ...]
+    msid_semantic: Optional[str]
+    media: Tuple[MediaSection, ...]
+
+    @property
+    def candidates(self) -> Tuple[Candidate, ...]:
+        return tuple(c for m in self.media for c in m.candidates)
+
+    @property
+    def fingerprints(self) -> Tuple[Fingerprint, ...]:
+        seen = []
+        for m in self.media:
+            if m.fingerprint is not None and m.fingerprint not in seen:
+                seen.append(m.fingerprint)
+        return tuple(seen)
+
+    def summary(self) -> str:
+        """
+        Multi-line human-readable description.
+        """
+        lines = []
+        if self.bundle:
+            lines.append("BUNDLE " + "; ".join(" ".join(g) for g in self.bundle))
+        for fp in self.fingerprints:
+            lines.append(f"fingerprint {fp}")
+        for m in self.media:
+            head = f"m={m.kind} mid={m.mid} {m.direction}"
+            if m.rejected:
+                head += " (rejected)"
+            lines.append(head + f" setup={m.setup} ufrag={m.ice_ufrag}")
+            if m.codecs:
+                lines.append("  codecs: " + ", ".join(str(c) for c in m.codecs))
+            if m.ssrcs:
+                lines.append("  ssrcs: " + " ".join(str(s) for s in m.ssrcs))
+            for c in m.candidates:
+                lines.append(f"  candidate: {c}")
+        return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+def parse_candidate(text: str) -> Candidate:
+    """
+    Parse "a=candidate:...", "candidate:..." or the bare attribute value.
+    Raises ValueError if the mandatory fields are missing.
+    """
+    if text.startswith("a="):
+        text = text[2:]
+    if text.startswith("candidate:"):
+        text = text[len("candidate:"):]
+    parts = text.split()
+    if len(parts) < 8 or parts[6] != "typ":
+        raise ValueError(f"not an ICE candidate: {text!r}")
+    pairs = dict(zip(parts[8::2], parts[9::2]))
+    related_port = pairs.pop("rport", None)
+    return Candidate(
+        foundation=parts[0],
+        component=int(parts[1]),
+        transport=parts[2],
+        priority=int(parts[3]),
+        address=parts[4],
+        port=int(parts[5]),
+        type=parts[7],
+        related_address=pairs.pop("raddr", None),
+        related_port=int(related_port) if related_port is not None else None,
+        extensions=tuple(pairs.items()),
+    )
+
+
+def parse(sdp: str) -> SessionDescription:
+    """
+    Parse an SDP. Results are cached by content (see CACHE_SIZE); the
+    returned objects are shared and immutable. Raises ValueError for a
+    malformed m= line.
+    """
+    return _parse_cached(sdp)
+
+
+def cache_info():
+    """
+    Hit / miss counters of the parse() cache (functools.lru_cache).
+    """
+    return _parse_cached.cache_info()
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _parse_cached(sdp: str) -> SessionDescription:
+    session: Dict[str, object] = {"bundle": [], "origin": (), "msid_semantic": None}
+    media: List[Dict[str, object]] = []
+    current = session
+
+    for line in sdp.split("\n"):
+        line = line.rstrip("\r")
+        if len(line) < 2 or line[1] != "=":
+            continue
+        kind, value = line[0], line[2:]
+
+        if kind == "m":
+            fields = value.split()
+            if len(fields) < 3:
+                raise ValueError(f"malformed m= line: {line!r}")
+            current = {
+                "kind": fields[0], "port": int(fields[1]), "protocol": fields[2],
+                "formats": tuple(fields[3:]), "rtpmap": {}, "fmtp": {}, "rtcp_fb": {},
+                "extmap": [], "ssrcs": [], "candidates": [],
+            }
+            media.append(current)
+            continue
+        if kind == "o":
+            session["origin"] = tuple(value.split())
+            continue
+        if kind != "a":
+            continue
+
+        name, _, arg = value.partition(":")
+        if name in DIRECTIONS:
+            current["direction"] = name
+        elif name in ("ice-ufrag", "ice-pwd", "setup", "mid", "msid"):
+            current[name.replace("-", "_")] = arg
+        elif name == "fingerprint":
+            algorithm, _, fp = arg.partition(" ")
+            current["fingerprint"] = Fingerprint(algorithm.lower(), fp.strip().upper())
+        elif name == "candidate" and current is not session:
+            try:
+                current["candidates"].append(parse_candidate(arg))
+            except ValueError:
+                pass
+        elif current is session:
+            if name == "group" and arg.startswith("BUNDLE"):
+                session["bundle"].append(tuple(arg.split()[1:]))
+            elif name == "msid-semantic":
+                session["msid_semantic"] = arg.strip()
+        elif name == "rtpmap":
+            pt, _, encoding = arg.partition(" ")
+            current["rtpmap"][pt] = encoding
+        elif name == "fmtp":
+            pt, _, params = arg.partition(" ")
+            current["fmtp"][pt] = params
+        elif name == "rtcp-fb":
+            pt, _, fb = arg.partition(" ")
+            current["rtcp_fb"].setdefault(pt, []).append(fb)
+        elif name == "extmap":
+            ext_id, _, uri = arg.partition(" ")
+            current["extmap"].append((int(ext_id.split("/")[0]), uri))
+        elif name == "ssrc":
+            ssrc = int(arg.split(" ", 1)[0])
+            if ssrc not in current["ssrcs"]:
+                current["ssrcs"].append(ssrc)
+        elif name == "rtcp-mux":
+            current["rtcp_mux"] = True
+        elif name == "end-of-candidates":
+            current["end_of_candidates"] = True
+
+    return SessionDescription(
+        origin=session["origin"],
+        bundle=tuple(session["bundle"]),
+        msid_semantic=session["msid_semantic"],
+        media=tuple(_build_media(m, session) for m in media),
+    )
+
+
+def _build_media(m: Dict[str, object], session: Dict[str, object]) -> MediaSection:
+    codecs = []
+    if "RTP" in m["protocol"]:
+        for pt in m["formats"]:
+            if not pt.isdigit():
+                continue
+            name, clock_rate, channels = "", 0, None
+            encoding = m["rtpmap"].get(pt)
+            if encoding:
+                parts = encoding.split("/")
+                name = parts[0]
+                clock_rate = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+                channels = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else None
+            codecs.append(Codec(int(pt), name, clock_rate, channels,
+                                m["fmtp"].get(pt, ""), tuple(m["rtcp_fb"].get(pt, ()))))
+    return MediaSection(
+        kind=m["kind"],
+        port=m["port"],
+        protocol=m["protocol"],
+        formats=m["formats"],
+        mid=m.get("mid"),
+        direction=m.get("direction", "sendrecv"),
+        codecs=tuple(codecs),
+        extmap=tuple(m["extmap"]),
+        ssrcs=tuple(m["ssrcs"]),
+        msid=m.get("msid"),
+        rtcp_mux=m.get("rtcp_mux", False),
+        ice_ufrag=m.get("ice_ufrag", session.get("ice_ufrag")),
+        ice_pwd=m.get("ice_pwd", session.get("ice_pwd")),
+        fingerprint=m.get("fingerprint", session.get("fingerprint")),
+        setup=m.get("setup", session.get("setup")),
+        candidates=tuple(m["candidates"]),
+        end_of_candidates=m.get("end_of_candidates", False),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Offer / answer diff
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class MediaDiff:
+    """
+    How one offered m= section was answered.
+
+    Attributes:
+        index        : Position of the m= line
+        kind, mid    : From the offer
+        rejected     : The answer set the port to 0
+        accepted     : Offered codecs present in the answer (answer order)
+        dropped      : Offered codecs missing from the answer
+        unexpected   : Answer codecs that were never offered
+        direction    : (offered, answered)
+        setup        : (offered, answered) DTLS roles
+        same_fingerprint : Both sides use the same certificate fingerprint
+        candidates   : (offered, answered) number of a=candidate lines
+    """
+    index: int
+    kind: str
+    mid: Optional[str]
+    rejected: bool
+    accepted: Tuple[Codec, ...]
+    dropped: Tuple[Codec, ...]
+    unexpected: Tuple[Codec, ...]
+    direction: Tuple[str, str]
+    setup: Tuple[Optional[str], Optional[str]]
+    same_fingerprint: bool
+    candidates: Tuple[int, int]
+
+
+@dataclass(frozen=True)
+class SessionDiff:
+    """
+    Result of diff(offer, answer).
+
+    Attributes:
+        media      : One MediaDiff per m= line present in both
+        bundle     : (offered, answered) BUNDLE groups
+        unanswered : m= lines of the offer missing from the answer
+        extra      : m= lines of the answer beyond the offer's
+    """
+    media: Tuple[MediaDiff, ...]
+    bundle: Tuple[Tuple[Tuple[str, ...], ...], Tuple[Tuple[str, ...], ...]]
+    unanswered: int
+    extra: int
+
+    def summary(self) -> str:
+        lines = []
+        offered, answered = self.bundle
+        if offered != answered:
+            lines.append(f"BUNDLE {_groups(offered)} -> {_groups(answered)}")
+        for d in self.media:
+            head = f"m={d.kind} mid={d.mid}"
+            if d.rejected:
+                lines.append(head + ": rejected")
+                continue
+            lines.append(f"{head}: {d.direction[0]} -> {d.direction[1]}, "
+                         f"setup {d.setup[0]} -> {d.setup[1]}, "
+                         f"candidates {d.candidates[0]} -> {d.candidates[1]}")
+            lines.append("  accepted: " + (", ".join(str(c) for c in d.accepted) or "none"))
+            if d.dropped:
+                lines.append("  dropped:  " + ", ".join(str(c) for c in d.dropped))
+            if d.unexpected:
+                lines.append("  [!] not offered: " + ", ".join(str(c) for c in d.unexpected))
+            if d.same_fingerprint:
+                lines.append("  [!] answer reuses the offer's DTLS fingerprint")
+        if self.unanswered:
+            lines.append(f"[!] {self.unanswered} offered m= line(s) missing from the answer")
+        if self.extra:
+            lines.append(f"[!] {self.extra} answer m= line(s) beyond the offer")
+        return "\n".join(lines)
+
+
+def diff(offer: SessionDescription, answer: SessionDescription) -> SessionDiff:
+    media = []
+    for index, (o, a) in enumerate(zip(offer.media, answer.media)):
+        matched = _match_codecs(o.codecs, a.codecs)
+        media.append(MediaDiff(
+            index=index,
+            kind=o.kind,
+            mid=o.mid,
+            rejected=a.rejected,
+            accepted=tuple(c for c in a.codecs if id(c) in matched.values()),
+            dropped=tuple(c for c in o.codecs if id(c) not in matched),
+            unexpected=tuple(c for c in a.codecs if id(c) not in matched.values()),
+            direction=(o.direction, a.direction),
+            setup=(o.setup, a.setup),
+            same_fingerprint=o.fingerprint is not None and o.fingerprint == a.fingerprint,
+            candidates=(len(o.candidates), len(a.candidates)),
+        ))
+    return SessionDiff(
+        media=tuple(media),
+        bundle=(offer.bundle, answer.bundle),
+        unanswered=max(0, len(offer.media) - len(answer.media)),
+        extra=max(0, len(answer.media) - len(offer.media)),
+    )
+
+
+def _match_codecs(offered: Tuple[Codec, ...], answered: Tuple[Codec, ...]) -> Dict[int, int]:
+    """
+    Map id(offered codec) -> id(answer codec). Answers normally keep the
+    offered payload type; otherwise name / clock rate / channels decide
+    (fmtp is not compared: an answer may legitimately change parameters).
+    """
+    by_pt = {c.payload_type: c for c in answered}
+    matched: Dict[int, int] = {}
+    used = set()
+    for c in offered:
+        a = by_pt.get(c.payload_type)
+        if a is not None and a.key == c.key:
+            matched[id(c)] = id(a)
+            used.add(id(a))
+    for c in offered:
+        if id(c) in matched:
+            continue
+        for a in answered:
+            if id(a) not in used and a.key == c.key:
+                matched[id(c)] = id(a)
+                used.add(id(a))
+                break
+    return matched
+
+
+def _groups(groups) -> str:
+    return "; ".join(" ".join(g) for g in groups) or "none"
+
+
+# ---------------------------------------------------------------------------
+# Command-line interface
+# ---------------------------------------------------------------------------
+
+@dataclass
+class CapturedSdp:
+    """
+    An offer or answer found in a capture.
+    """
+    entry: int
+    direction: str
+    type: str
+    to: Optional[str]
+    from_: Optional[str]
+    sdp: str
+
+
+def load_sdps(index: LogIndex, client: Optional[str] = None) -> List[CapturedSdp]:
+    """
+    Return the offers and answers of a capture, in file order (each SDP is
+    parsed, and so cached, on the way; unparseable ones are skipped).
+    """
+    entries = sorted(index.query(msg_type="offer", client=client)
+                     + index.query(msg_type="answer", client=client))
+    found = []
+    for n, raw in zip(entries, index.iter_raw(entries)):
+        try:
+            sdp = json.loads(raw).get("sdp")
+        except (ValueError, AttributeError):
+            continue
+        if not isinstance(sdp, str):
+            continue
+        try:
+            parse(sdp)
+        except ValueError as e:
+            print(f"[!] #{n}: unparseable SDP ({e}); skipped.", file=sys.stderr)
+            continue
+        found.append(CapturedSdp(n, index.direction[n], index.type[n],
+                                 index.to[n], index.from_[n], sdp))
+    return found
+
+
+def pair_offers(sdps: List[CapturedSdp]) -> List[Tuple[CapturedSdp, CapturedSdp]]:
+    """
+    Pair every distinct answer with the offer it answers: the latest
+    earlier offer addressed to the answering client (or, for client-side
+    copies without "from", sent by the client the answer goes to).
+    """
+    pairs = []
+    seen = set()
+    offers: List[CapturedSdp] = []
+    for s in sdps:
+        if s.type == "offer":
+            offers.append(s)
+            continue
+        for o in reversed(offers):
+            if (s.from_ is not None and o.to == s.from_) or \
+                    (o.from_ is not None and o.from_ == s.to) or \
+                    (s.from_ is None and o.from_ is None and o.to != s.to):
+                if (o.sdp, s.sdp) not in seen:
+                    seen.add((o.sdp, s.sdp))
+                    pairs.append((o, s))
+                break
+    return pairs
+
+
+def _describe(s: CapturedSdp) -> str:
+    return (f"#{s.entry} [{s.direction}] {s.type} "
+            f"from={s.from_ or '-'} to={s.to or '-'}")
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m common.sdp",
+        description="Parse and compare the SDP offers and answers in a signaling capture.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (
+        ("summary", "Describe every distinct offer and answer."),
+        ("diff", "Compare each answer with the offer it answers."),
+        ("candidates", "List ICE candidates from SDPs and trickled 'ice' messages."),
+    ):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("log", help="attacker.log, proxy.log or a JSONL capture.")
+        p.add_argument("--client", help="Only messages to or from this clientId.")
+
+    args = parser.parse_args(argv)
+    index = LogIndex.open(args.log)
+
+    t0 = time.perf_counter()
+    sdps = load_sdps(index, args.client)
+    info = cache_info()
+    print(f"[*] {args.log}: {len(sdps)} SDP(s), {info.currsize} distinct, "
+          f"parsed in {(time.perf_counter() - t0) * 1e3:.1f} ms.", file=sys.stderr)
+
+    if args.command == "summary":
+        printed = set()
+        for s in sdps:
+            if s.sdp in printed:
+                print(f"{_describe(s)}: same as above")
+                continue
+            printed.add(s.sdp)
+            print(_describe(s))
+            print("  " + parse(s.sdp).summary().replace("\n", "\n  "))
+
+    elif args.command == "diff":
+        pairs = pair_offers(sdps)
+        if not pairs:
+            print("[*] No offer/answer pairs in this capture.", file=sys.stderr)
+        for offer, answer in pairs:
+            print(f"{_describe(offer)}  ->  {_describe(answer)}")
+            result = diff(parse(offer.sdp), parse(answer.sdp))
+            print("  " + result.summary().replace("\n", "\n  "))
+
+    elif args.command == "candidates":
+        for s in sdps:
+            for c in parse(s.sdp).candidates:
+                print(f"#{s.entry} {s.type} from={s.from_ or '-'} to={s.to or '-'}: {c}")
+        entries = index.query(msg_type="ice", client=args.client)
+        for n, raw in zip(entries, index.iter_raw(entries)):
+            try:
+                text = json.loads(raw).get("candidate", {}).get("candidate")
+                c = parse_candidate(text)
+            except (ValueError, AttributeError, TypeError):
+                continue
+            print(f"#{n} ice from={index.from_[n] or '-'} to={index.to[n] or '-'}: {c}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,403 @@
+"""
+signaling_client.py
+
+Single-reader client for the signaling WebSocket.
+
+Reading ws.recv() inline and handling each message before reading the next
+means a slow step (e.g. `await pc.addIceCandidate()`) delays every message
+behind it. SignalingClient instead runs one reader task that:
+
+  - decodes each frame once (common.codec.decode; the server forwards a
+    frame only to its addressee, so nearly every frame is kept and reading
+    the routing fields first would only add work),
+  - drops frames the optional `accept` filter rejects (e.g. frames
+    addressed to another client) with a one-line note; only frames that
+    are kept are logged in full,
+  - routes the rest by "type" through a dispatch table:
+      * types with a handler registered via on() go to that type's queue,
+        drained by a dedicated worker task that awaits the handler -- a slow
+        handler only delays later messages of the same type;
+      * the other known types (QUEUED_TYPES) wait in their queue until
+        someone calls recv(type, ...);
+      * anything else is logged and dropped.
+
+The reader never awaits a handler, so time-critical messages (an answer,
+an error) are read as soon as they arrive. Per type, the client counts
+messages, tracks the queue depth (current / max), the time messages spent
+queued and the handler latency (common.metrics.LatencyHistogram).
+
+Outbound frames go through one ordered queue drained by a single writer
+task: send() and post() append and wake the writer, which writes
+everything queued since it last ran in one pass (a burst of ICE candidates
+costs one wake-up, not one task per frame). When `max_outbound` frames are
+waiting -- the socket is slow -- send() waits for room; post(), for sync
+callbacks that cannot wait, queues anyway and counts the overrun. Send
+latency (queued to written) and failures are recorded; a failure is raised
+in the caller awaiting send(), or logged for post().
+
+    client = SignalingClient(ws, log=log)
+    client.start()
+    await client.send({"type": "register", "clientId": "client-b"})
+    client.post(candidate_message)    # from a sync callback; not awaited
+    reply = await client.recv("registered", "error")
+    client.on("ice", handle_ice)
+    await client.wait_closed()
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from websockets.exceptions import ConnectionClosed
+
+from common.codec import Frame, decode
+from common.metrics import LatencyHistogram, format_summary
+
+# Message types that are kept for recv() when no handler is registered.
+QUEUED_TYPES = ("registered", "offer", "answer", "ice", "error")
+
+# Types the server forwards between peers; their "to" names the recipient.
+ROUTED_TYPES = ("offer", "answer", "ice")
+
+# Messages kept per type before the oldest is dropped (a peer that keeps
+# sending candidates nobody consumes must not grow memory without bound).
+DEFAULT_MAX_QUEUE = 1000
+
+# Outbound frames waiting for the writer before send() applies backpressure.
+DEFAULT_MAX_OUTBOUND = 256
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+def _text(raw) -> str:
+    """
+    A frame as log text (binary frames are UTF-8 JSON, not a b'...' repr).
+    """
+    return raw if isinstance(raw, str) else bytes(raw).decode("utf-8", "replace")
+
+
+class _TypeQueue:
+    def __init__(self) -> None:
+        # (sequence number, enqueue time, frame)
+        self.items: Deque[Tuple[int, float, Frame]] = deque()
+        self.handler: Optional[Handler] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.received = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.wait = LatencyHistogram()
+        self.handler_latency = LatencyHistogram()
+
+
+class SignalingClient:
+    """
+    One reader task, typed dispatch, per-type queues.
+
+    Parameters
+    ----------
+    ws :
+        An open websockets connection.
+
+    log : Callable[[str], None]
+        Receives the raw-frame log lines and handler errors.
+
+    max_queue : int
+        Messages kept per type before the oldest is dropped.
+
+    max_outbound : int
+        Outbound frames queued before send() waits for the writer.
+
+    accept : Optional[Callable[[Frame], bool]]
+        Decides from the routing fields whether a frame is kept; rejected
+        frames are counted.
+    """
+
+    def __init__(self, ws, log: Callable[[str], None] = print,
+                 max_queue: int = DEFAULT_MAX_QUEUE,
+                 max_outbound: int = DEFAULT_MAX_OUTBOUND,
+                 accept: Optional[Callable[[Frame], bool]] = None) -> None:
+        self.ws = ws
+        self.log = log
+        self.max_queue = max_queue
+        self.max_outbound = max_outbound
+        self.accept = accept
+        self.queues: Dict[str, _TypeQueue] = {t: _TypeQueue() for t in QUEUED_TYPES}
+        self.invalid = 0
+        self.ignored = 0
+        self.filtered = 0
+
+        # Outbound metrics
+        self.sent = 0
+        self.send_failures = 0
+        self.send_blocked = 0
+        self.post_overruns = 0
+        self.writer_wakeups = 0
+        self.outbound_max_depth = 0
+        self.send_latency = LatencyHistogram()
+
+        # (enqueue time, text, future or None)
+        self.__outbox: Deque[Tuple[float, str, Optional[asyncio.Future]]] = deque()
+        self.__outbox_wake = asyncio.Event()
+        self.__outbox_room = asyncio.Event()
+        self.__outbox_room.set()
+        self.__writer: Optional[asyncio.Task] = None
+
+        self.__seq = 0
+        self.__changed = asyncio.Condition()
+        self.__reader: Optional[asyncio.Task] = None
+        self.__closed: Optional[ConnectionClosed] = None
+        self.__done = asyncio.Event()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        if self.__reader is None:
+            self.__reader = asyncio.ensure_future(self.__read())
+        if self.__writer is None:
+            self.__writer = asyncio.ensure_future(self.__write())
+
+    async def close(self) -> None:
+        """
+        Stop the reader, the writer and the handler workers (the connection
+        itself is left to its owner). Frames still queued are failed.
+        """
+        tasks = [q.worker for q in self.queues.values() if q.worker is not None]
+        tasks += [t for t in (self.__reader, self.__writer) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.__fail_outbox(self.__closed or ConnectionClosed(None, None))
+
+    async def wait_closed(self) -> ConnectionClosed:
+        """
+        Wait until the connection is closed and every handler has processed
+        its queue. Returns the ConnectionClosed exception.
+        """
+        await self.__done.wait()
+        workers = [q.worker for q in self.queues.values() if q.worker is not None]
+        await asyncio.gather(*workers, return_exceptions=True)
+        return self.__closed
+
+    # ------------------------------------------------------------------
+    # Sending / receiving
+    # ------------------------------------------------------------------
+
+    async def send(self, message: dict) -> str:
+        """
+        Queue `message` behind everything sent before it, wait until it has
+        been written and return its JSON text. Waits for room first when
+        the outbound queue is full; raises if writing fails.
+        """
+        if len(self.__outbox) >= self.max_outbound:
+            self.send_blocked += 1
+            while len(self.__outbox) >= self.max_outbound:
+                self.__outbox_room.clear()
+                await self.__outbox_room.wait()
+        future = asyncio.get_running_loop().create_future()
+        text = self.__enqueue(message, future)
+        await future
+        return text
+
+    def post(self, message: dict) -> str:
+        """
+        Queue `message` without waiting and return its JSON text. For sync
+        callbacks; a failed write is counted and logged, not raised.
+        """
+        if self.__closed is not None:
+            self.send_failures += 1
+            self.log(f"[!] Not sending signaling message; connection closed: {self.__closed!r}")
+            return json.dumps(message)
+        if len(self.__outbox) >= self.max_outbound:
+            self.post_overruns += 1
+        return self.__enqueue(message, None)
+
+    async def recv(self, *types: str, timeout: Optional[float] = None) -> dict:
+        """
+        Return the oldest queued message of any of `types`. Raises the
+        ConnectionClosed exception once the connection is gone and nothing
+        of those types is left.
+        """
+        async def take() -> dict:
+            async with self.__changed:
+                while True:
+                    best = None
+                    for t in types:
+                        q = self.queues.get(t)
+                        if q is not None and q.items and (best is None or q.items[0][0] < best.items[0][0]):
+                            best = q
+                    if best is not None:
+                        _, queued_at, frame = best.items.popleft()
+                        best.wait.record(time.perf_counter() - queued_at)
+                        return frame.body
+                    if self.__closed is not None:
+                        raise self.__closed
+                    await self.__changed.wait()
+
+        if timeout is None:
+            return await take()
+        return await asyncio.wait_for(take(), timeout)
+
+    def on(self, msg_type: str, handler: Handler) -> None:
+        """
+        Process every `msg_type` message (including already queued ones)
+        with `handler`, in order, in a worker task of its own.
+        """
+        q = self.queues.setdefault(msg_type, _TypeQueue())
+        q.handler = handler
+        if q.worker is None:
+            q.worker = asyncio.ensure_future(self.__run_handler(q))
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    def depth(self, msg_type: str) -> int:
+        q = self.queues.get(msg_type)
+        return len(q.items) if q is not None else 0
+
+    def stats(self) -> str:
+        lines = []
+        for name, q in self.queues.items():
+            if not q.received:
+                continue
+            line = (f"{name}: received={q.received} depth={len(q.items)} "
+                    f"max_depth={q.max_depth} dropped={q.dropped}")
+            if q.wait.count:
+                line += "; " + format_summary("queued", q.wait)
+            if q.handler_latency.count:
+                line += "; " + format_summary("handler", q.handler_latency)
+            lines.append(line)
+        if self.invalid or self.ignored or self.filtered:
+            lines.append(f"invalid={self.invalid} ignored={self.ignored} "
+                         f"filtered={self.filtered}")
+        if self.sent or self.send_failures:
+            line = (f"outbound: sent={self.sent} failed={self.send_failures} "
+                    f"writer_wakeups={self.writer_wakeups} depth={len(self.__outbox)} "
+                    f"max_depth={self.outbound_max_depth} blocked={self.send_blocked} "
+                    f"overruns={self.post_overruns}")
+            if self.send_latency.count:
+                line += "; " + format_summary("send", self.send_latency)
+            lines.append(line)
+        return "\n".join(lines) or "no messages"
+
+    # ------------------------------------------------------------------
+
+    async def __read(self) -> None:
+        try:
+            async for raw in self.ws:
+                frame = decode(raw)
+                if frame is None:
+                    self.invalid += 1
+                    self.log(f"[!] Non-JSON signaling message received; ignoring: {_text(raw)}")
+                    continue
+
+                q = self.queues.get(frame.type)
+                if q is None:
+                    self.ignored += 1
+                    self.log(f"[*] Ignoring signaling message of type '{frame.type}'.")
+                    continue
+                if self.accept is not None and not self.accept(frame):
+                    self.filtered += 1
+                    self.log(f"[*] Ignoring signaling message type='{frame.type}', "
+                             f"to='{frame.to}'.")
+                    continue
+                self.log(f"[S → C] Raw signaling message: {_text(raw)}")
+
+                self.__seq += 1
+                q.received += 1
+                if len(q.items) >= self.max_queue:
+                    q.items.popleft()
+                    q.dropped += 1
+                q.items.append((self.__seq, time.perf_counter(), frame))
+                q.max_depth = max(q.max_depth, len(q.items))
+                async with self.__changed:
+                    self.__changed.notify_all()
+            # `async for` ends quietly on a normal close; recv() reports it.
+            await self.ws.recv()
+        except ConnectionClosed as e:
+            self.__closed = e
+        finally:
+            if self.__closed is None:
+                self.__closed = ConnectionClosed(None, None)
+            async with self.__changed:
+                self.__changed.notify_all()
+            self.__done.set()
+            # Fail what is queued here too: the writer may already have
+            # exited after a failed write, and then nothing else drains it.
+            self.__fail_outbox(self.__closed)
+            self.__outbox_wake.set()
+
+    def __enqueue(self, message: dict, future: Optional[asyncio.Future]) -> str:
+        if self.__closed is not None:
+            raise self.__closed
+        if self.__writer is not None and self.__writer.done():
+            raise ConnectionClosed(None, None)
+        text = json.dumps(message)
+        self.__outbox.append((time.perf_counter(), text, future))
+        self.outbound_max_depth = max(self.outbound_max_depth, len(self.__outbox))
+        self.__outbox_wake.set()
+        return text
+
+    async def __write(self) -> None:
+        while True:
+            await self.__outbox_wake.wait()
+            self.__outbox_wake.clear()
+            if self.__closed is not None:
+                # The reader saw the connection go; nothing can be written.
+                self.__fail_outbox(self.__closed)
+                return
+            self.writer_wakeups += 1
+            # Everything queued since the last pass is written in this one.
+            while self.__outbox:
+                queued_at, text, future = self.__outbox.popleft()
+                self.__outbox_room.set()
+                try:
+                    await self.ws.send(text)
+                except Exception as e:
+                    self.send_failures += 1
+                    if future is not None:
+                        if not future.done():
+                            future.set_exception(e)
+                    else:
+                        self.log(f"[!] Failed to send signaling message: {e!r}")
+                    if isinstance(e, ConnectionClosed):
+                        # The reader may not have seen the close yet; later
+                        # send() / post() calls must fail instead of queueing.
+                        if self.__closed is None:
+                            self.__closed = e
+                        self.__fail_outbox(e)
+                        return
+                    continue
+                self.sent += 1
+                self.send_latency.record(time.perf_counter() - queued_at)
+                if future is not None and not future.done():
+                    future.set_result(None)
+
+    def __fail_outbox(self, error: Exception) -> None:
+        while self.__outbox:
+            _, _, future = self.__outbox.popleft()
+            self.send_failures += 1
+            if future is not None and not future.done():
+                future.set_exception(error)
+        self.__outbox_room.set()
+
+    async def __run_handler(self, q: _TypeQueue) -> None:
+        while True:
+            async with self.__changed:
+                while not q.items:
+                    if self.__closed is not None:
+                        return
+                    await self.__changed.wait()
+                _, queued_at, frame = q.items.popleft()
+            t0 = time.perf_counter()
+            q.wait.record(t0 - queued_at)
+            message = frame.body
+            try:
+                await q.handler(message)
+            except Exception as e:  # a bad message must not stop the worker
+                self.log(f"[!] Handler for '{message.get('type')}' failed: {e!r}")
+            q.handler_latency.record(time.perf_counter() - t0)
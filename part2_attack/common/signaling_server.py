@@ -0,0 +1,318 @@
+"""
+signaling_server.py
+
+Pure-Python asyncio stand-in for Bonus/docker-signaling/server.js.
+
+It speaks the same wire protocol, so attacker.py and interceptor_webrtc.py
+can be exercised (and benchmarked) without Docker or /certs mounts:
+
+  - {"type":"register","clientId":X}  ->  {"type":"registered","clientId":X}
+    The id is bound to the sending connection, silently replacing any
+    previous binding (this is the behaviour the hijack relies on).
+  - Any message with a "to" field is forwarded to the connection bound to
+    that id, with "from" filled in from the sender's registration when the
+    message does not carry one. If the target is not connected the sender
+    gets {"type":"error","reason":"target-unavailable","to":X}.
+  - In secure mode (SERVER_MODE=secure) a register message must carry
+    "token" equal to VALID_TOKEN, otherwise the sender gets
+    {"type":"error","reason":"invalid token"} and is disconnected.
+  - When a connection closes, the binding for its clientId is removed
+    (even if another connection has re-registered that id since; server.js
+    behaves the same way).
+
+Unlike server.js it does not log every message. Instead it keeps per-route
+counters and latency histograms (time from frame receipt until the
+forwarded frame / reply has been handed to the socket).
+
+In-process use (tests, benchmarks):
+
+    async with SignalingServer() as server:      # ephemeral port
+        async with websockets.connect(server.url) as ws:
+            ...
+        print(server.format_stats())
+
+Standalone (from part2_attack/):
+
+    python -m common.signaling_server --port 8080
+    SERVER_MODE=secure VALID_TOKEN=s3cret python -m common.signaling_server
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import websockets
+
+from common.metrics import LatencyHistogram, format_summary
+
+SERVER_MODES = ("insecure", "secure")
+
+# Node's JSON.stringify emits compact JSON; match it byte for byte.
+_SEPARATORS = (",", ":")
+
+
+@dataclass
+class RouteStats:
+    """
+    Counters for one route.
+
+    Routes are "register", "invalid-json", "invalid-token" and, for
+    forwarded messages, "<from> -> <to>" (with "target-unavailable"
+    counted as an error on that route).
+    """
+    messages: int = 0
+    bytes_in: int = 0
+    errors: int = 0
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+
+class SignalingServer:
+    """
+    Asyncio signaling server compatible with server.js.
+
+    Parameters
+    ----------
+    host, port : str, int
+        Listen address. port=0 picks a free ephemeral port; the chosen port
+        is available as `.port` / `.url` after start().
+
+    mode : str
+        "insecure" (default) or "secure".
+
+    valid_token : Optional[str]
+        Token required in secure mode. As in server.js, an unset token
+        matches register messages that carry no token either.
+
+    ssl_context : Optional[ssl.SSLContext]
+        Serve wss:// instead of ws://.
+
+    verbose : bool
+        Print one line per handled message (off by default).
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        mode: str = "insecure",
+        valid_token: Optional[str] = None,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        verbose: bool = False,
+    ) -> None:
+        if mode not in SERVER_MODES:
+            raise ValueError(f"mode must be one of {SERVER_MODES}, got {mode!r}")
+        self.host = host
+        self.port = port
+        self.mode = mode
+        self.valid_token = valid_token
+        self.ssl_context = ssl_context
+        self.verbose = verbose
+
+        self.clients: Dict[str, object] = {}
+        self.routes: Dict[str, RouteStats] = {}
+        self.connections = 0
+        self._server = None
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    @property
+    def url(self) -> str:
+        scheme = "wss" if self.ssl_context is not None else "ws"
+        return f"{scheme}://{self.host}:{self.port}"
+
+    async def start(self) -> "SignalingServer":
+        self._server = await websockets.serve(
+            self._handle, self.host, self.port, ssl=self.ssl_context
+        )
+        # Resolve the actual port when an ephemeral one was requested.
+        sockets = list(self._server.sockets or [])
+        if sockets:
+            self.port = sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "SignalingServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        await asyncio.Future()
+
+    # ------------------------------------------------------------------
+    # Protocol
+    # ------------------------------------------------------------------
+
+    def _route(self, name: str) -> RouteStats:
+        stats = self.routes.get(name)
+        if stats is None:
+            stats = self.routes[name] = RouteStats()
+        return stats
+
+    def _log(self, text: str) -> None:
+        if self.verbose:
+            print(text)
+
+    @staticmethod
+    async def _send(ws, msg: dict) -> bool:
+        try:
+            await ws.send(json.dumps(msg, separators=_SEPARATORS, ensure_ascii=False))
+            return True
+        except websockets.exceptions.ConnectionClosed:
+            return False
+
+    async def _handle(self, ws, *_unused_path) -> None:
+        self.connections += 1
+        client_id: Optional[str] = None
+        self._log("[+] New WebSocket connection")
+
+        try:
+            async for raw in ws:
+                t0 = time.perf_counter()
+                size = len(raw)
+
+                try:
+                    msg = json.loads(raw)
+                except ValueError:
+                    stats = self._route("invalid-json")
+                    stats.messages += 1
+                    stats.bytes_in += size
+                    self._log(f"[-] Invalid JSON: {raw!r}")
+                    continue
+                if not isinstance(msg, dict):
+                    continue
+
+                if msg.get("type") == "register" and msg.get("clientId"):
+                    if self.mode == "secure" and msg.get("token") != self.valid_token:
+                        stats = self._route("invalid-token")
+                        stats.messages += 1
+                        stats.bytes_in += size
+                        self._log(f"[-] Invalid token for: {msg['clientId']}")
+                        await self._send(ws, {"type": "error", "reason": "invalid token"})
+                        stats.latency.record(time.perf_counter() - t0)
+                        await ws.close()
+                        return
+
+                    client_id = msg["clientId"]
+                    self.clients[client_id] = ws
+                    await self._send(ws, {"type": "registered", "clientId": client_id})
+
+                    stats = self._route("register")
+                    stats.messages += 1
+                    stats.bytes_in += size
+                    stats.latency.record(time.perf_counter() - t0)
+                    self._log(f"[+] Client registered: {client_id} - "
+                              f"Total clients: {len(self.clients)}")
+                    continue
+
+                to = msg.get("to")
+                if not to:
+                    continue
+
+                stats = self._route(f"{msg.get('from') or client_id} -> {to}")
+                stats.messages += 1
+                stats.bytes_in += size
+
+                target = self.clients.get(to)
+                delivered = False
+                if target is not None:
+                    out = dict(msg)
+                    sender = msg.get("from") or client_id
+                    if sender:
+                        out["from"] = sender
+                    else:
+                        # JSON.stringify drops keys whose value is undefined.
+                        out.pop("from", None)
+                    delivered = await self._send(target, out)
+
+                if not delivered:
+                    stats.errors += 1
+                    self._log(f"[-] Target unavailable: {to}")
+                    await self._send(ws, {"type": "error", "reason": "target-unavailable", "to": to})
+                stats.latency.record(time.perf_counter() - t0)
+
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self._log(f"[-] Client disconnected: {client_id}")
+            if client_id is not None:
+                self.clients.pop(client_id, None)
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def format_stats(self) -> str:
+        lines = [f"[*] Signaling server stats: connections={self.connections} "
+                 f"registered={len(self.clients)}"]
+        for name, stats in sorted(self.routes.items()):
+            lines.append(f"    {format_summary(name, stats.latency)} "
+                         f"msgs={stats.messages} bytes_in={stats.bytes_in} "
+                         f"errors={stats.errors}")
+        return "\n".join(lines)
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m common.signaling_server",
+        description=(
+            "Python stand-in for the signaling server (same wire protocol as "
+            "Bonus/docker-signaling/server.js). SERVER_MODE and VALID_TOKEN "
+            "are read from the environment like server.js."
+        ),
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Listen address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8080)),
+                        help="Listen port (default: $PORT or 8080; 0 = ephemeral)")
+    parser.add_argument("--mode", choices=SERVER_MODES,
+                        default=os.environ.get("SERVER_MODE", "insecure"),
+                        help="Server mode (default: $SERVER_MODE or insecure)")
+    parser.add_argument("--cert", help="TLS certificate (PEM) to serve wss://")
+    parser.add_argument("--key", help="TLS private key (PEM) to serve wss://")
+    parser.add_argument("--verbose", action="store_true", help="Print one line per message")
+    args = parser.parse_args(argv)
+
+    ssl_context = None
+    if args.cert:
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(args.cert, args.key)
+
+    server = SignalingServer(
+        host=args.host,
+        port=args.port,
+        mode=args.mode,
+        valid_token=os.environ.get("VALID_TOKEN"),
+        ssl_context=ssl_context,
+        verbose=args.verbose,
+    )
+
+    async def run() -> None:
+        await server.start()
+        print(f"[*] Signaling server listening on {server.url} (mode={server.mode})")
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(server.format_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+startup.py
+
+Startup profiling for the command-line tools (--startup-profile).
+
+A StartupProfile records when each phase of a tool's startup finished
+(module imports, argument parsing, connecting, registering, the first
+answer, ...), counted from process creation where the OS exposes it, and
+the import time of modules loaded on demand:
+
+    STARTUP = StartupProfile()              # right after the module's imports
+    STARTUP.mark("module imports")
+    ...
+    modules = STARTUP.import_modules(["av", "aiortc"])
+    print(STARTUP.report())
+
+import_modules() imports the names in order and charges each with the time
+its own import took. A package that a later name depends on is charged to
+the first name that pulls it in, so list dependencies first to see them
+separately.
+
+Benchmark and startup budget (from part2_attack/): python -m bench.startup
+"""
+
+import importlib
+import os
+import threading
+import time
+from types import ModuleType
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+def process_age() -> Optional[float]:
+    """
+    Seconds since this process was created, or None where that is not
+    available (Linux only; 1/CLK_TCK resolution, usually 10 ms).
+    """
+    try:
+        with open("/proc/self/stat", "rb") as f:
+            stat = f.read()
+        # Fields after the parenthesised command name; starttime is field 22.
+        fields = stat[stat.rindex(b")") + 2:].split()
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return max(time.clock_gettime(time.CLOCK_BOOTTIME) - started, 0.0)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class StartupProfile:
+    """
+    Phases of a tool's startup and the import time of modules loaded later.
+
+    Parameters
+    ----------
+    started : Optional[float]
+        perf_counter() value the phases are counted from; defaults to the
+        process creation time (or now, if that is unknown).
+    """
+
+    def __init__(self, started: Optional[float] = None) -> None:
+        now = time.perf_counter()
+        if started is None:
+            age = process_age()
+            started = now - age if age is not None else now
+        self.started = started
+        self.phases: List[Tuple[str, float]] = []
+        self.imports: List[Tuple[str, float, str]] = []
+        self.__lock = threading.Lock()
+
+    def mark(self, phase: str) -> None:
+        """
+        Record that `phase` finished now. Only the first mark of a phase
+        counts (a reconnect does not move "registered").
+        """
+        now = time.perf_counter() - self.started
+        with self.__lock:
+            if all(name != phase for name, _ in self.phases):
+                self.phases.append((phase, now))
+
+    def done(self, phase: str) -> bool:
+        return any(name == phase for name, _ in self.phases)
+
+    def import_modules(self, names: Sequence[str]) -> Dict[str, ModuleType]:
+        """
+        Import `names` in order, recording how long each import took and on
+        which thread. Raises ImportError like import does.
+        """
+        thread = threading.current_thread().name
+        modules = {}
+        for name in names:
+            t0 = time.perf_counter()
+            modules[name] = importlib.import_module(name)
+            with self.__lock:
+                self.imports.append((name, time.perf_counter() - t0, thread))
+        return modules
+
+    def report(self) -> str:
+        lines = ["[*] Startup profile (ms since process start, phase duration):"]
+        previous = 0.0
+        for name, at in self.phases:
+            lines.append(f"    {name:<28}{at * 1e3:>9.1f}{(at - previous) * 1e3:>+10.1f}")
+            previous = at
+        if self.imports:
+            total = sum(seconds for _, seconds, _ in self.imports)
+            lines.append(f"    on-demand imports ({total * 1e3:.1f} ms):")
+            for name, seconds, thread in self.imports:
+                lines.append(f"      {name:<26}{seconds * 1e3:>9.1f}  [{thread}]")
+        return "\n".join(lines)
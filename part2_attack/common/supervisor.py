@@ -0,0 +1,235 @@
+"""
+supervisor.py
+
+Connection supervisor for the signaling WebSocket, shared by attacker.py
+and interceptor_webrtc.py.
+
+ConnectionSupervisor.run(session) connects, hands the open connection to
+`session`, and reconnects when the connection drops:
+
+  - Reconnect delays follow BackoffPolicy: a fast first retry (a lab
+    server that restarts comes back within a fraction of a second), then
+    exponential growth up to a cap, with random jitter so several tools do
+    not reconnect in lockstep. The attempt counter resets once a
+    connection has stayed up for `stable_after` seconds.
+  - While connected, a ping is sent every `ping_interval` seconds and the
+    pong round-trip time is recorded. A pong that does not arrive within
+    `ping_timeout` marks the link as stalled; the connection is aborted so
+    the session fails immediately instead of waiting for TCP to notice.
+  - ConnectionStats keeps connect / failure / stall counts, connection
+    uptime, time-to-reconnect and RTT histograms (common.metrics).
+
+A session returns True when the work is done (run() then returns) and
+anything else to be reconnected.
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+import websockets
+from websockets.exceptions import ConnectionClosed, WebSocketException
+
+from common.metrics import LatencyHistogram, format_summary
+
+# Exceptions that mean "the connection failed or went away; try again".
+RETRYABLE_ERRORS = (
+    WebSocketException,
+    OSError,
+    asyncio.TimeoutError,
+)
+
+
+@dataclass
+class BackoffPolicy:
+    """
+    Reconnect delay schedule.
+
+    Attributes:
+        first_delay  : Delay before the first retry after a drop (seconds)
+        base_delay   : Delay before the second retry; doubles (factor) after that
+        factor       : Growth factor per further attempt
+        max_delay    : Upper bound on any delay
+        jitter       : Fraction of each delay that is randomised (0 = none,
+                       1 = anywhere between 0 and the full delay)
+        stable_after : A connection that lasted this long resets the schedule
+    """
+    first_delay: float = 0.1
+    base_delay: float = 1.0
+    factor: float = 2.0
+    max_delay: float = 30.0
+    jitter: float = 0.5
+    stable_after: float = 10.0
+
+    def delay(self, attempt: int) -> float:
+        """
+        Delay before retry number `attempt` (0 = first retry).
+        """
+        if attempt == 0:
+            nominal = self.first_delay
+        else:
+            nominal = min(self.max_delay, self.base_delay * self.factor ** (attempt - 1))
+        return nominal * (1.0 - self.jitter * random.random())
+
+
+@dataclass
+class ConnectionStats:
+    """
+    Counters kept by ConnectionSupervisor.
+
+    Attributes:
+        connects    : Successful connections
+        failures    : Connection attempts that failed
+        disconnects : Established connections that dropped
+        stalls      : Connections aborted because a pong did not arrive in time
+        uptime      : Histogram of connection lifetimes
+        reconnect   : Histogram of time from losing a connection to the next
+                      successful connect (backoff sleeps included)
+        rtt         : Histogram of ping/pong round-trip times
+    """
+    connects: int = 0
+    failures: int = 0
+    disconnects: int = 0
+    stalls: int = 0
+    uptime: LatencyHistogram = field(default_factory=LatencyHistogram)
+    reconnect: LatencyHistogram = field(default_factory=LatencyHistogram)
+    rtt: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    def summary(self) -> str:
+        lines = [f"connects={self.connects} failures={self.failures} "
+                 f"disconnects={self.disconnects} stalls={self.stalls}"]
+        for name in ("uptime", "reconnect", "rtt"):
+            hist = getattr(self, name)
+            if hist.count:
+                lines.append(format_summary(name, hist))
+        return "\n".join(lines)
+
+
+class ConnectionSupervisor:
+    """
+    Keeps a signaling WebSocket connected and runs a session on it.
+
+    Parameters
+    ----------
+    url : str
+        WebSocket URL of the signaling server.
+
+    policy : Optional[BackoffPolicy]
+        Reconnect schedule; defaults to BackoffPolicy().
+
+    ping_interval : float
+        Seconds between liveness pings (0 disables them).
+
+    ping_timeout : float
+        Seconds to wait for a pong before treating the link as stalled.
+
+    log : Callable[[str], None]
+        Receives connection state messages.
+    """
+
+    def __init__(self, url: str, policy: Optional[BackoffPolicy] = None,
+                 ping_interval: float = 5.0, ping_timeout: float = 5.0,
+                 log: Callable[[str], None] = print) -> None:
+        self.url = url
+        self.policy = policy or BackoffPolicy()
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.log = log
+        self.stats = ConnectionStats()
+        self.last_rtt: Optional[float] = None
+
+    async def run(self, session: Callable[[object], Awaitable[Optional[bool]]]) -> None:
+        attempt = 0
+        lost_at: Optional[float] = None
+
+        while True:
+            connected_at: Optional[float] = None
+            try:
+                self.log(f"[*] Connecting to signaling server at {self.url!r} ...")
+                # websockets' own keepalive is replaced by _watch_liveness().
+                async with websockets.connect(self.url, ping_interval=None) as ws:
+                    connected_at = time.monotonic()
+                    self.stats.connects += 1
+                    if lost_at is not None:
+                        self.stats.reconnect.record(connected_at - lost_at)
+                        self.log(f"[+] Reconnected after {connected_at - lost_at:.2f}s.")
+                        lost_at = None
+                    else:
+                        self.log("[+] Connected to signaling server.")
+
+                    watchdog = None
+                    if self.ping_interval > 0:
+                        watchdog = asyncio.ensure_future(self._watch_liveness(ws))
+                    try:
+                        done = await session(ws)
+                    finally:
+                        if watchdog is not None:
+                            watchdog.cancel()
+                if done is True:
+                    return
+                self.log("[*] Connection closed by server. Will attempt to reconnect.")
+            except RETRYABLE_ERRORS as e:
+                if connected_at is None:
+                    self.stats.failures += 1
+                self.log(f"[!] Connection error: {e!r}")
+
+            now = time.monotonic()
+            if connected_at is not None:
+                uptime = now - connected_at
+                self.stats.disconnects += 1
+                self.stats.uptime.record(uptime)
+                self.log(f"[*] Connection was up for {uptime:.1f}s.")
+                if uptime >= self.policy.stable_after:
+                    attempt = 0
+                lost_at = now
+
+            delay = self.policy.delay(attempt)
+            attempt += 1
+            self.log(f"[*] Reconnecting in {delay:.2f} seconds (attempt {attempt}) ...")
+            await asyncio.sleep(delay)
+
+    async def _watch_liveness(self, ws) -> None:
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            t0 = time.perf_counter()
+            try:
+                pong = await ws.ping()
+                await asyncio.wait_for(pong, self.ping_timeout)
+            except asyncio.TimeoutError:
+                self.stats.stalls += 1
+                self.log(f"[!] No pong within {self.ping_timeout}s; "
+                         f"treating the connection as stalled.")
+                # close() would wait for the closing handshake on a dead
+                # link; drop the TCP connection so the session fails now.
+                transport = getattr(ws, "transport", None)
+                if transport is not None:
+                    transport.abort()
+                return
+            except ConnectionClosed:
+                return
+            self.last_rtt = time.perf_counter() - t0
+            self.stats.rtt.record(self.last_rtt)
+
+
+def add_arguments(parser) -> None:
+    """
+    Add the reconnect / liveness options shared by both scripts.
+    """
+    parser.add_argument(
+        "--reconnect-first-delay", type=float, default=0.1,
+        help="Delay before the first reconnect attempt in seconds (default: 0.1)",
+    )
+    parser.add_argument(
+        "--reconnect-max-delay", type=float, default=30.0,
+        help="Upper bound on the exponential reconnect delay in seconds (default: 30)",
+    )
+    parser.add_argument(
+        "--ping-interval", type=float, default=5.0,
+        help="Seconds between liveness pings; 0 disables them (default: 5)",
+    )
+    parser.add_argument(
+        "--ping-timeout", type=float, default=5.0,
+        help="Seconds without a pong before the connection is dropped as stalled (default: 5)",
+    )
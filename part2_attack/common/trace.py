@@ -0,0 +1,380 @@
+"""
+trace.py
+
+Compact binary trace format for signaling captures.
+
+Text logs store every frame as an escaped line plus a pretty-printed copy
+and have to be scanned line by line to find anything. A trace stores each
+frame once, length-prefixed, and ends with an index:
+
+    header   magic "NSTRACE1", version, wall-clock and monotonic anchors (ns)
+    frame*   length u32 | t_ns i64 | connection u32 | direction u8 | flags u8 | payload
+    footer   frame offsets (i64[n]) | frame times (i64[n]) | connection labels (JSON)
+    trailer  frame count u64 | footer offset u64 | labels length u64 | magic "NSTRIDX1"
+
+  - t_ns is a monotonic timestamp in nanoseconds (time.monotonic_ns() when
+    recording); the header's anchors convert it to wall-clock time.
+  - direction is 0 for "C → S" and 1 for "S → C"; flag bit 0 marks a binary
+    (bytes) frame, otherwise the payload is UTF-8 text.
+  - Connection ids are small integers handed out by TraceWriter.connection();
+    their labels (e.g. the server URL) are stored in the footer.
+
+TraceReader memory-maps the file, reads the footer and gives O(log n)
+access by frame number or time (bisect over the time column). Payloads are
+memoryview slices of the mapping, so nothing is copied until the caller
+asks for it. A trace whose footer is missing (the writer was killed) is
+still readable: the reader rebuilds the index by walking the frames and
+ignores a truncated last frame.
+
+Usage (from part2_attack/):
+
+    python -m common.trace convert attacker/attacker.log -o attacker.trace
+    python -m common.trace info attacker.trace
+    python -m common.trace dump attacker.trace --since 2.5 --count 10
+"""
+
+import argparse
+import array
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Dict, Iterator, NamedTuple, Optional, Union
+
+from common.logindex import LogIndex
+
+MAGIC = b"NSTRACE1"
+FOOTER_MAGIC = b"NSTRIDX1"
+VERSION = 1
+
+DIRECTIONS = ("C → S", "S → C")
+
+FLAG_BINARY = 0x01
+
+_HEADER = struct.Struct("<8sHHIqq")     # magic, version, flags, reserved, wall_ns, mono_ns
+_FRAME = struct.Struct("<IqIBB")        # length, t_ns, connection, direction, flags
+_TRAILER = struct.Struct("<QQQ8s")      # count, footer offset, labels length, magic
+
+
+class TraceFrame(NamedTuple):
+    """
+    One frame of a trace. `payload` is a memoryview into the reader's
+    mapping and is only valid until the reader is closed.
+    """
+    index: int
+    t_ns: int
+    connection: int
+    direction: str
+    binary: bool
+    payload: memoryview
+
+    def text(self) -> str:
+        return bytes(self.payload).decode("utf-8", errors="replace")
+
+
+class TraceWriter:
+    """
+    Appends frames to a new trace file; close() writes the footer.
+
+    Parameters
+    ----------
+    path : str
+        File to create (an existing file is replaced).
+
+    wall_ns, mono_ns : Optional[int]
+        Clock anchors stored in the header; default to now. Frame times
+        passed to write() are on the mono_ns clock.
+    """
+
+    def __init__(self, path: str, wall_ns: Optional[int] = None,
+                 mono_ns: Optional[int] = None) -> None:
+        self.path = path
+        self.wall_ns = time.time_ns() if wall_ns is None else wall_ns
+        self.mono_ns = time.monotonic_ns() if mono_ns is None else mono_ns
+        self.offsets = array.array("q")
+        self.times = array.array("q")
+        self.labels: Dict[int, str] = {}
+        self.bytes_written = 0
+
+        self.__file = open(path, "wb")
+        self.__file.write(_HEADER.pack(MAGIC, VERSION, 0, 0, self.wall_ns, self.mono_ns))
+        self.__pos = _HEADER.size
+        self.__last_t = self.mono_ns
+
+    def __enter__(self) -> "TraceWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def connection(self, label: str) -> int:
+        """
+        Register a connection and return its id for write().
+        """
+        conn_id = len(self.labels) + 1
+        self.labels[conn_id] = label
+        return conn_id
+
+    def write(self, direction: str, payload: Union[str, bytes],
+              connection: int = 0, t_ns: Optional[int] = None,
+              binary: Optional[bool] = None) -> int:
+        """
+        Append one frame and return its frame number. Times are clamped so
+        they never go backwards (the index relies on sorted times).
+
+        bytes payloads are stored as binary frames unless binary=False
+        (a text frame kept as UTF-8 bytes, stored without decoding).
+        """
+        if isinstance(payload, str):
+            data, flags = payload.encode("utf-8"), 0
+        else:
+            data = payload
+            flags = 0 if binary is False else FLAG_BINARY
+        t = time.monotonic_ns() if t_ns is None else t_ns
+        t = max(t, self.__last_t)
+        self.__last_t = t
+
+        self.__file.write(_FRAME.pack(len(data), t, connection,
+                                      DIRECTIONS.index(direction), flags))
+        self.__file.write(data)
+        self.offsets.append(self.__pos)
+        self.times.append(t)
+        self.__pos += _FRAME.size + len(data)
+        self.bytes_written += len(data)
+        return len(self.offsets) - 1
+
+    def flush(self) -> None:
+        self.__file.flush()
+
+    def close(self) -> None:
+        if self.__file.closed:
+            return
+        labels = json.dumps({str(k): v for k, v in self.labels.items()},
+                            ensure_ascii=False).encode("utf-8")
+        footer_offset = self.__pos
+        self.__file.write(self.offsets.tobytes())
+        self.__file.write(self.times.tobytes())
+        self.__file.write(labels)
+        self.__file.write(_TRAILER.pack(len(self.offsets), footer_offset, len(labels), FOOTER_MAGIC))
+        self.__file.close()
+
+
+class TraceReader:
+    """
+    Random access to a trace file.
+
+    Frames are returned as TraceFrame tuples whose payload is a memoryview
+    of the mapped file. Release them (or copy with bytes()) to free the
+    mapping at close(); while any payload is still referenced, close() only
+    closes the file and the mapping is unmapped with the last payload.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.__file = open(path, "rb")
+        size = os.fstat(self.__file.fileno()).st_size
+        if size < _HEADER.size:
+            self.__file.close()
+            raise ValueError(f"{path}: not a trace file (too short)")
+        self.__mm = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__view = memoryview(self.__mm)
+
+        magic, version, _, _, self.wall_ns, self.mono_ns = _HEADER.unpack_from(self.__mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path}: not a version {VERSION} trace file")
+
+        self.labels: Dict[int, str] = {}
+        self.recovered = not self.__load_footer(size)
+        if self.recovered:
+            self.__rebuild_index(size)
+
+    def __enter__(self) -> "TraceReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def close(self) -> None:
+        self.__view.release()
+        try:
+            self.__mm.close()
+        except BufferError:
+            # Payloads of returned frames still point into the mapping.
+            # Raising here would replace the exception leaving a with
+            # block; the mmap is unmapped when the last payload goes away.
+            pass
+        self.__file.close()
+
+    def frame(self, n: int) -> TraceFrame:
+        if n < 0:
+            n += len(self.offsets)
+        offset = self.offsets[n]
+        length, t_ns, conn, direction, flags = _FRAME.unpack_from(self.__mm, offset)
+        start = offset + _FRAME.size
+        return TraceFrame(n, t_ns, conn, DIRECTIONS[direction], bool(flags & FLAG_BINARY),
+                          self.__view[start:start + length])
+
+    def frames(self, start: int = 0, stop: Optional[int] = None) -> Iterator[TraceFrame]:
+        stop = len(self.offsets) if stop is None else min(stop, len(self.offsets))
+        for n in range(start, stop):
+            yield self.frame(n)
+
+    def seek_time(self, t_ns: int) -> int:
+        """
+        Number of the first frame at or after monotonic time t_ns (len() if
+        there is none).
+        """
+        return bisect.bisect_left(self.times, t_ns)
+
+    def between(self, since_ns: Optional[int] = None,
+                until_ns: Optional[int] = None) -> Iterator[TraceFrame]:
+        """
+        Frames with since_ns <= t_ns <= until_ns.
+        """
+        start = 0 if since_ns is None else self.seek_time(since_ns)
+        stop = None if until_ns is None else bisect.bisect_right(self.times, until_ns)
+        return self.frames(start, stop)
+
+    def wall_time(self, t_ns: int) -> float:
+        """
+        POSIX time of a frame timestamp.
+        """
+        return (self.wall_ns + (t_ns - self.mono_ns)) / 1e9
+
+    # ------------------------------------------------------------------
+
+    def __load_footer(self, size: int) -> bool:
+        if size < _HEADER.size + _TRAILER.size:
+            return False
+        count, footer, labels_len, magic = _TRAILER.unpack_from(self.__mm, size - _TRAILER.size)
+        if magic != FOOTER_MAGIC or footer + 16 * count + labels_len + _TRAILER.size != size:
+            return False
+        self.offsets = array.array("q")
+        self.offsets.frombytes(self.__view[footer:footer + 8 * count])
+        self.times = array.array("q")
+        self.times.frombytes(self.__view[footer + 8 * count:footer + 16 * count])
+        labels_at = footer + 16 * count
+        labels = json.loads(bytes(self.__view[labels_at:labels_at + labels_len]) or b"{}")
+        self.labels = {int(k): v for k, v in labels.items()}
+        return True
+
+    def __rebuild_index(self, size: int) -> None:
+        self.offsets = array.array("q")
+        self.times = array.array("q")
+        pos = _HEADER.size
+        while pos + _FRAME.size <= size:
+            length, t_ns, _, direction, _ = _FRAME.unpack_from(self.__mm, pos)
+            end = pos + _FRAME.size + length
+            if end > size or direction >= len(DIRECTIONS):
+                break
+            self.offsets.append(pos)
+            self.times.append(t_ns)
+            pos = end
+
+
+def convert(log_path: str, trace_path: str) -> int:
+    """
+    Convert a text or JSONL capture (anything LogIndex reads) to a trace.
+    Returns the number of frames written.
+
+    Text logs have second-resolution timestamps (proxy.log has none) and
+    no connection ids: frame times are offsets from the first timestamped
+    frame, and all frames go to one connection labelled with the log path.
+    Binary frames of a JSONL capture ("raw_b64") stay binary frames.
+    """
+    index = LogIndex.open(log_path, save=False)
+    first = next((t for t in index.ts if t is not None), None)
+    wall_ns = int(first * 1e9) if first is not None else 0
+    entries = list(range(len(index)))
+
+    with TraceWriter(trace_path, wall_ns=wall_ns, mono_ns=0) as writer:
+        conn = writer.connection(os.path.basename(log_path))
+        t_ns = 0
+        for n, raw in zip(entries, index.iter_raw(entries)):
+            if index.ts[n] is not None:
+                t_ns = int(index.ts[n] * 1e9) - wall_ns
+            payload: Union[str, bytes] = raw
+            if not index.binary[n]:
+                try:
+                    payload = raw.decode("utf-8")
+                except UnicodeDecodeError:
+                    pass
+            writer.write(index.direction[n], payload, conn, t_ns)
+        return len(writer)
+
+
+# ---------------------------------------------------------------------------
+# Command-line interface
+# ---------------------------------------------------------------------------
+
+def _format_wall(posix: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(posix)) + f".{int(posix * 1e3) % 1000:03d}Z"
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m common.trace",
+        description="Convert, inspect and dump binary signaling traces.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_convert = sub.add_parser("convert", help="Convert a text / JSONL capture to a trace.")
+    p_convert.add_argument("log", help="attacker.log, proxy.log or a JSONL capture.")
+    p_convert.add_argument("-o", "--output", help="Trace file (default: <log>.trace).")
+
+    p_info = sub.add_parser("info", help="Show frame count, time span and connections.")
+    p_info.add_argument("trace")
+
+    p_dump = sub.add_parser("dump", help="Print frames.")
+    p_dump.add_argument("trace")
+    p_dump.add_argument("--since", type=float,
+                        help="Start this many seconds after the first frame.")
+    p_dump.add_argument("--frame", type=int, default=0, help="First frame number (default: 0).")
+    p_dump.add_argument("--count", type=int, help="Number of frames to print.")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        output = args.output or os.path.splitext(args.log)[0] + ".trace"
+        t0 = time.perf_counter()
+        count = convert(args.log, output)
+        print(f"[+] {count} frame(s) from {args.log} written to {output} "
+              f"({os.path.getsize(args.log)} -> {os.path.getsize(output)} bytes, "
+              f"{(time.perf_counter() - t0) * 1e3:.1f} ms).")
+        return 0
+
+    with TraceReader(args.trace) as reader:
+        if args.command == "info":
+            print(f"frames: {len(reader)}" + (" (index rebuilt; footer missing)" if reader.recovered else ""))
+            if len(reader):
+                first, last = reader.times[0], reader.times[-1]
+                print(f"span: {_format_wall(reader.wall_time(first))} .. "
+                      f"{_format_wall(reader.wall_time(last))} ({(last - first) / 1e9:.3f} s)")
+            for conn_id, label in sorted(reader.labels.items()):
+                print(f"connection {conn_id}: {label}")
+
+        elif args.command == "dump":
+            start = args.frame
+            if args.since is not None and len(reader):
+                start = max(start, reader.seek_time(reader.times[0] + int(args.since * 1e9)))
+            stop = None if args.count is None else start + args.count
+            for f in reader.frames(start, stop):
+                body = f"<{len(f.payload)} bytes>" if f.binary else f.text()
+                print(f"#{f.index} [{_format_wall(reader.wall_time(f.t_ns))}] "
+                      f"[{f.direction}] conn={f.connection} {body}")
+                f.payload.release()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+ws_proxy.py
+
+Asyncio observation proxy for the signaling WebSocket, a drop-in for
+ws-proxy/proxy.js.
+
+proxy.js parses every frame with JSON.parse and pretty-prints it with
+JSON.stringify before forwarding it, so watching the traffic slows it
+down. This proxy keeps observation off the forwarding path:
+
+  - Frames are forwarded unchanged: they are received as bytes (text
+    frames are not decoded) and sent again with their original frame type,
+    so nothing is decoded, parsed or re-encoded on the way.
+  - Each direction is one loop that sends a message before reading the
+    next. A slow receiver therefore stops the loop, websockets' incoming
+    queue (--max-queue) fills up and reading from the sender's socket is
+    paused: backpressure propagates to the sender in both directions
+    instead of frames piling up in the proxy.
+  - A reference to each forwarded frame goes into a bounded capture
+    queue (--capture-queue). A background thread formats and writes it.
+    When the queue is full the frame is left out of the capture and
+    counted; forwarding never waits for the capture.
+  - The time from the first frame of a message arriving at the proxy
+    until the message has been written to the other side is measured per
+    direction and reported (--stats-interval, and on exit). It includes
+    the time the message waited in websockets' incoming queue.
+
+Capture formats:
+  text  : The proxy.js layout ("[C → S] Raw: ..." plus a pretty-printed
+          JSON copy), readable by common/logindex.py, common/sdp.py,
+          common/regwatch.py and bench/replay.py.
+  jsonl : Compact records (see common/capture.py).
+  trace : Binary trace with one connection per proxied client (see
+          common/trace.py).
+
+Usage (from part2_attack/):
+
+    python proxy/ws_proxy.py                      # :8081 -> ws://localhost:8080, proxy.log
+    python proxy/ws_proxy.py --capture-format trace --capture-file proxy.trace
+    python proxy/ws_proxy.py --target ws://localhost:8080 --port 8081 --stats-interval 10
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import queue
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, Optional
+
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.asyncio.server import ServerConnection, serve
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+from websockets.frames import Frame, Opcode
+
+# Shared helpers live in part2_attack/common/, one level above this script.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common import capture, trace  # noqa: E402
+from common.metrics import LatencyHistogram, format_summary  # noqa: E402
+
+DIRECTIONS = ("C → S", "S → C")
+
+DEFAULT_CAPTURE_FILES = {"text": "proxy.log", "jsonl": "proxy.jsonl", "trace": "proxy.trace"}
+
+# Close codes that may not be sent in a close frame.
+_RESERVED_CLOSE_CODES = (1005, 1006, 1015)
+
+
+# ---------------------------------------------------------------------------
+# Connections that remember frame types
+# ---------------------------------------------------------------------------
+
+class _MessageKinds:
+    """
+    Records, for each incoming message, whether it started with a text or a
+    binary frame and when that frame arrived. recv(decode=False) returns
+    bytes for both, and the proxy needs the type to send the message on
+    unchanged; the arrival time is where its forwarding latency starts
+    (recv() may return much later, when the message was queued).
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.message_is_text: Deque[bool] = collections.deque()
+        self.message_arrived: Deque[float] = collections.deque()
+
+    def process_event(self, event) -> None:
+        if isinstance(event, Frame) and event.opcode in (Opcode.TEXT, Opcode.BINARY):
+            self.message_arrived.append(time.perf_counter())
+            self.message_is_text.append(event.opcode is Opcode.TEXT)
+        super().process_event(event)
+
+
+class _ObservedServerConnection(_MessageKinds, ServerConnection):
+    pass
+
+
+class _ObservedClientConnection(_MessageKinds, ClientConnection):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Capture
+# ---------------------------------------------------------------------------
+
+# Queue items: ("frame", perf_counter, connection, direction, data, is_text)
+#              ("event", perf_counter, connection, text)
+_STOP = None
+
+
+class CaptureQueue:
+    """
+    Bounded queue of forwarded frames, written to a capture file by a
+    background thread.
+
+    Parameters
+    ----------
+    capture_format : str
+        "text", "jsonl" or "trace".
+
+    path : Optional[str]
+        Capture file (appended to, except for traces); None writes no file
+        and only prints status lines.
+
+    maxsize : int
+        Queue capacity in items; put() drops items beyond it.
+
+    echo : bool
+        Also print captured frames to stdout (proxy.js does).
+    """
+
+    def __init__(self, capture_format: str, path: Optional[str], maxsize: int = 10_000,
+                 echo: bool = False) -> None:
+        self.capture_format = capture_format
+        self.path = path
+        self.echo = echo
+        self.captured = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.errors = 0
+
+        # perf_counter() values are converted to wall-clock / monotonic
+        # time in the writer thread.
+        self.anchor_perf = time.perf_counter()
+        self.anchor_wall = time.time()
+        self.anchor_mono_ns = time.monotonic_ns()
+
+        self.__queue: "queue.Queue" = queue.Queue(maxsize)
+        self.__thread = threading.Thread(target=self._run, name="capture", daemon=True)
+        self.__thread.start()
+
+    def put(self, item: tuple) -> None:
+        try:
+            self.__queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return
+        depth = self.__queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        self.__queue.put(_STOP)
+        self.__thread.join(timeout)
+
+    def summary(self) -> str:
+        return (f"captured={self.captured} dropped={self.dropped} "
+                f"max_depth={self.max_depth} errors={self.errors}")
+
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        out = None
+        writer: Optional[trace.TraceWriter] = None
+        trace_conns: Dict[int, int] = {}
+        try:
+            if self.path is not None:
+                if self.capture_format == "trace":
+                    writer = trace.TraceWriter(self.path, wall_ns=int(self.anchor_wall * 1e9),
+                                               mono_ns=self.anchor_mono_ns)
+                else:
+                    out = open(self.path, "a", encoding="utf-8")
+                    if self.capture_format == "jsonl":
+                        out.write(capture.session_record("ws_proxy") + "\n")
+        except OSError as e:
+            print(f"[!] Failed to open capture file {self.path!r}: {e!r}")
+            self.errors += 1
+
+        while True:
+            item = self.__queue.get()
+            if item is _STOP:
+                break
+            try:
+                self._write(item, out, writer, trace_conns)
+                self.captured += 1
+            except (OSError, ValueError) as e:
+                self.errors += 1
+                print(f"[!] Failed to write capture: {e!r}")
+            if out is not None and self.__queue.empty():
+                out.flush()
+
+        if out is not None:
+            out.close()
+        if writer is not None:
+            writer.close()
+
+    def _monotonic(self, t: float) -> float:
+        # JSONL "t" is time.monotonic(), which the session record anchors.
+        return self.anchor_mono_ns / 1e9 + (t - self.anchor_perf)
+
+    def _write(self, item: tuple, out, writer: Optional[trace.TraceWriter],
+               trace_conns: Dict[int, int]) -> None:
+        kind, t, conn = item[0], item[1], item[2]
+        if kind == "event":
+            text = item[3]
+            print(text)
+            if out is None:
+                return
+            if self.capture_format == "jsonl":
+                out.write(capture.note_record(text.strip(), self._monotonic(t)) + "\n")
+            else:
+                out.write(text + "\n")
+            return
+
+        direction, data, is_text = item[3], item[4], item[5]
+        if writer is not None:
+            trace_id = trace_conns.get(conn)
+            if trace_id is None:
+                trace_id = trace_conns[conn] = writer.connection(f"client connection {conn}")
+            t_ns = self.anchor_mono_ns + int((t - self.anchor_perf) * 1e9)
+            writer.write(direction, data, trace_id, t_ns, binary=not is_text)
+            return
+
+        payload = data.decode("utf-8", errors="replace") if is_text else data
+        if self.capture_format == "jsonl":
+            line = capture.frame_record(direction, payload, self._monotonic(t))
+        else:
+            line = f"[{direction}] Raw: {payload}"
+            if is_text:
+                try:
+                    line += f"\n[{direction}] JSON: " + json.dumps(
+                        json.loads(payload), indent=2, ensure_ascii=False)
+                except ValueError:
+                    pass
+        if self.echo:
+            print(line)
+        if out is not None:
+            out.write(line + "\n")
+
+
+# ---------------------------------------------------------------------------
+# Proxy
+# ---------------------------------------------------------------------------
+
+@dataclass
+class DirectionStats:
+    """
+    Attributes:
+        frames  : Messages forwarded
+        bytes   : Payload bytes forwarded
+        latency : First frame of a message arrived -> written to the other side
+    """
+    frames: int = 0
+    bytes: int = 0
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+
+class ObservationProxy:
+    """
+    WebSocket proxy that forwards frames unchanged and hands copies to a
+    CaptureQueue.
+
+    Parameters
+    ----------
+    target_url : str
+        Upstream signaling server; the client's request path is appended.
+
+    capture_queue : Optional[CaptureQueue]
+        Where forwarded frames and connection events go; None captures
+        nothing.
+
+    host, port : str, int
+        Listen address (port 0 picks a free port, see .url after start()).
+
+    max_queue : int
+        Incoming messages websockets buffers per connection before it
+        stops reading from the socket.
+
+    write_limit : int
+        Outgoing buffer size (bytes) above which send() waits for the peer.
+    """
+
+    def __init__(self, target_url: str, capture_queue: Optional[CaptureQueue] = None,
+                 host: str = "localhost", port: int = 8081,
+                 max_queue: int = 16, write_limit: int = 32768) -> None:
+        self.target_url = target_url.rstrip("/")
+        self.capture = capture_queue
+        self.host = host
+        self.port = port
+        self.max_queue = max_queue
+        self.write_limit = write_limit
+
+        self.connections = 0
+        self.active = 0
+        self.upstream_failures = 0
+        self.directions = {d: DirectionStats() for d in DIRECTIONS}
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self) -> "ObservationProxy":
+        self._server = await serve(
+            self._handle, self.host, self.port,
+            create_connection=_ObservedServerConnection,
+            compression=None, max_size=None,
+            max_queue=self.max_queue, write_limit=self.write_limit,
+        )
+        sockets = list(self._server.sockets or [])
+        if sockets:
+            self.port = sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "ObservationProxy":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    def format_stats(self) -> str:
+        lines = [f"[*] Proxy stats: connections={self.connections} active={self.active} "
+                 f"upstream_failures={self.upstream_failures}"
+                 + (f"; capture: {self.capture.summary()}" if self.capture else "")]
+        for direction, stats in self.directions.items():
+            lines.append(f"    {format_summary(direction, stats.latency)} "
+                         f"frames={stats.frames} bytes={stats.bytes}")
+        return "\n".join(lines)
+
+    # ------------------------------------------------------------------
+
+    def _event(self, conn: int, text: str) -> None:
+        if self.capture is not None:
+            self.capture.put(("event", time.perf_counter(), conn, text))
+
+    async def _handle(self, client: ServerConnection) -> None:
+        self.connections += 1
+        conn = self.connections
+        address = client.remote_address[0] if client.remote_address else "?"
+        self._event(conn, f"\n[+] New client connected from {address}")
+
+        path = client.request.path if client.request is not None else "/"
+        try:
+            upstream = await connect(
+                self.target_url + (path if path != "/" else ""),
+                create_connection=_ObservedClientConnection,
+                compression=None, max_size=None,
+                max_queue=self.max_queue, write_limit=self.write_limit,
+            )
+        except (OSError, InvalidHandshake, asyncio.TimeoutError) as e:
+            self.upstream_failures += 1
+            print(f"[!] Error connecting to signaling server: {e!r}")
+            await client.close(1011, "upstream unavailable")
+            return
+        self._event(conn, "[*] Connected to real signaling server")
+
+        self.active += 1
+        pumps = [
+            asyncio.create_task(self._pump(client, upstream, "C → S", conn)),
+            asyncio.create_task(self._pump(upstream, client, "S → C", conn)),
+        ]
+        try:
+            done, _ = await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+            # Close the other side the way this side was closed.
+            first = done.pop()
+            src, dst = (client, upstream) if first is pumps[0] else (upstream, client)
+            self._event(conn, "[*] Client connection closed" if src is client
+                        else "[*] Server connection closed")
+            code = src.close_code if src.close_code not in (None, *_RESERVED_CLOSE_CODES) else 1000
+            await dst.close(code, src.close_reason or "")
+            await asyncio.gather(*pumps, return_exceptions=True)
+        finally:
+            for task in pumps:
+                task.cancel()
+            await upstream.close()
+            self.active -= 1
+
+    async def _pump(self, src: _MessageKinds, dst, direction: str, conn: int) -> None:
+        stats = self.directions[direction]
+        kinds = src.message_is_text
+        arrivals = src.message_arrived
+        capture_queue = self.capture
+        try:
+            while True:
+                data = await src.recv(decode=False)
+                t0 = arrivals.popleft()
+                is_text = kinds.popleft()
+                await dst.send(data, text=is_text)
+                stats.latency.record(time.perf_counter() - t0)
+                stats.frames += 1
+                stats.bytes += len(data)
+                if capture_queue is not None:
+                    capture_queue.put(("frame", t0, conn, direction, data, is_text))
+        except ConnectionClosed:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Command-line interface
+# ---------------------------------------------------------------------------
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Observation proxy for the signaling WebSocket (asyncio replacement for proxy.js)."
+    )
+    parser.add_argument("--target", default="ws://localhost:8080",
+                        help="Signaling server to forward to. Default: ws://localhost:8080.")
+    parser.add_argument("--host", default="localhost", help="Listen address. Default: localhost.")
+    parser.add_argument("--port", type=int, default=8081, help="Listen port. Default: 8081.")
+    parser.add_argument(
+        "--capture-format", choices=capture.CAPTURE_FORMATS, default="text",
+        help="'text' (the proxy.js layout), 'jsonl' or 'trace'. Default: text.",
+    )
+    parser.add_argument(
+        "--capture-file", default=None,
+        help="Capture file. Default: proxy.log / proxy.jsonl / proxy.trace by format. "
+             "Pass '-' to capture nothing (status lines are still printed).",
+    )
+    parser.add_argument("--capture-queue", type=int, default=10_000,
+                        help="Frames the capture may lag behind before frames are left out "
+                             "of it. Default: 10000.")
+    parser.add_argument("--echo", action="store_true",
+                        help="Print captured frames to stdout as well.")
+    parser.add_argument("--max-queue", type=int, default=16,
+                        help="Incoming messages buffered per connection before reading "
+                             "pauses (backpressure). Default: 16.")
+    parser.add_argument("--write-limit", type=int, default=32768,
+                        help="Outgoing bytes buffered per connection before sending "
+                             "waits. Default: 32768.")
+    parser.add_argument("--stats-interval", type=float, default=0.0,
+                        help="Print forwarding stats every N seconds. Default: only on exit.")
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> None:
+    path = args.capture_file or DEFAULT_CAPTURE_FILES[args.capture_format]
+    capture_queue = CaptureQueue(args.capture_format, None if path == "-" else path,
+                                 args.capture_queue, args.echo)
+    proxy = ObservationProxy(args.target, capture_queue, args.host, args.port,
+                             args.max_queue, args.write_limit)
+    try:
+        await proxy.start()
+        print(f"[*] WebSocket proxy listening on {proxy.url}")
+        print(f"[*] Forwarding to {args.target}")
+        while True:
+            await asyncio.sleep(args.stats_interval or 3600)
+            if args.stats_interval:
+                print(proxy.format_stats())
+    finally:
+        await proxy.stop()
+        print(proxy.format_stats())
+        capture_queue.close()
+
+
+def main() -> None:
+    args = parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("[!] KeyboardInterrupt received, exiting.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+codec.peek() against json.loads() on generated frames.
+"""
+
+import json
+import random
+
+from common import codec
+
+FRAMES = 20000
+
+_KEYS = ["type", "to", "from", "sdp", "candidate", "to", '"to', "to\"", "ty pe", "x"]
+_CHARS = ['a', 'b', ' ', '"', '\\', '/', '\n', '\t', 'ï', '€', '\U0001f600', '{', '}', '[', ']',
+          ':', ',', ' ']
+
+
+def _string(rng):
+    return "".join(rng.choice(_CHARS) for _ in range(rng.randint(0, 6)))
+
+
+def _value(rng, depth=0):
+    kind = rng.randrange(7 if depth < 2 else 5)
+    if kind == 0:
+        return rng.choice(["offer", "answer", "client-b", "clïent-b", 'a"b'])
+    if kind == 1:
+        return _string(rng)
+    if kind == 2:
+        return rng.choice([0, -1.5, 1e10, True, False, None])
+    if kind in (3, 4):
+        return rng.choice(["offer", "client-b", ""])
+    if kind == 5:
+        return [_value(rng, depth + 1) for _ in range(rng.randint(0, 3))]
+    return _object(rng, depth + 1)
+
+
+def _object(rng, depth=0):
+    keys = rng.sample(_KEYS, rng.randint(0, len(_KEYS)))
+    return {key: _value(rng, depth) for key in keys}
+
+
+def _encode(rng, body):
+    text = json.dumps(body, ensure_ascii=rng.random() < 0.5,
+                      indent=rng.choice([None, None, 0, 2]),
+                      separators=rng.choice([None, (",", ":"), (" , ", " : ")]))
+    return text.encode("utf-8") if rng.random() < 0.5 else text
+
+
+def _expected(body):
+    return tuple(body.get(k) if isinstance(body.get(k), str) else None for k in ("type", "to"))
+
+
+def test_peek_matches_json_loads():
+    rng = random.Random(1)
+    mismatches = []
+    for _ in range(FRAMES):
+        body = _object(rng)
+        raw = _encode(rng, body)
+        frame = codec.peek(raw)
+        got = None if frame is None else (frame.type, frame.to)
+        if got != _expected(body):
+            mismatches.append((raw, got, _expected(body)))
+    assert mismatches == []
+
+
+def test_peek_escaped_routing_values():
+    frame = codec.peek('{"type": "offer", "to": "cl\\u00efent-b", "sdp": "v=0"}')
+    assert (frame.type, frame.to) == ("offer", "clïent-b")
+    frame = codec.peek(b'{"type": "a\\"b", "to": "client-b"}')
+    assert (frame.type, frame.to) == ('a"b', "client-b")
+
+
+def test_peek_rejects_non_objects():
+    for raw in ("[]", '"type"', "", b"\xff{}", 42):
+        assert codec.peek(raw) is None
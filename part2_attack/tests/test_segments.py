@@ -0,0 +1,66 @@
+"""
+Segment rollover with aiortc's MediaRecorder on a live audio + video peer.
+"""
+
+import asyncio
+
+import av
+from aiortc import RTCConfiguration, RTCPeerConnection
+from aiortc.contrib.media import MediaRecorder
+from aiortc.mediastreams import AudioStreamTrack, VideoStreamTrack
+
+from webrtc_media import segments
+
+ROTATIONS = 5
+
+
+def _recorder_track_tasks():
+    return [t for t in asyncio.all_tasks() if not t.done()
+            and t.get_coro().__qualname__ == "MediaRecorder.__run_track"]
+
+
+async def _record_with_rotations(output):
+    sender = RTCPeerConnection(RTCConfiguration(iceServers=[]))
+    receiver = RTCPeerConnection(RTCConfiguration(iceServers=[]))
+    tracks = []
+    receiver.on("track", tracks.append)
+    sender.addTrack(AudioStreamTrack())
+    sender.addTrack(VideoStreamTrack())
+    await sender.setLocalDescription(await sender.createOffer())
+    await receiver.setRemoteDescription(sender.localDescription)
+    await receiver.setLocalDescription(await receiver.createAnswer())
+    await sender.setRemoteDescription(receiver.localDescription)
+    while len(tracks) < 2:
+        await asyncio.sleep(0.05)
+
+    recorder = segments.SegmentedRecorder(
+        output, lambda path: MediaRecorder(path, format="webm"), log=lambda msg: None)
+    for track in tracks:
+        recorder.addTrack(track)
+    running = []
+    try:
+        await recorder.start()
+        for _ in range(ROTATIONS):
+            await asyncio.sleep(0.4)
+            await recorder.rotate()
+            running.append(len(_recorder_track_tasks()))
+        await asyncio.sleep(0.4)
+        await recorder.stop()
+    finally:
+        await sender.close()
+        await receiver.close()
+    return recorder, running
+
+
+def test_media_recorder_rotation(tmp_path):
+    recorder, running = asyncio.run(_record_with_rotations(tmp_path / "call.webm"))
+
+    # Only the new recorder's two track tasks run after each rollover.
+    assert running == [2] * ROTATIONS
+    assert len(recorder.segments) == ROTATIONS + 1
+    for entry in recorder.segments:
+        assert entry["complete"]
+        with av.open(str(tmp_path / entry["file"])) as container:
+            assert len(container.streams.audio) == 1
+            assert len(container.streams.video) == 1
+            assert any(True for _ in container.decode(video=0))
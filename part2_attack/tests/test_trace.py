@@ -0,0 +1,40 @@
+"""
+JSONL capture -> trace conversion round trip.
+"""
+
+import time
+
+from common import capture, trace
+
+FRAMES = [
+    ("C → S", '{"type":"register","clientId":"client-a"}'),
+    ("S → C", b"\x00\x01\x02\x03\x04"),
+    ("S → C", '{"type":"offer","to":"client-b","sdp":"v=0\\r\\n"}'),
+    ("C → S", b"plain"),  # valid UTF-8, still a binary frame
+]
+
+
+def test_convert_jsonl_round_trip(tmp_path):
+    log = tmp_path / "capture.jsonl"
+    t0 = time.monotonic()
+    with open(log, "w", encoding="utf-8") as f:
+        f.write(capture.session_record("test") + "\n")
+        for i, (direction, payload) in enumerate(FRAMES):
+            f.write(capture.frame_record(direction, payload, t0 + 0.25 * i) + "\n")
+
+    out = str(tmp_path / "capture.trace")
+    assert trace.convert(str(log), out) == len(FRAMES)
+
+    with trace.TraceReader(out) as reader:
+        frames = list(reader.frames())
+        got = [(f.direction, f.binary, bytes(f.payload), f.t_ns) for f in frames]
+        for f in frames:
+            f.payload.release()
+
+    for (direction, payload), (got_dir, binary, data, _) in zip(FRAMES, got):
+        assert got_dir == direction
+        assert binary == isinstance(payload, bytes)
+        assert data == (payload if isinstance(payload, bytes) else payload.encode("utf-8"))
+    # Frame times keep their spacing (0.25 s, microsecond rounding aside).
+    steps = [b[3] - a[3] for a, b in zip(got, got[1:])]
+    assert all(abs(step - 250_000_000) < 1_000 for step in steps)
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+activity.py
+
+Audio activity detection for interceptor_webrtc.py (--vad) and offline
+activity timelines of recordings.
+
+The level of each audio frame is measured with NumPy as the RMS energy
+(dBFS) over fixed windows inside the frame (--vad-window, 20 ms by default,
+which is one Opus frame). A frame with any window above the threshold is
+active.
+
+During capture, SilenceSkippingTrack sits between the remote audio track
+and the recorder and holds back silence:
+
+  - after the last active frame, `hangover` worth of audio is still
+    recorded, so word endings and short pauses are kept as they are;
+  - beyond that, frames are not handed to the recorder, so they are neither
+    encoded nor written. The last `preroll` of them is held back and
+    recorded once activity resumes, so word onsets are not clipped;
+  - the frames that are recorded keep their timestamps. The skipped spans
+    are gaps in the audio stream, and audio and video stay in sync.
+
+Each skipped span is listed, in media time from the first audio frame and in
+wall-clock time, in an activity manifest next to the recording
+(recordings/intercepted_media.activity.json). The manifest is rewritten
+atomically whenever a span closes, so playback timing can be rebuilt, and
+the segments in a segmented recording (segments.py) matched by wall-clock
+time.
+
+Offline, `timeline` decodes the audio of an existing recording and prints
+its speech / silence spans and an activity bar (gaps left by --vad count as
+silence):
+
+    python activity.py timeline recordings/client_a_intercept.webm
+    python activity.py timeline recordings/intercepted_media.webm --threshold-db -40 --json timeline.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+import av
+import numpy as np
+from aiortc.mediastreams import MediaStreamTrack
+
+DEFAULT_WINDOW_MS = 20.0
+DEFAULT_THRESHOLD_DB = -45.0
+DEFAULT_HANGOVER_MS = 500.0
+DEFAULT_PREROLL_MS = 100.0
+
+# Floor for the energy before taking the log (about -120 dBFS).
+_ENERGY_FLOOR = 1e-12
+
+# Full scale of integer sample formats.
+_FULL_SCALE = {np.dtype(np.int16): 32768.0, np.dtype(np.int32): 2147483648.0,
+               np.dtype(np.uint8): 128.0}
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+# ---------------------------------------------------------------------------
+# Levels
+# ---------------------------------------------------------------------------
+
+def frame_samples(frame: av.AudioFrame) -> np.ndarray:
+    """
+    Mono samples of `frame` as float32 in [-1, 1].
+    """
+    array = frame.to_ndarray()
+    channels = len(frame.layout.channels)
+    if frame.format.is_packed:
+        array = array.reshape(-1, channels)
+        axis = 1
+    else:
+        axis = 0
+    scale = _FULL_SCALE.get(array.dtype)
+    if array.dtype == np.uint8:
+        array = array.astype(np.float32) - 128.0
+    mono = array.mean(axis=axis, dtype=np.float32) if channels > 1 else array.reshape(-1).astype(np.float32)
+    if scale is not None:
+        mono /= scale
+    return mono
+
+
+def window_levels(frames: np.ndarray, window: int) -> np.ndarray:
+    """
+    RMS level (dBFS) of each `window`-sample window in every row of
+    `frames` (F, S); returns (F, S // window). A window longer than the
+    frame covers the whole frame; samples left over are ignored.
+    """
+    count, length = frames.shape
+    window = max(1, min(window, length))
+    per_frame = length // window
+    blocks = frames[:, :per_frame * window].reshape(count, per_frame, window)
+    energy = np.einsum("fwn,fwn->fw", blocks, blocks) / window
+    return 10.0 * np.log10(np.maximum(energy, _ENERGY_FLOOR))
+
+
+# ---------------------------------------------------------------------------
+# Capture: dropping silence
+# ---------------------------------------------------------------------------
+
+class ActivityManifest:
+    """
+    The skipped silent spans of one recording, written as JSON next to it.
+
+    Parameters
+    ----------
+    path : Path
+        Manifest path (e.g. recordings/intercepted_media.activity.json).
+
+    recording : Path
+        The recording the spans refer to.
+
+    settings : Dict[str, float]
+        Detector settings, stored for reference.
+    """
+
+    def __init__(self, path: Path, recording: Path, settings: Dict[str, float]) -> None:
+        self.path = path
+        self.recording = recording
+        self.settings = settings
+        self.started = _utc_now()
+        self.silences: List[dict] = []
+        self.frames = 0
+        self.dropped_frames = 0
+        self.dropped_seconds = 0.0
+        self.complete = False
+
+    def add(self, start: float, end: float, wall_start: str, wall_end: str, frames: int) -> None:
+        self.silences.append({
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "duration": round(end - start, 3),
+            "wall_start": wall_start,
+            "wall_end": wall_end,
+        })
+        self.dropped_frames += frames
+        self.dropped_seconds += end - start
+        self.write()
+
+    def write(self) -> None:
+        """
+        Rewrite the manifest atomically (temporary file + rename).
+        """
+        data = {
+            "recording": self.recording.name,
+            "started": self.started,
+            "settings": self.settings,
+            "frames": self.frames,
+            "dropped_frames": self.dropped_frames,
+            "dropped_seconds": round(self.dropped_seconds, 3),
+            "complete": self.complete,
+            "silences": self.silences,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+class SilenceSkippingTrack(MediaStreamTrack):
+    """
+    Forwards an audio track to the recorder without its long silences.
+
+    Parameters
+    ----------
+    source : MediaStreamTrack
+        Remote audio track yielding decoded av.AudioFrame objects.
+
+    manifest : ActivityManifest
+        Receives one entry per skipped span.
+
+    threshold_db : float
+        Window level (dBFS) above which a frame is active.
+
+    window_ms, hangover_ms, preroll_ms : float
+        Analysis window; audio still recorded after the last active frame;
+        audio held back and recorded before the next active frame.
+    """
+
+    def __init__(self, source: MediaStreamTrack, manifest: ActivityManifest,
+                 threshold_db: float = DEFAULT_THRESHOLD_DB,
+                 window_ms: float = DEFAULT_WINDOW_MS,
+                 hangover_ms: float = DEFAULT_HANGOVER_MS,
+                 preroll_ms: float = DEFAULT_PREROLL_MS) -> None:
+        super().__init__()
+        self.kind = source.kind
+        self.manifest = manifest
+        self.threshold_db = threshold_db
+        self.window_ms = window_ms
+        self.hangover = hangover_ms / 1000.0
+        self.preroll = preroll_ms / 1000.0
+
+        self.frames = 0
+        self.active_frames = 0
+        self.analysis_seconds = 0.0
+        self.media_seconds = 0.0
+
+        self.__source = source
+        self.__t0: Optional[float] = None
+        self.__last_active: Optional[float] = None
+        # Frames not recorded (yet) in the current silence, newest last:
+        # (media time, duration, frame). Only `preroll` worth is kept.
+        self.__held: Deque[Tuple[float, float, av.AudioFrame]] = deque()
+        self.__held_seconds = 0.0
+        # Start (media and wall-clock time) and frame count of the frames
+        # dropped for good in the current silence.
+        self.__skip_start: Optional[Tuple[float, str]] = None
+        self.__skipped = 0
+        # Frames to hand out before reading the source again.
+        self.__ready: Deque[av.AudioFrame] = deque()
+
+    async def recv(self):
+        while not self.__ready:
+            frame = await self.__source.recv()
+            self.__process(frame)
+        return self.__ready.popleft()
+
+    def __process(self, frame: av.AudioFrame) -> None:
+        t0 = time.perf_counter()
+        samples = frame_samples(frame)
+        rate = frame.sample_rate or 48000
+        active = bool(samples.size) and window_levels(
+            samples[None], int(rate * self.window_ms / 1000)).max() > self.threshold_db
+        self.analysis_seconds += time.perf_counter() - t0
+
+        duration = frame.samples / rate
+        if frame.pts is not None and frame.time_base is not None:
+            t = float(frame.pts * frame.time_base)
+        else:
+            t = self.media_seconds
+        if self.__t0 is None:
+            self.__t0 = t
+        t -= self.__t0
+        self.frames += 1
+        self.manifest.frames += 1
+        self.media_seconds += duration
+
+        if active:
+            self.active_frames += 1
+            self.__last_active = t
+            self.__resume(t)
+            self.__ready.append(frame)
+        elif self.__last_active is not None and t - self.__last_active <= self.hangover:
+            self.__ready.append(frame)
+        else:
+            # In silence: hold the frame back; the oldest held frame beyond
+            # the preroll is dropped for good.
+            self.__held.append((t, duration, frame))
+            self.__held_seconds += duration
+            while self.__held and self.__held_seconds - self.__held[0][1] >= self.preroll:
+                dropped_t, dropped_duration, _ = self.__held.popleft()
+                self.__held_seconds -= dropped_duration
+                if self.__skip_start is None:
+                    self.__skip_start = (dropped_t, _utc_now())
+                self.__skipped += 1
+
+    def __resume(self, t: float) -> None:
+        """
+        Activity at media time `t`: close the skipped span, if any, and
+        record the held-back preroll.
+        """
+        if self.__skip_start is not None:
+            end = self.__held[0][0] if self.__held else t
+            start, wall_start = self.__skip_start
+            self.manifest.add(start, end, wall_start, _utc_now(), self.__skipped)
+            self.__skip_start = None
+            self.__skipped = 0
+        self.__ready.extend(frame for _, _, frame in self.__held)
+        self.__held.clear()
+        self.__held_seconds = 0.0
+
+    def close(self) -> None:
+        """
+        Close the open span (the recording ended in silence) and mark the
+        manifest complete.
+        """
+        if self.__skip_start is not None:
+            start, wall_start = self.__skip_start
+            end = self.media_seconds
+            self.manifest.add(start, end, wall_start, _utc_now(),
+                              self.__skipped + len(self.__held))
+            self.__skip_start = None
+        self.manifest.complete = True
+        self.manifest.write()
+
+    def stats(self) -> str:
+        frames = max(self.frames, 1)
+        per_frame = self.analysis_seconds / frames
+        real_time = self.analysis_seconds / self.media_seconds if self.media_seconds else 0.0
+        return (f"frames={self.frames} active={self.active_frames} "
+                f"dropped={self.manifest.dropped_frames} "
+                f"({self.manifest.dropped_seconds:.1f} s of {self.media_seconds:.1f} s skipped "
+                f"in {len(self.manifest.silences)} span(s)); analysis "
+                f"{per_frame * 1e6:.1f} us per frame ({real_time * 100:.3f}% of real time)")
+
+
+# ---------------------------------------------------------------------------
+# Offline timeline
+# ---------------------------------------------------------------------------
+
+def recording_levels(path: str, window_ms: float) -> Tuple[np.ndarray, np.ndarray, float, float]:
+    """
+    Decode the first audio stream of `path` and measure every window.
+    Returns (window start times, levels in dBFS, window seconds, stream
+    end), with times in seconds from the first audio frame.
+    """
+    times: List[np.ndarray] = []
+    levels: List[np.ndarray] = []
+    batch: List[np.ndarray] = []
+    batch_times: List[float] = []
+    window_seconds = window_ms / 1000.0
+    t0 = None
+    end = 0.0
+    rate = 48000
+
+    def flush() -> None:
+        if not batch:
+            return
+        frames = np.stack(batch)
+        window = max(1, min(int(rate * window_ms / 1000), frames.shape[1]))
+        frame_levels = window_levels(frames, window)
+        offsets = np.arange(frame_levels.shape[1]) * (window / rate)
+        times.append((np.array(batch_times)[:, None] + offsets).reshape(-1))
+        levels.append(frame_levels.reshape(-1))
+        batch.clear()
+        batch_times.clear()
+
+    with av.open(path) as container:
+        stream = container.streams.audio[0]
+        position = 0.0
+        for frame in container.decode(stream):
+            samples = frame_samples(frame)
+            rate = frame.sample_rate or rate
+            t = float(frame.pts * frame.time_base) if frame.pts is not None else position
+            if t0 is None:
+                t0 = t
+            t -= t0
+            position = t + frame.samples / rate
+            end = max(end, position)
+            if batch and len(samples) != len(batch[0]):
+                flush()
+            batch.append(samples)
+            batch_times.append(t)
+            if len(batch) >= 1024:
+                flush()
+        flush()
+    if not times:
+        return np.empty(0), np.empty(0), window_seconds, 0.0
+    return np.concatenate(times), np.concatenate(levels), window_seconds, end
+
+
+def speech_spans(times: np.ndarray, levels: np.ndarray, window_seconds: float,
+                 threshold_db: float, min_silence: float) -> List[Tuple[float, float]]:
+    """
+    Merge active windows into (start, end) speech spans; silences shorter
+    than `min_silence` (including gaps without audio) do not split a span.
+    """
+    active = np.sort(times[levels > threshold_db])
+    if len(active) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(active) > min_silence + window_seconds)
+    starts = np.concatenate(([active[0]], active[breaks + 1]))
+    ends = np.concatenate((active[breaks], [active[-1]])) + window_seconds
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def activity_bar(spans: List[Tuple[float, float]], duration: float, width: int) -> str:
+    """
+    One character per duration / width seconds: '#' if any speech, else '.'.
+    """
+    bar = np.zeros(width, dtype=bool)
+    if duration > 0:
+        for start, end in spans:
+            a = int(start / duration * width)
+            b = int(np.ceil(end / duration * width))
+            bar[a:max(b, a + 1)] = True
+    return "".join("#" if on else "." for on in bar)
+
+
+def format_time(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds, 1), 60)
+    return f"{int(minutes):02d}:{seconds:04.1f}"
+
+
+def timeline(args) -> int:
+    t0 = time.perf_counter()
+    times, levels, window_seconds, duration = recording_levels(args.recording, args.window_ms)
+    elapsed = time.perf_counter() - t0
+    if len(times) == 0:
+        print(f"[!] No audio in {args.recording!r}.")
+        return 1
+
+    spans = speech_spans(times, levels, window_seconds, args.threshold_db,
+                         args.min_silence_ms / 1000.0)
+    speech = sum(end - start for start, end in spans)
+    print(f"[*] {args.recording}: {duration:.1f} s of audio, {len(times)} windows of "
+          f"{args.window_ms:g} ms analysed in {elapsed:.2f} s "
+          f"({duration / elapsed if elapsed > 0 else 0:.0f}x real time, decoding included).")
+    print(f"[*] Levels: median {np.median(levels):.1f} dBFS, max {levels.max():.1f} dBFS; "
+          f"threshold {args.threshold_db:g} dBFS.")
+    print(f"[+] {len(spans)} speech span(s), {speech:.1f} s of {duration:.1f} s "
+          f"({speech / duration * 100 if duration else 0:.0f}%) active:")
+    print(f"    |{activity_bar(spans, duration, args.width)}|")
+    print(f"    {'#':>3}  {'start':>8}  {'end':>8}  {'duration':>8}  {'peak':>6}")
+    for n, (start, end) in enumerate(spans, 1):
+        inside = levels[(times >= start) & (times < end)]
+        peak = inside.max() if len(inside) else float("nan")
+        print(f"    {n:>3}  {format_time(start):>8}  {format_time(end):>8}  "
+              f"{end - start:>7.1f}s  {peak:>6.1f}")
+
+    if args.json is not None:
+        data = {
+            "recording": args.recording,
+            "duration": round(duration, 3),
+            "window_ms": args.window_ms,
+            "threshold_db": args.threshold_db,
+            "min_silence_ms": args.min_silence_ms,
+            "speech_seconds": round(speech, 3),
+            "spans": [{"start": round(a, 3), "end": round(b, 3)} for a, b in spans],
+        }
+        Path(args.json).write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+        print(f"[+] Timeline written to {args.json}")
+    return 0
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Audio activity tools for intercepted recordings.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_timeline = sub.add_parser("timeline", help="Print the speech / silence timeline of a recording.")
+    p_timeline.add_argument("recording", help="Recording (e.g. recordings/client_a_intercept.webm)")
+    p_timeline.add_argument("--threshold-db", type=float, default=DEFAULT_THRESHOLD_DB,
+                            help=f"Window level (dBFS) counted as activity (default: {DEFAULT_THRESHOLD_DB:g})")
+    p_timeline.add_argument("--window-ms", type=float, default=DEFAULT_WINDOW_MS,
+                            help=f"Analysis window (default: {DEFAULT_WINDOW_MS:g} ms)")
+    p_timeline.add_argument("--min-silence-ms", type=float, default=DEFAULT_HANGOVER_MS,
+                            help="Shorter silences do not split a speech span "
+                                 f"(default: {DEFAULT_HANGOVER_MS:g} ms)")
+    p_timeline.add_argument("--width", type=int, default=72, help="Activity bar width (default: 72)")
+    p_timeline.add_argument("--json", default=None, help="Also write the spans to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.command == "timeline":
+        return timeline(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+contact_sheet.py
+
+Offline scene-change analysis of intercepted recordings: a contact sheet
+(one thumbnail per scene) and a per-segment summary, instead of scrubbing
+through recordings/client_a_intercept.webm in a media player.
+
+  1. The file is scanned once without decoding (demux only) for its
+     duration and keyframe positions.
+  2. The video is split into time ranges that start on keyframes, so each
+     range decodes on its own, and the ranges are decoded in a process
+     pool. With --keyframes-only only keyframe packets are decoded at all;
+     otherwise every frame has to be decoded (VP8 inter frames depend on
+     the previous ones) but only one frame per --interval seconds is
+     converted and analysed.
+  3. Each sampled frame is reduced to a small RGB thumbnail (colour, so a
+     cut between scenes of equal brightness is still seen), and the
+     thumbnails are compared in batches with vectorized NumPy differencing
+     (mean absolute difference, 0 = identical, 1 = inverted). A change
+     score above --threshold starts a new scene (at most one per
+     --min-scene seconds).
+  4. The first frame of every scene is drawn into a contact sheet (PNG,
+     labelled with its timestamp) and the scenes are listed with their time
+     range, sampled frames and mean motion, on stdout and as JSON.
+
+WebRTC senders emit few keyframes (often only at the start and on packet
+loss), so a recording may split into fewer ranges than there are workers;
+the number of ranges used is printed.
+
+Usage (from part2_attack/webrtc_media/):
+
+    python contact_sheet.py recordings/client_a_intercept.webm
+    python contact_sheet.py recordings/client_a_intercept.webm --interval 0.5 --threshold 0.08
+    python contact_sheet.py recordings/client_a_intercept.webm --keyframes-only --frames-dir frames/
+"""
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import av
+import numpy as np
+
+# Width of the thumbnails the change score is computed on.
+ANALYSIS_WIDTH = 64
+
+# Sampled frames compared per vectorized batch. Bounds the memory a worker
+# holds (one colour tile per frame) to BATCH tiles.
+BATCH = 256
+
+# 3x5 bitmap font for the timestamp labels on the contact sheet.
+_FONT = {
+    "0": "111101101101111", "1": "010110010010111", "2": "111001111100111",
+    "3": "111001111001111", "4": "101101111001001", "5": "111100111001111",
+    "6": "111100111101111", "7": "111001001001001", "8": "111101111101111",
+    "9": "111101111001111", ":": "000010000010000", ".": "000000000000010",
+}
+
+
+# ---------------------------------------------------------------------------
+# Probing and splitting
+# ---------------------------------------------------------------------------
+
+@dataclass
+class VideoInfo:
+    """
+    What the demux-only scan found out about a recording's video stream.
+
+    Attributes:
+        duration  : Seconds from the first to the last video packet
+        width, height : Frame size
+        codec     : Codec name (e.g. "vp8")
+        frames    : Number of video packets
+        keyframes : Timestamps (seconds) of the keyframes, ascending
+    """
+    duration: float
+    width: int
+    height: int
+    codec: str
+    frames: int
+    keyframes: List[float]
+
+
+def probe(path: str) -> Optional[VideoInfo]:
+    """
+    Scan the video packets of `path` without decoding them. Returns None
+    when the file has no video stream (e.g. an audio-only call).
+    """
+    with av.open(path) as container:
+        if not container.streams.video:
+            return None
+        stream = container.streams.video[0]
+        tb = float(stream.time_base)
+        first = last = None
+        frames = 0
+        keyframes = []
+        for packet in container.demux(stream):
+            if packet.size == 0 or packet.pts is None:
+                continue
+            t = packet.pts * tb
+            first = t if first is None else min(first, t)
+            last = t if last is None else max(last, t)
+            frames += 1
+            if packet.is_keyframe:
+                keyframes.append(t)
+        ctx = stream.codec_context
+        return VideoInfo(
+            duration=(last - first) if frames else 0.0,
+            width=ctx.width,
+            height=ctx.height,
+            codec=ctx.name,
+            frames=frames,
+            keyframes=sorted(keyframes),
+        )
+
+
+def split_ranges(info: VideoInfo, parts: int) -> List[Tuple[float, float]]:
+    """
+    Split the video into at most `parts` (start, end) ranges of similar
+    length, each starting on a keyframe so it can be decoded on its own.
+    """
+    keyframes = info.keyframes or [0.0]
+    end = keyframes[0] + info.duration + 1.0
+    target = (end - keyframes[0]) / max(parts, 1)
+    starts = [keyframes[0]]
+    for t in keyframes[1:]:
+        if t - starts[-1] >= target:
+            starts.append(t)
+    return list(zip(starts, starts[1:] + [end]))
+
+
+# ---------------------------------------------------------------------------
+# Worker (one time range per task)
+# ---------------------------------------------------------------------------
+
+@dataclass
+class RangeResult:
+    """
+    Analysis of one time range, returned by analyse_range().
+
+    Attributes:
+        times   : Timestamp (seconds) of every sampled frame
+        scores  : Change score against the previous sampled frame (NaN for
+                  the first one, which is compared across ranges later)
+        first_thumb, last_thumb : Analysis thumbnails of the first / last
+                  sampled frame
+        tiles   : Colour tiles of the frames that may start a scene (the
+                  first one and those scoring above the threshold), by index
+        decoded : Frames decoded, including those not sampled
+        seconds : CPU time the worker spent
+    """
+    times: np.ndarray
+    scores: np.ndarray
+    first_thumb: Optional[np.ndarray]
+    last_thumb: Optional[np.ndarray]
+    tiles: Dict[int, np.ndarray] = field(default_factory=dict)
+    decoded: int = 0
+    seconds: float = 0.0
+
+
+def change_scores(previous: Optional[np.ndarray], thumbs: np.ndarray) -> np.ndarray:
+    """
+    Mean absolute difference (0..1) of each thumbnail in `thumbs`
+    (N, H, W, 3) to the one before it; the first is compared with
+    `previous` (NaN if there is none).
+    """
+    stack = thumbs.astype(np.int16)
+    scores = np.empty(len(thumbs), dtype=np.float64)
+    if len(thumbs) > 1:
+        scores[1:] = np.abs(np.diff(stack, axis=0)).mean(axis=(1, 2, 3)) / 255.0
+    if len(thumbs):
+        scores[0] = (np.nan if previous is None
+                     else np.abs(stack[0] - previous.astype(np.int16)).mean() / 255.0)
+    return scores
+
+
+def analyse_range(path: str, start: float, end: float, interval: float,
+                  keyframes_only: bool, threshold: float, tile_width: int,
+                  frames_dir: Optional[str]) -> RangeResult:
+    """
+    Decode [start, end) of `path` and analyse the sampled frames (runs in a
+    worker process).
+    """
+    cpu0 = time.process_time()
+    times: List[float] = []
+    scores: List[np.ndarray] = []
+    tiles: Dict[int, np.ndarray] = {}
+    first_thumb = previous = None
+    decoded = 0
+
+    batch_thumbs: List[np.ndarray] = []
+    batch_tiles: List[np.ndarray] = []
+
+    def flush() -> None:
+        nonlocal previous
+        if not batch_thumbs:
+            return
+        thumbs = np.stack(batch_thumbs)
+        batch_scores = change_scores(previous, thumbs)
+        base = len(times) - len(batch_thumbs)
+        for i in np.flatnonzero(~(batch_scores <= threshold)):  # NaN or above
+            tiles[base + int(i)] = batch_tiles[i]
+        scores.append(batch_scores)
+        previous = thumbs[-1]
+        batch_thumbs.clear()
+        batch_tiles.clear()
+
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        tb = float(stream.time_base)
+        container.seek(int(start / tb), stream=stream, backward=True)
+
+        width = stream.codec_context.width
+        height = stream.codec_context.height
+        thumb_size = (ANALYSIS_WIDTH, max(2, round(ANALYSIS_WIDTH * height / width / 2) * 2))
+        tile_size = (tile_width, max(2, round(tile_width * height / width / 2) * 2))
+
+        next_sample = start
+        done = False
+        for packet in container.demux(stream):
+            if packet.pts is not None and packet.pts * tb >= end:
+                break
+            if keyframes_only and not packet.is_keyframe:
+                continue
+            for frame in packet.decode():
+                decoded += 1
+                t = frame.pts * tb if frame.pts is not None else next_sample
+                if t < start:
+                    continue
+                if t >= end:
+                    done = True
+                    break
+                if not keyframes_only and interval > 0:
+                    if t < next_sample:
+                        continue
+                    next_sample += interval * (1 + int((t - next_sample) // interval))
+
+                thumb = frame.reformat(width=thumb_size[0], height=thumb_size[1], format="rgb24")
+                batch_thumbs.append(thumb.to_ndarray())
+                tile = frame.reformat(width=tile_size[0], height=tile_size[1], format="rgb24")
+                batch_tiles.append(tile.to_ndarray())
+                times.append(t)
+                if first_thumb is None:
+                    first_thumb = batch_thumbs[-1]
+                if frames_dir is not None:
+                    write_png(Path(frames_dir) / f"{Path(path).stem}_{t:010.3f}.png",
+                              frame.to_ndarray(format="rgb24"))
+                if len(batch_thumbs) >= BATCH:
+                    flush()
+            if done:
+                break
+        flush()
+
+    return RangeResult(
+        times=np.array(times, dtype=np.float64),
+        scores=np.concatenate(scores) if scores else np.empty(0),
+        first_thumb=first_thumb,
+        last_thumb=previous,
+        tiles=tiles,
+        decoded=decoded,
+        seconds=time.process_time() - cpu0,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Scenes, contact sheet, summary
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Scene:
+    """
+    One detected scene (segment between two scene changes).
+
+    Attributes:
+        index   : 1-based scene number
+        start, end : Time range (seconds)
+        samples : Sampled frames in the scene
+        score   : Change score that started it (0 for the first scene)
+        motion  : Mean change score between consecutive samples inside it
+    """
+    index: int
+    start: float
+    end: float
+    samples: int
+    score: float
+    motion: float
+
+    def to_json(self) -> dict:
+        return {
+            "index": self.index,
+            "start": round(self.start, 3),
+            "end": round(self.end, 3),
+            "duration": round(self.end - self.start, 3),
+            "samples": self.samples,
+            "score": round(self.score, 4),
+            "motion": round(self.motion, 4),
+        }
+
+
+def merge_results(results: List[RangeResult]) -> Tuple[np.ndarray, np.ndarray, Dict[int, np.ndarray]]:
+    """
+    Concatenate range results in time order, scoring the first frame of
+    each range against the last frame of the range before it.
+    """
+    times, scores, tiles = [], [], {}
+    offset = 0
+    previous = None
+    for result in results:
+        if len(result.times) == 0:
+            continue
+        range_scores = result.scores.copy()
+        if previous is not None and result.first_thumb is not None:
+            range_scores[0] = change_scores(previous, result.first_thumb[None])[0]
+        times.append(result.times)
+        scores.append(range_scores)
+        tiles.update({offset + i: tile for i, tile in result.tiles.items()})
+        offset += len(result.times)
+        previous = result.last_thumb
+    if not times:
+        return np.empty(0), np.empty(0), {}
+    return np.concatenate(times), np.concatenate(scores), tiles
+
+
+def find_scenes(times: np.ndarray, scores: np.ndarray, threshold: float,
+                min_scene: float, duration_end: float) -> Tuple[List[int], List[Scene]]:
+    """
+    Scene starts (sample indices) and scenes from the per-sample scores.
+    """
+    if len(times) == 0:
+        return [], []
+    candidates = np.flatnonzero(np.nan_to_num(scores, nan=0.0) > threshold)
+    starts = [0]
+    for i in candidates:
+        if i > 0 and times[i] - times[starts[-1]] >= min_scene:
+            starts.append(int(i))
+
+    motion = np.nan_to_num(scores, nan=0.0)
+    scenes = []
+    bounds = starts + [len(times)]
+    for n, (a, b) in enumerate(zip(bounds, bounds[1:]), 1):
+        inner = motion[a + 1:b]
+        scenes.append(Scene(
+            index=n,
+            start=float(times[a]),
+            end=float(times[b]) if b < len(times) else duration_end,
+            samples=b - a,
+            score=float(motion[a]) if a > 0 else 0.0,
+            motion=float(inner.mean()) if len(inner) else 0.0,
+        ))
+    return starts, scenes
+
+
+def draw_label(tile: np.ndarray, text: str, scale: int = 2) -> None:
+    """
+    Write `text` (digits, ':' and '.') into the top-left corner of `tile`.
+    """
+    glyph_w, glyph_h = 3 * scale, 5 * scale
+    width = min(len(text) * (glyph_w + scale) + scale, tile.shape[1])
+    tile[:glyph_h + 2 * scale, :width] //= 4
+    for n, char in enumerate(text):
+        bits = _FONT.get(char)
+        if bits is None:
+            continue
+        glyph = np.array([int(b) for b in bits], dtype=bool).reshape(5, 3)
+        glyph = glyph.repeat(scale, axis=0).repeat(scale, axis=1)
+        x = scale + n * (glyph_w + scale)
+        if x + glyph_w > tile.shape[1]:
+            break
+        tile[scale:scale + glyph_h, x:x + glyph_w][glyph] = 255
+
+
+def format_time(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds, 1), 60)
+    return f"{int(minutes):02d}:{seconds:04.1f}"
+
+
+def build_sheet(tiles: List[np.ndarray], labels: List[str], columns: int) -> np.ndarray:
+    """
+    Arrange equally sized RGB tiles in a grid with a 4-pixel gap.
+    """
+    gap = 4
+    h, w = tiles[0].shape[:2]
+    columns = max(1, min(columns, len(tiles)))
+    rows = (len(tiles) + columns - 1) // columns
+    sheet = np.full((rows * (h + gap) + gap, columns * (w + gap) + gap, 3), 32, dtype=np.uint8)
+    for n, (tile, label) in enumerate(zip(tiles, labels)):
+        tile = tile.copy()
+        draw_label(tile, label)
+        y = gap + (n // columns) * (h + gap)
+        x = gap + (n % columns) * (w + gap)
+        sheet[y:y + h, x:x + w] = tile
+    return sheet
+
+
+def write_png(path: Path, rgb: np.ndarray) -> None:
+    """
+    Encode an (H, W, 3) uint8 array as PNG with PyAV's png encoder.
+    """
+    height, width = rgb.shape[:2]
+    frame = av.VideoFrame.from_ndarray(np.ascontiguousarray(rgb), format="rgb24")
+    codec = av.CodecContext.create("png", "w")
+    codec.width = width
+    codec.height = height
+    codec.pix_fmt = "rgb24"
+    data = b"".join(bytes(p) for p in codec.encode(frame))
+    data += b"".join(bytes(p) for p in codec.encode(None))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def analyse(args) -> int:
+    t0 = time.perf_counter()
+    info = probe(args.recording)
+    if info is None:
+        print(f"[!] No video stream in {args.recording!r}.")
+        return 1
+    if info.frames == 0:
+        print(f"[!] No video frames in {args.recording!r}.")
+        return 1
+    ranges = split_ranges(info, args.workers * 2 if args.workers > 1 else 1)
+    print(f"[*] {args.recording}: {info.codec} {info.width}x{info.height}, "
+          f"{info.duration:.1f} s, {info.frames} frames, {len(info.keyframes)} keyframe(s); "
+          f"{len(ranges)} range(s) on {min(args.workers, len(ranges))} worker(s).")
+    if args.frames_dir is not None:
+        Path(args.frames_dir).mkdir(parents=True, exist_ok=True)
+
+    task_args = [
+        (args.recording, start, end, args.interval, args.keyframes_only,
+         args.threshold, args.tile_width, args.frames_dir)
+        for start, end in ranges
+    ]
+    if args.workers > 1 and len(ranges) > 1:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(args.workers, len(ranges)),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as pool:
+            results = list(pool.map(analyse_range, *zip(*task_args)))
+    else:
+        results = [analyse_range(*a) for a in task_args]
+
+    times, scores, tiles = merge_results(results)
+    end = info.keyframes[0] + info.duration if info.keyframes else info.duration
+    starts, scenes = find_scenes(times, scores, args.threshold, args.min_scene, end)
+    wall = time.perf_counter() - t0
+
+    decoded = sum(r.decoded for r in results)
+    cpu = sum(r.seconds for r in results)
+    print(f"[+] Decoded {decoded} frame(s), analysed {len(times)} in {wall:.2f} s "
+          f"({info.duration / wall if wall > 0 else 0:.1f}x playback speed, "
+          f"{cpu:.2f} s CPU in workers).")
+
+    # Contact sheet: the first frame of each scene, the strongest changes
+    # first if there are more scenes than --max-tiles.
+    shown = [s for s in starts if s in tiles]
+    if len(shown) > args.max_tiles:
+        ranked = sorted(shown[1:], key=lambda i: -np.nan_to_num(scores[i]))
+        shown = sorted([shown[0]] + ranked[:args.max_tiles - 1])
+        print(f"[*] {len(starts)} scenes; the contact sheet shows the {args.max_tiles} "
+              f"strongest changes.")
+    sheet_path = Path(args.sheet or Path(args.recording).with_suffix(".sheet.png"))
+    if shown:
+        sheet = build_sheet([tiles[i] for i in shown],
+                            [format_time(times[i] - times[0]) for i in shown], args.columns)
+        write_png(sheet_path, sheet)
+        print(f"[+] Contact sheet ({len(shown)} tile(s)) written to {sheet_path}")
+
+    print(f"[*] {len(scenes)} scene(s) (threshold {args.threshold}, "
+          f"min {args.min_scene} s):")
+    print(f"    {'#':>3}  {'start':>8}  {'end':>8}  {'duration':>8}  {'samples':>7}  "
+          f"{'change':>6}  {'motion':>6}")
+    for scene in scenes:
+        print(f"    {scene.index:>3}  {format_time(scene.start - times[0]):>8}  "
+              f"{format_time(scene.end - times[0]):>8}  {scene.end - scene.start:>7.1f}s  "
+              f"{scene.samples:>7}  {scene.score:>6.3f}  {scene.motion:>6.3f}")
+
+    summary_path = Path(args.summary or Path(args.recording).with_suffix(".scenes.json"))
+    summary = {
+        "recording": str(args.recording),
+        "codec": info.codec,
+        "width": info.width,
+        "height": info.height,
+        "duration": round(info.duration, 3),
+        "keyframes": len(info.keyframes),
+        "sampling": "keyframes" if args.keyframes_only else f"every {args.interval} s",
+        "threshold": args.threshold,
+        "contact_sheet": str(sheet_path) if shown else None,
+        "scenes": [scene.to_json() for scene in scenes],
+    }
+    summary_path.write_text(json.dumps(summary, indent=2) + "\n", encoding="utf-8")
+    print(f"[+] Scene summary written to {summary_path}")
+    return 0
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Find scene changes in a recording and write a contact sheet "
+                    "and a per-scene summary.",
+    )
+    parser.add_argument("recording", help="Recording to analyse (e.g. recordings/client_a_intercept.webm)")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="Seconds between analysed frames; 0 = every frame (default: 1.0)")
+    parser.add_argument("--keyframes-only", action="store_true",
+                        help="Decode and analyse keyframes only (fastest; ignores --interval)")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Change score (0-1) that starts a new scene (default: 0.1)")
+    parser.add_argument("--min-scene", type=float, default=1.0,
+                        help="Minimum scene length in seconds (default: 1.0)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Decoding processes (default: number of CPUs)")
+    parser.add_argument("--tile-width", type=int, default=240,
+                        help="Contact sheet tile width in pixels (default: 240)")
+    parser.add_argument("--columns", type=int, default=4, help="Contact sheet columns (default: 4)")
+    parser.add_argument("--max-tiles", type=int, default=48,
+                        help="Maximum tiles on the contact sheet (default: 48)")
+    parser.add_argument("--sheet", default=None,
+                        help="Contact sheet path (default: <recording>.sheet.png)")
+    parser.add_argument("--summary", default=None,
+                        help="Scene summary path (default: <recording>.scenes.json)")
+    parser.add_argument("--frames-dir", default=None,
+                        help="Also write every analysed frame as a full-size PNG to this directory")
+    args = parser.parse_args(argv)
+    return analyse(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
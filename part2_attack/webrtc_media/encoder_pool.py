@@ -0,0 +1,366 @@
+"""
+encoder_pool.py
+
+Media encoding stage that runs in a worker process (--capture-mode process).
+
+aiortc's MediaRecorder encodes every decoded frame inside the asyncio event
+loop, so an expensive encode (720p VP8) delays ws.recv() and
+pc.addIceCandidate() for as long as it runs. ProcessRecorder keeps the same
+addTrack / start / stop interface but moves the encoder and the output
+container into a separate process:
+
+  - Each track gets a shared-memory ring of fixed-size slots. The event
+    loop only copies the raw frame planes into a free slot and sends a
+    small descriptor (slot, shape, pts, ...) over a multiprocessing queue.
+  - The worker rebuilds the frame from the slot, encodes and muxes it, and
+    hands the slot back together with the encode latency.
+  - The number of slots bounds the queue. When no slot is free the frame is
+    either dropped (on_full="drop", default: the track never falls behind
+    real time) or the track task waits for a slot (on_full="block": no
+    frames are lost, aiortc's track queue absorbs the backlog). Either way
+    the event loop itself never blocks.
+
+Queue depth, encode latency and dropped frames are available from stats().
+"""
+
+import asyncio
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from fractions import Fraction
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import av
+import numpy as np
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common.metrics import LatencyHistogram, format_summary  # noqa: E402
+
+ON_FULL_POLICIES = ("drop", "block")
+
+# Encoded audio packets held back while the video stream waits for its
+# first frame (its size is needed before the container header is written).
+_MAX_PENDING = 500
+
+
+# ---------------------------------------------------------------------------
+# Worker process
+# ---------------------------------------------------------------------------
+
+def _worker_main(path: str, fmt: Optional[str],
+                 tasks: "multiprocessing.Queue", done: "multiprocessing.Queue") -> None:
+    """
+    Encoder process: owns the output container and one stream per track.
+
+    Task messages:
+        ["audio", "video", ...]  first message: track kinds, in track order
+        (track, shm_name, slot, offset, shape, dtype, kind_args, pts, tb_num, tb_den)
+        None  -> flush encoders, close the container and exit
+    Done messages:
+        (track, shm_name, slot, None)        slot can be reused
+        (track, None, None, encode_seconds)  frame encoded and muxed
+        ("closed", error_or_None)
+    """
+    error = None
+    blocks: Dict[str, shared_memory.SharedMemory] = {}
+    try:
+        kinds = tasks.get()
+        if kinds is None:
+            return
+        container = av.open(path, format=fmt, mode="w")
+        streams = []
+        for kind in kinds:
+            if kind == "audio":
+                codec = "libopus" if container.format.name in ("ogg", "opus", "webm") else "aac"
+                streams.append(container.add_stream(codec, rate=48000))
+            else:
+                codec = "libvpx" if container.format.name == "webm" else "libx264"
+                stream = container.add_stream(codec, rate=30)
+                stream.pix_fmt = "yuv420p"
+                streams.append(stream)
+
+        sized = [kind != "video" for kind in kinds]
+        pending: deque = deque(maxlen=_MAX_PENDING)
+
+        def mux(packets) -> None:
+            if all(sized):
+                while pending:
+                    container.mux(pending.popleft())
+                for packet in packets:
+                    container.mux(packet)
+            else:
+                pending.extend(packets)
+
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            track, shm_name, slot, offset, shape, dtype, kind_args, pts, tb_num, tb_den = task
+            t0 = time.perf_counter()
+
+            shm = blocks.get(shm_name)
+            if shm is None:
+                shm = blocks[shm_name] = shared_memory.SharedMemory(name=shm_name)
+            array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+
+            stream = streams[track]
+            if kinds[track] == "video":
+                frame = av.VideoFrame.from_ndarray(array, format="yuv420p")
+                if not sized[track]:
+                    stream.width, stream.height = frame.width, frame.height
+                    sized[track] = True
+            else:
+                layout, sample_rate = kind_args
+                frame = av.AudioFrame.from_ndarray(array, format="s16", layout=layout)
+                frame.sample_rate = sample_rate
+            # The frame now owns a copy of the pixels / samples.
+            del array
+            done.put((track, shm_name, slot, None))
+
+            frame.pts = pts
+            frame.time_base = Fraction(tb_num, tb_den)
+            mux(stream.encode(frame))
+            done.put((track, None, None, time.perf_counter() - t0))
+
+        for stream in streams:
+            mux(stream.encode(None))
+        if pending:
+            # Video never started: write the audio we have.
+            sized = [True] * len(sized)
+            mux([])
+        container.close()
+    except Exception as e:  # reported to the parent, which logs it
+        error = repr(e)
+        # Drain so the parent's blocked producers can finish.
+        while True:
+            try:
+                if tasks.get(timeout=0.5) is None:
+                    break
+            except queue.Empty:
+                break
+    finally:
+        for shm in blocks.values():
+            shm.close()
+        done.put(("closed", error))
+
+
+# ---------------------------------------------------------------------------
+# Parent side
+# ---------------------------------------------------------------------------
+
+class _TrackRing:
+    """
+    Shared-memory slots for one track. Reallocated (with a new name) if a
+    frame does not fit, e.g. after a resolution change.
+    """
+
+    def __init__(self, slots: int) -> None:
+        self.slots = slots
+        self.shm: Optional[shared_memory.SharedMemory] = None
+        self.slot_size = 0
+        self.free: List[int] = []
+        self.in_use = 0
+        self.freed = asyncio.Event()
+        self.retired: List[shared_memory.SharedMemory] = []
+
+    def ensure(self, nbytes: int) -> None:
+        if self.shm is not None and nbytes <= self.slot_size:
+            return
+        if self.shm is not None:
+            # Slots of the old block may still be in flight; keep it alive
+            # until stop().
+            self.retired.append(self.shm)
+        self.slot_size = nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes * self.slots)
+        self.free = list(range(self.slots))
+        self.in_use = 0
+
+    def release(self) -> None:
+        for shm in self.retired + ([self.shm] if self.shm else []):
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self.retired = []
+        self.shm = None
+
+
+class ProcessRecorder:
+    """
+    MediaRecorder replacement that encodes in a separate process.
+
+    Parameters
+    ----------
+    file : str
+        Output path.
+
+    format : Optional[str]
+        Container format (e.g. "webm"); None lets PyAV guess from the name.
+
+    queue_size : int
+        Shared-memory slots per track, i.e. frames that may be waiting for
+        the encoder.
+
+    on_full : str
+        "drop" or "block" when every slot is in use (see module docstring).
+    """
+
+    def __init__(self, file: str, format: Optional[str] = None,
+                 queue_size: int = 8, on_full: str = "drop") -> None:
+        if on_full not in ON_FULL_POLICIES:
+            raise ValueError(f"on_full must be one of {ON_FULL_POLICIES}, got {on_full!r}")
+        self.file = file
+        self.format = format
+        self.queue_size = max(1, queue_size)
+        self.on_full = on_full
+
+        self.__tracks: List[MediaStreamTrack] = []
+        self.__rings: List[_TrackRing] = []
+        self.__tasks: List[asyncio.Task] = []
+        self.__started = False
+        self.__closed = asyncio.Event()
+        self.__worker_error: Optional[str] = None
+
+        # Metrics
+        self.submitted = 0
+        self.encoded = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.max_depth = 0
+        self.encode_latency = LatencyHistogram()
+
+        # The worker is spawned right away so that importing PyAV in the new
+        # interpreter overlaps with negotiation instead of the first frames.
+        # "spawn" avoids forking a process that runs aiortc's threads.
+        ctx = multiprocessing.get_context("spawn")
+        self.__task_q = ctx.Queue()
+        self.__done_q = ctx.Queue()
+        self.__process = ctx.Process(
+            target=_worker_main,
+            args=(file, format, self.__task_q, self.__done_q),
+            name="media-encoder",
+            daemon=True,
+        )
+        self.__process.start()
+        self.__reader: Optional[threading.Thread] = None
+
+    def addTrack(self, track: MediaStreamTrack) -> None:
+        self.__tracks.append(track)
+        self.__rings.append(_TrackRing(self.queue_size))
+
+    async def start(self) -> None:
+        if self.__started:
+            return
+        self.__started = True
+        loop = asyncio.get_running_loop()
+        self.__task_q.put([t.kind for t in self.__tracks])
+
+        self.__reader = threading.Thread(
+            target=self.__read_done, args=(loop,), name="media-encoder-done", daemon=True
+        )
+        self.__reader.start()
+
+        for index, track in enumerate(self.__tracks):
+            self.__tasks.append(asyncio.ensure_future(self.__run_track(index, track)))
+
+    async def stop(self) -> None:
+        if self.__process is None:
+            return
+        for task in self.__tasks:
+            task.cancel()
+        self.__tasks = []
+
+        self.__task_q.put(None)
+        loop = asyncio.get_running_loop()
+        if self.__started:
+            await self.__closed.wait()
+        await loop.run_in_executor(None, self.__process.join)
+        self.__process = None
+        for ring in self.__rings:
+            ring.release()
+        if self.__worker_error:
+            raise RuntimeError(f"encoder process failed: {self.__worker_error}")
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(ring.in_use for ring in self.__rings)
+
+    def stats(self) -> str:
+        return (f"submitted={self.submitted} encoded={self.encoded} "
+                f"dropped={self.dropped} blocked={self.blocked} "
+                f"depth={self.queue_depth} max_depth={self.max_depth}; "
+                + format_summary("encode", self.encode_latency))
+
+    # ------------------------------------------------------------------
+
+    def __read_done(self, loop: asyncio.AbstractEventLoop) -> None:
+        while True:
+            msg = self.__done_q.get()
+            loop.call_soon_threadsafe(self.__on_done, msg)
+            if msg[0] == "closed":
+                return
+
+    def __on_done(self, msg: Tuple) -> None:
+        if msg[0] == "closed":
+            self.__worker_error = msg[1]
+            self.__closed.set()
+            return
+        track, shm_name, slot, latency = msg
+        if slot is not None:
+            ring = self.__rings[track]
+            # Slots of a block retired by a resize are not reused.
+            if ring.shm is not None and ring.shm.name == shm_name:
+                ring.free.append(slot)
+                ring.in_use -= 1
+                ring.freed.set()
+        else:
+            self.encoded += 1
+            self.encode_latency.record(latency)
+
+    async def __acquire_slot(self, ring: _TrackRing) -> Optional[int]:
+        if not ring.free:
+            if self.on_full == "drop":
+                self.dropped += 1
+                return None
+            self.blocked += 1
+            while not ring.free:
+                ring.freed.clear()
+                await ring.freed.wait()
+        ring.in_use += 1
+        self.max_depth = max(self.max_depth, self.queue_depth)
+        return ring.free.pop()
+
+    async def __run_track(self, index: int, track: MediaStreamTrack) -> None:
+        ring = self.__rings[index]
+        while True:
+            try:
+                frame = await track.recv()
+            except MediaStreamError:
+                return
+
+            if track.kind == "video":
+                array = frame.to_ndarray(format="yuv420p")
+                kind_args = None
+            else:
+                array = frame.to_ndarray()
+                kind_args = (frame.layout.name, frame.sample_rate)
+
+            ring.ensure(array.nbytes)
+            slot = await self.__acquire_slot(ring)
+            if slot is None:
+                continue
+
+            offset = slot * ring.slot_size
+            np.ndarray(array.shape, dtype=array.dtype, buffer=ring.shm.buf, offset=offset)[...] = array
+            tb = frame.time_base or Fraction(1, 90000)
+            self.__task_q.put((index, ring.shm.name, slot, offset, array.shape, array.dtype.str,
+                               kind_args, frame.pts, tb.numerator, tb.denominator))
+            self.submitted += 1
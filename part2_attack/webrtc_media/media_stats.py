@@ -0,0 +1,279 @@
+"""
+media_stats.py
+
+Live per-track statistics for interceptor_webrtc.py (--stats-interval,
+--metrics-port).
+
+Every `interval` seconds MediaStatsCollector takes one sample per remote
+track from:
+
+  - RTCPeerConnection.getStats(): packets received / lost and jitter of
+    the inbound RTP stream, plus the bytes received on the transport.
+  - Counters kept on the receive path: RTP payload bytes per track (for
+    the bitrate; aiortc's inbound stats have no byte count) and frames
+    handed to the recorder (for the frame rate).
+  - The recorder side: frames waiting in the track's queue (how far the
+    recorder lags behind the network) and, where the recorder has them,
+    its queue depth and dropped frames.
+
+The sample is written to the log as one line per track and kept as the
+current snapshot, which the optional HTTP endpoint renders in the
+Prometheus text format. Scrapes never trigger a getStats() call, so the
+cost per interval is fixed no matter how often the endpoint is polled.
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from aiortc import RTCPeerConnection, RTCRtpReceiver
+from aiortc.mediastreams import MediaStreamTrack
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common.metrics import prometheus_metric, serve_metrics  # noqa: E402
+
+# RTP clock rates used to convert jitter (reported in timestamp units).
+CLOCK_RATES = {"audio": 48000, "video": 90000}
+
+
+class TrackCounters:
+    """
+    Running totals for one remote track, updated on the receive path.
+    """
+
+    def __init__(self, kind: str, mid: str) -> None:
+        self.kind = kind
+        self.mid = mid
+        self.rtp_packets = 0
+        self.rtp_bytes = 0
+        self.frames = 0
+        self.source: Optional[MediaStreamTrack] = None
+        self.receiver: Optional[RTCRtpReceiver] = None
+        # Totals at the previous sample, for rates.
+        self.prev_frames = 0
+        self.prev_rtp_bytes = 0
+
+
+class _MeteredTrack(MediaStreamTrack):
+    """
+    Forwards frames from a remote track to the recorder, counting them.
+    """
+
+    def __init__(self, source: MediaStreamTrack, counters: TrackCounters) -> None:
+        super().__init__()
+        self.kind = source.kind
+        self.__source = source
+        self.__counters = counters
+
+    async def recv(self):
+        frame = await self.__source.recv()
+        self.__counters.frames += 1
+        return frame
+
+
+class MediaStatsCollector:
+    """
+    Samples getStats() and recorder counters periodically.
+
+    Parameters
+    ----------
+    pc : RTCPeerConnection
+        Connection whose inbound tracks are measured.
+
+    recorder : object
+        The recorder the tracks feed; optional counters are read from it
+        (dropped; a SegmentedRecorder sums it over its segments) or from
+        its `current` inner recorder (queue_depth).
+
+    interval : float
+        Seconds between samples.
+
+    log : Callable[[str], None]
+        Receives one line per track per sample.
+    """
+
+    def __init__(self, pc: RTCPeerConnection, recorder: object = None,
+                 interval: float = 5.0, log: Callable[[str], None] = print) -> None:
+        self.pc = pc
+        self.recorder = recorder
+        self.interval = interval
+        self.log = log
+
+        self.tracks: List[TrackCounters] = []
+        self.snapshot: List[Dict[str, float]] = []
+        self.transport_bytes = 0
+        self.samples = 0
+        self.sample_seconds = 0.0
+
+        self.__task: Optional[asyncio.Task] = None
+        self.__server: Optional[asyncio.AbstractServer] = None
+        self.__last_sample = 0.0
+
+    def add_track(self, track: MediaStreamTrack) -> MediaStreamTrack:
+        """
+        Start measuring a remote track. Returns the track to hand to the
+        recorder in its place.
+        """
+        # The mid tells apart tracks of the same kind (label "mid").
+        mid = next((t.mid for t in self.pc.getTransceivers()
+                    if t.receiver.track is track and t.mid is not None), track.id)
+        counters = TrackCounters(track.kind, mid)
+        counters.source = track
+        for receiver in self.pc.getReceivers():
+            if receiver.track is track:
+                counters.receiver = receiver
+                self.__count_rtp(receiver, counters)
+        self.tracks.append(counters)
+        return _MeteredTrack(track, counters)
+
+    async def start(self, metrics_host: str = "127.0.0.1",
+                    metrics_port: Optional[int] = None) -> None:
+        self.__last_sample = time.monotonic()
+        if metrics_port is not None and self.__server is None:
+            self.__server = await serve_metrics(self.render_prometheus, metrics_host, metrics_port)
+            port = self.__server.sockets[0].getsockname()[1]
+            self.log(f"[*] Media metrics at http://{metrics_host}:{port}/metrics")
+        if self.interval > 0 and self.__task is None:
+            self.__task = asyncio.ensure_future(self.__run())
+
+    async def stop(self) -> None:
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+
+    async def sample(self) -> List[Dict[str, float]]:
+        """
+        Take one sample, update the snapshot and log it.
+        """
+        t0 = time.perf_counter()
+        now = time.monotonic()
+        elapsed = max(now - self.__last_sample, 1e-6)
+        self.__last_sample = now
+
+        report = await self.pc.getStats()
+        inbound: Dict[int, object] = {}
+        transport_bytes = 0
+        for stats in report.values():
+            if stats.type == "inbound-rtp":
+                inbound[stats.ssrc] = stats
+            elif stats.type == "transport":
+                transport_bytes += stats.bytesReceived
+        self.transport_bytes = transport_bytes
+
+        recorder = getattr(self.recorder, "current", None) or self.recorder
+        dropped = getattr(self.recorder, "dropped", None)
+        depth = getattr(recorder, "queue_depth", None)
+
+        snapshot = []
+        for c in self.tracks:
+            received = lost = 0
+            jitter = 0.0
+            if c.receiver is not None:
+                for source in c.receiver.getSynchronizationSources():
+                    stats = inbound.get(source.source)
+                    if stats is not None:
+                        received += stats.packetsReceived
+                        lost += stats.packetsLost
+                        jitter = max(jitter, stats.jitter / CLOCK_RATES.get(c.kind, 90000))
+            # Frames decoded but not yet taken by the recorder.
+            queue = getattr(c.source, "_queue", None)
+            row = {
+                "kind": c.kind,
+                "mid": c.mid,
+                "frames": c.frames,
+                "fps": (c.frames - c.prev_frames) / elapsed,
+                "rtp_bytes": c.rtp_bytes,
+                "bitrate_bps": (c.rtp_bytes - c.prev_rtp_bytes) * 8 / elapsed,
+                "packets_received": received,
+                "packets_lost": lost,
+                "jitter_s": jitter,
+                "lag_frames": queue.qsize() if queue is not None else 0,
+            }
+            c.prev_frames, c.prev_rtp_bytes = c.frames, c.rtp_bytes
+            snapshot.append(row)
+
+            loss = 100.0 * lost / (received + lost) if received + lost > 0 else 0.0
+            extra = ""
+            if depth is not None:
+                extra += f", encode queue {depth}"
+            if dropped is not None:
+                extra += f", recorder dropped {dropped}"
+            self.log(f"[*] Media stats {c.kind} (mid {c.mid}): {row['fps']:.1f} fps, "
+                     f"{row['bitrate_bps'] / 1e3:.0f} kbit/s, lost {lost} ({loss:.1f}%), "
+                     f"jitter {jitter * 1e3:.1f} ms, lag {row['lag_frames']} frame(s){extra}")
+
+        self.snapshot = snapshot
+        self.samples += 1
+        self.sample_seconds += time.perf_counter() - t0
+        return snapshot
+
+    def render_prometheus(self) -> str:
+        rows = self.snapshot
+        recorder = getattr(self.recorder, "current", None) or self.recorder
+
+        def per_track(key: str) -> list:
+            return [({"kind": r["kind"], "mid": r["mid"]}, r[key]) for r in rows]
+
+        lines: List[str] = []
+        lines += prometheus_metric("interceptor_track_frames_total", "counter",
+                                   "Frames delivered to the recorder.", per_track("frames"))
+        lines += prometheus_metric("interceptor_track_frames_per_second", "gauge",
+                                   "Frame rate over the last sample interval.", per_track("fps"))
+        lines += prometheus_metric("interceptor_track_rtp_bytes_total", "counter",
+                                   "RTP payload bytes received.", per_track("rtp_bytes"))
+        lines += prometheus_metric("interceptor_track_bitrate_bps", "gauge",
+                                   "RTP payload bitrate over the last sample interval.",
+                                   per_track("bitrate_bps"))
+        lines += prometheus_metric("interceptor_track_packets_received_total", "counter",
+                                   "RTP packets received (getStats).", per_track("packets_received"))
+        lines += prometheus_metric("interceptor_track_packets_lost_total", "counter",
+                                   "RTP packets lost (getStats).", per_track("packets_lost"))
+        lines += prometheus_metric("interceptor_track_jitter_seconds", "gauge",
+                                   "Interarrival jitter (getStats).", per_track("jitter_s"))
+        lines += prometheus_metric("interceptor_track_recorder_lag_frames", "gauge",
+                                   "Frames waiting for the recorder.", per_track("lag_frames"))
+        lines += prometheus_metric("interceptor_transport_bytes_received_total", "counter",
+                                   "Bytes received on the DTLS transport.",
+                                   [({}, self.transport_bytes)])
+        for source, attr, name, metric_type, help_text in (
+            (self.recorder, "dropped", "interceptor_recorder_dropped_frames_total", "counter",
+             "Frames dropped by the recorder (all segments)."),
+            (recorder, "queue_depth", "interceptor_recorder_queue_depth", "gauge",
+             "Frames waiting for the encoder process."),
+        ):
+            value = getattr(source, attr, None)
+            if value is not None:
+                lines += prometheus_metric(name, metric_type, help_text, [({}, value)])
+        lines += prometheus_metric("interceptor_stats_sample_seconds_total", "counter",
+                                   "Time spent taking samples.", [({}, self.sample_seconds)])
+        return "\n".join(lines) + "\n"
+
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def __count_rtp(receiver: RTCRtpReceiver, counters: TrackCounters) -> None:
+        # aiortc exposes no byte counts per stream, so count at the point
+        # where the transport hands packets to the receiver.
+        handle = receiver._handle_rtp_packet
+
+        async def counted(packet, arrival_time_ms: int) -> None:
+            counters.rtp_packets += 1
+            counters.rtp_bytes += len(packet.payload)
+            await handle(packet, arrival_time_ms=arrival_time_ms)
+
+        receiver._handle_rtp_packet = counted
+
+    async def __run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sample()
+            except Exception as e:  # never let stats take the session down
+                self.log(f"[!] Media stats sample failed: {e!r}")
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+passthrough.py
+
+Passthrough media capture for interceptor_webrtc.py (--capture-mode passthrough).
+
+aiortc's MediaRecorder receives *decoded* frames from the track and encodes
+them again (libvpx / libopus) before writing the .webm file. Both the
+decode (in aiortc's decoder thread) and the re-encode (in the event loop)
+are pure overhead when all we want is a copy of what the browser sent.
+
+This module writes the received encoded VP8 / Opus payloads straight into
+a WebM (Matroska) container:
+
+  - install_passthrough_decoders() replaces the decoder that aiortc's
+    RTCRtpReceiver creates for each codec with PassthroughDecoder, which
+    hands the depayloaded, reassembled frame on unchanged (aiortc has no
+    public API for encoded frames, so the module-level get_decoder used by
+    its decoder thread is swapped). Remote tracks then yield EncodedFrame
+    objects instead of av.VideoFrame / av.AudioFrame.
+  - PassthroughRecorder has the same interface as MediaRecorder
+    (addTrack / start / stop) and muxes those frames as packets.
+
+Transcoding is an optional offline step:
+
+    python passthrough.py transcode recordings/intercepted_media.webm out.mp4
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+from fractions import Fraction
+from typing import Callable, Deque, Dict, List, Optional
+
+import av
+import aiortc.rtcrtpreceiver
+from aiortc.codecs import get_decoder as _aiortc_get_decoder
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+
+# Codecs that can be muxed into WebM without transcoding, keyed by the
+# RTP codec name, mapped to the PyAV codec used to describe the stream.
+WEBM_CODECS = {"video/VP8": "libvpx", "audio/opus": "libopus"}
+
+# Audio frames kept while waiting for the first video keyframe (which is
+# needed to learn the frame size before the WebM header can be written).
+MAX_PENDING_FRAMES = 500
+
+
+@dataclass
+class EncodedFrame:
+    """
+    One encoded media frame as received from the network.
+
+    Attributes:
+        mime_type  : RTP codec, e.g. "video/VP8" or "audio/opus"
+        data       : Depayloaded frame (a complete VP8 frame / Opus packet)
+        timestamp  : RTP timestamp, already rebased to start at 0 by aiortc
+        clock_rate : RTP clock rate of the codec
+    """
+    mime_type: str
+    data: bytes
+    timestamp: int
+    clock_rate: int
+
+    @property
+    def is_keyframe(self) -> bool:
+        if self.mime_type == "video/VP8":
+            # Bit 0 of the VP8 frame tag is the inverse key frame flag.
+            return bool(self.data) and not (self.data[0] & 0x01)
+        return True
+
+
+class PassthroughDecoder:
+    """
+    Stand-in for aiortc's Vp8Decoder / OpusDecoder that does not decode.
+    Runs in aiortc's decoder thread.
+    """
+
+    def __init__(self, codec) -> None:
+        self.mime_type = codec.mimeType
+        self.clock_rate = codec.clockRate
+
+    def decode(self, encoded_frame) -> List[EncodedFrame]:
+        return [EncodedFrame(self.mime_type, encoded_frame.data,
+                             encoded_frame.timestamp, self.clock_rate)]
+
+
+def _passthrough_get_decoder(codec):
+    return PassthroughDecoder(codec)
+
+
+def install_passthrough_decoders() -> None:
+    """
+    Make every RTCRtpReceiver created from now on deliver EncodedFrame
+    objects instead of decoded frames. Affects the whole process.
+    """
+    aiortc.rtcrtpreceiver.get_decoder = _passthrough_get_decoder
+
+
+def uninstall_passthrough_decoders() -> None:
+    aiortc.rtcrtpreceiver.get_decoder = _aiortc_get_decoder
+
+
+def vp8_frame_size(data: bytes) -> Optional[tuple]:
+    """
+    Width and height from a VP8 key frame header (RFC 6386, 9.1).
+    """
+    if len(data) < 10 or data[3:6] != b"\x9d\x01\x2a":
+        return None
+    width = int.from_bytes(data[6:8], "little") & 0x3FFF
+    height = int.from_bytes(data[8:10], "little") & 0x3FFF
+    return width, height
+
+
+class _TrackContext:
+    def __init__(self, stream) -> None:
+        self.stream = stream
+        self.task: Optional[asyncio.Task] = None
+        self.started = False
+        self.first_ts: Optional[int] = None
+        self.last_ts = 0
+        self.clock_rate = 0
+        self.frames = 0
+        self.bytes = 0
+        self.unsupported = 0
+
+    @property
+    def media_seconds(self) -> float:
+        if self.first_ts is None or not self.clock_rate:
+            return 0.0
+        return (self.last_ts - self.first_ts) / self.clock_rate
+
+
+class PassthroughRecorder:
+    """
+    Writes encoded VP8 / Opus frames to a WebM file without transcoding.
+
+    Drop-in for aiortc.contrib.media.MediaRecorder when
+    install_passthrough_decoders() is active.
+
+    Parameters
+    ----------
+    file : str
+        Output path (.webm / .mkv).
+
+    format : Optional[str]
+        Container format; defaults to "webm".
+
+    log : Callable[[str], None]
+        Receives warnings (e.g. frames the container cannot hold).
+    """
+
+    def __init__(self, file: str, format: Optional[str] = None,
+                 log: Callable[[str], None] = print) -> None:
+        self.log = log
+        self.__container = av.open(file=file, format=format or "webm", mode="w")
+        self.__tracks: Dict[MediaStreamTrack, _TrackContext] = {}
+        self.__pending: Deque[tuple] = deque(maxlen=MAX_PENDING_FRAMES)
+        self.__header_ready = False
+        self.__cpu_start: Optional[float] = None
+        self.cpu_seconds = 0.0
+        self.dropped = 0
+
+    def addTrack(self, track: MediaStreamTrack) -> None:
+        if track.kind == "audio":
+            stream = self.__container.add_stream("libopus", rate=48000)
+        else:
+            stream = self.__container.add_stream("libvpx", rate=30)
+            stream.pix_fmt = "yuv420p"
+        self.__tracks[track] = _TrackContext(stream)
+
+    async def start(self) -> None:
+        self.__cpu_start = time.process_time()
+        for track, context in self.__tracks.items():
+            if context.task is None:
+                context.task = asyncio.ensure_future(self.__run_track(track, context))
+
+    async def stop(self) -> None:
+        if self.__container is None:
+            return
+        for context in self.__tracks.values():
+            if context.task is not None:
+                context.task.cancel()
+                context.task = None
+        if self.__cpu_start is not None:
+            self.cpu_seconds = time.process_time() - self.__cpu_start
+        # Never got a video keyframe: write what we have rather than nothing.
+        if not self.__header_ready and self.__pending:
+            self.__flush_pending(force=True)
+        self.__container.close()
+        self.__container = None
+
+    @property
+    def media_seconds(self) -> float:
+        return max((c.media_seconds for c in self.__tracks.values()), default=0.0)
+
+    def stats(self) -> str:
+        parts = []
+        for track, c in self.__tracks.items():
+            parts.append(f"{track.kind}: {c.frames} frames, {c.bytes} bytes, "
+                         f"{c.media_seconds:.1f}s"
+                         + (f", {c.unsupported} unsupported" if c.unsupported else ""))
+        return "; ".join(parts)
+
+    async def __run_track(self, track: MediaStreamTrack, context: _TrackContext) -> None:
+        while True:
+            try:
+                frame = await track.recv()
+            except MediaStreamError:
+                return
+
+            if not isinstance(frame, EncodedFrame) or frame.mime_type not in WEBM_CODECS:
+                # Decoded frame (passthrough decoders not installed) or a
+                # codec WebM cannot hold, e.g. H264 or PCMU.
+                context.unsupported += 1
+                if context.unsupported == 1:
+                    self.log(f"[!] Passthrough recorder cannot store "
+                             f"{getattr(frame, 'mime_type', type(frame).__name__)} "
+                             f"frames on the {track.kind} track; dropping them.")
+                continue
+
+            if not context.started:
+                if not frame.is_keyframe:
+                    continue
+                if frame.mime_type == "video/VP8":
+                    size = vp8_frame_size(frame.data)
+                    if size is None:
+                        continue
+                    context.stream.width, context.stream.height = size
+                context.started = True
+                context.first_ts = frame.timestamp
+                context.clock_rate = frame.clock_rate
+
+            context.last_ts = frame.timestamp
+            context.frames += 1
+            context.bytes += len(frame.data)
+
+            if self.__header_ready:
+                self.__mux(context, frame)
+            else:
+                if len(self.__pending) == self.__pending.maxlen:
+                    self.dropped += 1
+                self.__pending.append((context, frame))
+                self.__flush_pending()
+
+    def __flush_pending(self, force: bool = False) -> None:
+        # The header can only be written once every video stream knows its
+        # frame size, i.e. has seen a keyframe.
+        waiting = any(not c.started and c.stream.type == "video"
+                      for c in self.__tracks.values())
+        if waiting and not force:
+            return
+        self.__header_ready = True
+        while self.__pending:
+            context, frame = self.__pending.popleft()
+            if context.started:
+                self.__mux(context, frame)
+
+    def __mux(self, context: _TrackContext, frame: EncodedFrame) -> None:
+        packet = av.Packet(frame.data)
+        packet.stream = context.stream
+        packet.time_base = Fraction(1, frame.clock_rate)
+        packet.pts = packet.dts = frame.timestamp - context.first_ts
+        packet.is_keyframe = frame.is_keyframe
+        self.__container.mux(packet)
+
+
+# ---------------------------------------------------------------------------
+# Offline transcoding
+# ---------------------------------------------------------------------------
+
+def transcode(src: str, dst: str) -> None:
+    """
+    Decode a recording and encode it again; the output format and codecs are
+    chosen from the destination extension (e.g. .mp4 -> H.264 / AAC).
+    """
+    with av.open(src) as inp, av.open(dst, mode="w") as out:
+        mapping = {}
+        for stream in inp.streams:
+            if stream.type == "video":
+                codec = "libvpx" if dst.endswith(".webm") else "libx264"
+                ostream = out.add_stream(codec, rate=30)
+                ostream.width = stream.codec_context.width
+                ostream.height = stream.codec_context.height
+                ostream.pix_fmt = "yuv420p"
+            elif stream.type == "audio":
+                codec = "libopus" if dst.endswith(".webm") else "aac"
+                ostream = out.add_stream(codec, rate=48000)
+            else:
+                continue
+            mapping[stream.index] = ostream
+
+        for packet in inp.demux(*[inp.streams[i] for i in mapping]):
+            ostream = mapping[packet.stream.index]
+            for frame in packet.decode():
+                frame.pts = None
+                for opacket in ostream.encode(frame):
+                    out.mux(opacket)
+        for ostream in mapping.values():
+            for opacket in ostream.encode(None):
+                out.mux(opacket)
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Offline tools for passthrough recordings.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_transcode = sub.add_parser("transcode", help="Re-encode a recording to another format.")
+    p_transcode.add_argument("src", help="Input recording (e.g. recordings/intercepted_media.webm)")
+    p_transcode.add_argument("dst", help="Output file; the extension selects the format")
+    args = parser.parse_args(argv)
+
+    if args.command == "transcode":
+        t0 = time.perf_counter()
+        transcode(args.src, args.dst)
+        print(f"[+] Transcoded {args.src!r} -> {args.dst!r} in {time.perf_counter() - t0:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
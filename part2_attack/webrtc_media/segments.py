@@ -0,0 +1,409 @@
+"""
+segments.py
+
+Segmented recording for interceptor_webrtc.py (--segment-seconds / --segment-mb).
+
+Without segmentation the whole call goes into one file that is only
+finalized when the recorder stops; a long session produces one huge file
+and a crash leaves it truncated. SegmentedRecorder instead writes a series
+of files next to the configured output:
+
+    recordings/intercepted_media.00000.webm
+    recordings/intercepted_media.00001.webm
+    ...
+    recordings/intercepted_media.manifest.json
+
+  - A new segment starts every `segment_seconds` or once the current file
+    reaches `segment_bytes`, whichever comes first. Each segment is written
+    by its own inner recorder (MediaRecorder, PassthroughRecorder or
+    ProcessRecorder, built by `make_recorder`), which is stopped -- and so
+    finalized -- before the next one takes over the tracks.
+  - Each remote track has exactly one reader task, which hands its frames
+    to the open segment. At a rollover the old recorder drains the frames
+    it was given and its track tasks finish before it is stopped and the
+    next recorder starts; frames arriving meanwhile are held for the next
+    segment. Recorders never read the remote tracks themselves, so two of
+    them never consume the same track at once.
+  - Frame timestamps are rebased to 0 at the start of every segment and a
+    keyframe is requested from the sender (`request_keyframe`), so each
+    file plays on its own.
+  - The manifest lists the segments with their wall-clock and call-relative
+    time ranges. It is rewritten atomically whenever a segment opens or
+    closes; after an abrupt exit only the segment marked "complete": false
+    is affected.
+  - With `keep` > 0 only the newest `keep` segments stay on disk; older
+    files are deleted and dropped from the manifest, bounding disk usage.
+"""
+
+import asyncio
+import collections
+import json
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+
+# How often the size of the open segment is checked.
+SIZE_CHECK_INTERVAL = 0.5
+
+# Frames held per track while no segment is open (during a rollover).
+MAX_HELD_FRAMES = 300
+
+# Seconds a closing segment's recorder gets to drain its tracks before it
+# is stopped anyway.
+DRAIN_TIMEOUT = 5.0
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+class _SegmentTrack(MediaStreamTrack):
+    """
+    Per-segment view of a remote track, fed by its _SourceReader: returns
+    the frames handed to it and rebases their pts so the segment starts at
+    0. Encoded passthrough frames (which have no pts) are forwarded as-is;
+    PassthroughRecorder rebases those itself.
+
+    After end() the queued frames are still returned, then recv() raises
+    MediaStreamError (which ends the recorder's task for the track) and
+    `finished` is set.
+    """
+
+    def __init__(self, kind: str) -> None:
+        super().__init__()
+        self.kind = kind
+        self.finished = asyncio.Event()
+        self.__queue: "asyncio.Queue" = asyncio.Queue()
+        self.__base: Optional[int] = None
+
+    def put(self, frame) -> None:
+        self.__queue.put_nowait(frame)
+
+    def end(self) -> None:
+        self.__queue.put_nowait(None)
+
+    async def recv(self):
+        frame = await self.__queue.get()
+        if frame is None:
+            self.__queue.put_nowait(None)  # later recv() calls end as well
+            self.finished.set()
+            raise MediaStreamError
+        pts = getattr(frame, "pts", None)
+        if pts is not None:
+            if self.__base is None:
+                self.__base = pts
+            frame.pts = pts - self.__base
+        return frame
+
+
+class _SourceReader:
+    """
+    The only consumer of a remote track: reads it in one task and hands
+    each frame to the _SegmentTrack of the open segment, or holds it (up
+    to MAX_HELD_FRAMES) while no segment is open.
+    """
+
+    def __init__(self, source: MediaStreamTrack) -> None:
+        self.source = source
+        self.__target: Optional[_SegmentTrack] = None
+        self.__held: Deque = collections.deque(maxlen=MAX_HELD_FRAMES)
+        self.__task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.__task is None:
+            self.__task = asyncio.ensure_future(self.__run())
+
+    async def stop(self) -> None:
+        if self.__task is not None:
+            self.__task.cancel()
+            await asyncio.gather(self.__task, return_exceptions=True)
+            self.__task = None
+
+    def attach(self) -> _SegmentTrack:
+        """
+        Start feeding a new segment track, held frames first.
+        """
+        track = _SegmentTrack(self.source.kind)
+        while self.__held:
+            track.put(self.__held.popleft())
+        self.__target = track
+        return track
+
+    def detach(self) -> Optional[_SegmentTrack]:
+        """
+        End the current segment track; frames are held from now on.
+        """
+        track, self.__target = self.__target, None
+        if track is not None:
+            track.end()
+        return track
+
+    async def __run(self) -> None:
+        while True:
+            try:
+                frame = await self.source.recv()
+            except MediaStreamError:
+                frame = None  # ends the segment track
+            if self.__target is not None:
+                self.__target.put(frame)
+            else:
+                self.__held.append(frame)
+            if frame is None:
+                return
+
+
+class SegmentedRecorder:
+    """
+    Recorder that rolls over to a new file every N seconds or N bytes.
+
+    Same interface as MediaRecorder (addTrack / start / stop).
+
+    Parameters
+    ----------
+    output_file : Path
+        Base path; segments are named <stem>.<index><suffix>.
+
+    make_recorder : Callable[[str], object]
+        Builds the inner recorder for one segment file.
+
+    segment_seconds : float
+        Maximum segment duration (0 = no time limit).
+
+    segment_bytes : int
+        Maximum segment size (0 = no size limit). Checked every
+        SIZE_CHECK_INTERVAL seconds, so segments can overshoot slightly.
+
+    keep : int
+        Number of segments kept on disk (0 = keep all).
+
+    request_keyframe : Optional[Callable[[], Awaitable[None]]]
+        Asks the sender for a keyframe when a new segment starts.
+
+    log : Callable[[str], None]
+        Where rollover messages go.
+    """
+
+    def __init__(self, output_file: Path, make_recorder: Callable[[str], object],
+                 segment_seconds: float = 0.0, segment_bytes: int = 0, keep: int = 0,
+                 request_keyframe: Optional[Callable[[], Awaitable[None]]] = None,
+                 log: Callable[[str], None] = print) -> None:
+        self.output_file = Path(output_file)
+        self.make_recorder = make_recorder
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.keep = keep
+        self.request_keyframe = request_keyframe
+        self.log = log
+
+        self.manifest_path = self.output_file.with_name(self.output_file.stem + ".manifest.json")
+        self.segments: List[Dict] = []
+        self.deleted = 0
+
+        self.__tracks: List[MediaStreamTrack] = []
+        self.__readers: List[_SourceReader] = []
+        self.__recorder = None
+        self.__index = 0
+        self.__opened_at = 0.0
+        self.__call_start = 0.0
+        self.__monitor: Optional[asyncio.Task] = None
+        self.__lock = asyncio.Lock()
+        # Frames dropped by the recorders of closed segments (None while
+        # no inner recorder has counted drops).
+        self.__dropped: Optional[int] = None
+        self.__dropped_counted = None
+
+    def addTrack(self, track: MediaStreamTrack) -> None:
+        self.__tracks.append(track)
+
+    async def start(self) -> None:
+        if self.__recorder is not None:
+            return
+        self.output_file.parent.mkdir(parents=True, exist_ok=True)
+        self.__call_start = time.monotonic()
+        self.__readers = [_SourceReader(track) for track in self.__tracks]
+        for reader in self.__readers:
+            reader.start()
+        recorder = self.__open_segment()
+        await self.__start_segment(recorder)
+        self.__monitor = asyncio.ensure_future(self.__run_monitor())
+
+    async def stop(self) -> None:
+        if self.__monitor is not None:
+            self.__monitor.cancel()
+            self.__monitor = None
+        async with self.__lock:
+            if self.__recorder is not None:
+                await self.__close_segment()
+                self.__recorder = None
+        for reader in self.__readers:
+            await reader.stop()
+        self.__readers = []
+
+    def segment_path(self, index: int) -> Path:
+        return self.output_file.with_name(
+            f"{self.output_file.stem}.{index:05d}{self.output_file.suffix}"
+        )
+
+    @property
+    def current(self):
+        """
+        Inner recorder of the open segment (None when stopped).
+        """
+        return self.__recorder
+
+    @property
+    def dropped(self) -> Optional[int]:
+        """
+        Frames dropped by the inner recorders of all segments so far, or
+        None if they do not count drops (MediaRecorder).
+        """
+        current = None
+        if self.__recorder is not self.__dropped_counted:
+            current = getattr(self.__recorder, "dropped", None)
+        if current is None:
+            return self.__dropped
+        return (self.__dropped or 0) + current
+
+    def stats(self) -> str:
+        total = sum(s["bytes"] for s in self.segments)
+        return (f"{self.__index} segment(s) written, {len(self.segments)} on disk "
+                f"({total} bytes), {self.deleted} deleted by retention; "
+                f"manifest {self.manifest_path}")
+
+    async def rotate(self) -> None:
+        """
+        Finalize the open segment and continue in a new file.
+        """
+        async with self.__lock:
+            if self.__recorder is None:
+                return
+            # Build the next recorder first (ProcessRecorder spawns its worker
+            # here) so it gets ready while the current segment is flushed.
+            recorder = self.__open_segment()
+            try:
+                await self.__close_segment()
+                await self.__start_segment(recorder)
+            except Exception:
+                # A next recorder that never took over must not keep its
+                # encoder process alive; the monitor tries again later.
+                if self.__recorder is not recorder:
+                    await recorder.stop()
+                raise
+
+    # ------------------------------------------------------------------
+
+    def __open_segment(self):
+        path = self.segment_path(self.__index)
+        return self.make_recorder(str(path))
+
+    async def __start_segment(self, recorder) -> None:
+        for reader in self.__readers:
+            recorder.addTrack(reader.attach())
+        try:
+            await recorder.start()
+        except Exception:
+            for reader in self.__readers:
+                reader.detach()
+            raise
+        self.__recorder = recorder
+        self.__opened_at = time.monotonic()
+
+        path = self.segment_path(self.__index)
+        self.segments.append({
+            "index": self.__index,
+            "file": path.name,
+            "start": _utc_now(),
+            "end": None,
+            "offset_s": round(self.__opened_at - self.__call_start, 3),
+            "duration_s": None,
+            "bytes": 0,
+            "complete": False,
+        })
+        self.__index += 1
+        self.__write_manifest()
+        self.log(f"[*] Recording segment {path.name}")
+
+        # The first segment starts with the call, which begins on a keyframe.
+        if self.request_keyframe is not None and self.__index > 1:
+            try:
+                await self.request_keyframe()
+            except Exception as e:  # best effort; the segment just starts later
+                self.log(f"[!] Keyframe request failed: {e!r}")
+
+    async def __close_segment(self) -> None:
+        # Let the recorder's track tasks drain and return before stop():
+        # stop() only cancels them, and the next recorder must not start
+        # while they may still be running.
+        tracks = [t for t in (r.detach() for r in self.__readers) if t is not None]
+        if tracks:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(t.finished.wait() for t in tracks)), DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.log(f"[!] Segment {self.segments[-1]['file']} did not drain its tracks "
+                         f"within {DRAIN_TIMEOUT:g}s; stopping its recorder anyway.")
+        await self.__recorder.stop()
+        # A failed rollover closes the same recorder again; count it once.
+        if self.__recorder is not self.__dropped_counted:
+            self.__dropped = self.dropped
+            self.__dropped_counted = self.__recorder
+        entry = self.segments[-1]
+        path = self.output_file.with_name(entry["file"])
+        entry["end"] = _utc_now()
+        entry["duration_s"] = round(time.monotonic() - self.__opened_at, 3)
+        entry["bytes"] = path.stat().st_size if path.exists() else 0
+        entry["complete"] = True
+        self.log(f"[+] Segment {entry['file']} finalized "
+                 f"({entry['duration_s']:.1f}s, {entry['bytes']} bytes).")
+        if hasattr(self.__recorder, "stats"):
+            self.log(f"[*]   {self.__recorder.stats()}")
+        self.__apply_retention()
+        self.__write_manifest()
+
+    def __apply_retention(self) -> None:
+        if self.keep <= 0:
+            return
+        while len(self.segments) > self.keep:
+            old = self.segments.pop(0)
+            try:
+                os.remove(self.output_file.with_name(old["file"]))
+            except FileNotFoundError:
+                pass
+            self.deleted += 1
+
+    def __write_manifest(self) -> None:
+        data = {
+            "output": self.output_file.name,
+            "segment_seconds": self.segment_seconds,
+            "segment_bytes": self.segment_bytes,
+            "keep": self.keep,
+            "deleted": self.deleted,
+            "segments": self.segments,
+        }
+        tmp = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.write("\n")
+        os.replace(tmp, self.manifest_path)
+
+    async def __run_monitor(self) -> None:
+        while True:
+            await asyncio.sleep(SIZE_CHECK_INTERVAL)
+            age = time.monotonic() - self.__opened_at
+            due = self.segment_seconds > 0 and age >= self.segment_seconds
+            if not due and self.segment_bytes > 0:
+                path = self.output_file.with_name(self.segments[-1]["file"])
+                try:
+                    due = path.stat().st_size >= self.segment_bytes
+                except FileNotFoundError:
+                    pass
+            if due:
+                try:
+                    await self.rotate()
+                except Exception as e:
+                    self.log(f"[!] Segment rollover after {self.segments[-1]['file']} "
+                             f"failed: {e!r}; retrying.")